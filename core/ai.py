@@ -1,214 +1,646 @@
 """
-中国象棋 AI - Minimax 算法 + 估值函数
+中国象棋 AI - Negamax / PVS 搜索 + 估值函数
 """
 
 import random
+import time
+from array import array
 
 try:
-    from .game import ChineseChess
+    from .game import (ChineseChess, PIECE_VALUES, TYPE_MASK, PIECE_TYPES, COLOR_FLAGS,
+                       HORSE, CHARIOT, CANNON, decode_move)
 except ImportError:
-    from game import ChineseChess
+    from game import (ChineseChess, PIECE_VALUES, TYPE_MASK, PIECE_TYPES, COLOR_FLAGS,
+                      HORSE, CHARIOT, CANNON, decode_move)
+
+# 置换表边界类型
+TT_EXACT = 1  # 精确值
+TT_LOWER = 2  # 下界（发生 beta 截断）
+TT_UPPER = 3  # 上界（没有走法超过 alpha）
+
+TT_SIZE_MB = 4  # 每个 AI 实例默认的置换表大小
+
+MAX_SEARCH_DEPTH = 32  # 按时间/节点预算搜索时的深度上限
+CHECK_INTERVAL = 1024  # 每搜索这么多节点检查一次时间预算与停止请求
+
+# 走法排序：置换表走法 > 吃子（MVV-LVA） > 杀手走法 > 历史启发分
+# 吃子按“价值大的被吃子优先、价值小的攻击子优先”排序，按兵种编码索引（帅将不会被吃）
+ORDER_VALUES = (0, 0, 2, 2, 4, 9, 5, 1)
+CAPTURE_ORDER = 1 << 30
+KILLER_ORDER = 1 << 29
+HISTORY_LIMIT = 1 << 28  # 历史分超过此值时整体减半，保持低于杀手走法
+
+DELTA_MARGIN = 30  # 静态搜索增量剪枝的余量：吃到子加上余量仍追不上 alpha 就不必搜
+QUIESCENCE_EVASION_PLIES = 4  # 静态搜索只在前几层搜索应将走法，更深处被将军也只搜吃子
+
+# 剪枝参数
+NULL_MOVE_MIN_DEPTH = 3  # 空着剪枝的最小剩余深度
+LMR_MIN_DEPTH = 3  # 后期走法缩减的最小剩余深度
+LMR_MIN_INDEX = 3  # 排在前几位的走法不缩减
+ASPIRATION_MIN_DEPTH = 4  # 从这一深度起根节点使用渴望窗口
+ASPIRATION_WINDOW = 30  # 渴望窗口半宽（约三个兵）
+
+
+class SearchAborted(Exception):
+    """搜索预算用尽或被要求停止（只在 ChessAI 内部使用）"""
+
+
+class CancelToken:
+    """
+    协作式取消令牌
+    搜索每 CHECK_INTERVAL 个节点检查一次，取消后尽快结束；默认状态存放在自己的一个字节里，
+    跨进程时传入共享内存数组（multiprocessing.RawArray）与下标，由另一个进程取消
+    """
+    
+    __slots__ = ('_flags', '_slot')
+    
+    def __init__(self, flags=None, slot=0):
+        self._flags = flags if flags is not None else bytearray(1)
+        self._slot = slot
+    
+    def cancel(self):
+        self._flags[self._slot] = 1
+    
+    def reset(self):
+        self._flags[self._slot] = 0
+    
+    def is_set(self):
+        """是否已取消（与 threading.Event 同名，两者可以互换）"""
+        return self._flags[self._slot] != 0
+
+
+class TranspositionTable:
+    """
+    置换表：按 Zobrist 键（含走棋方）缓存搜索结果
+    每条记录保存键、深度、边界类型、分值和最佳走法，存放在定长数组中，
+    内存占用由 size_mb 决定，不随搜索或对局增长。
+    每个桶两个槽：槽 0 深度优先（新结果更深或旧记录来自之前的搜索时才替换），
+    槽 1 总是替换，保证最近的结果也能留下
+    """
+    
+    __slots__ = ('size_mb', 'mask', 'keys', 'scores', 'moves', 'depths', 'flags', 'ages',
+                 'age', 'probes', 'hits', 'cutoffs', 'stores')
+    
+    ENTRY_BYTES = 8 + 4 + 2 + 1 + 1 + 1  # 键 + 分值 + 走法 + 深度 + 边界类型 + 搜索代数
+    
+    def __init__(self, size_mb=TT_SIZE_MB):
+        """
+        :param size_mb: 内存上限（MB），桶数取不超过上限的 2 的幂
+        """
+        buckets = 1
+        while buckets * 4 * self.ENTRY_BYTES <= size_mb * 1024 * 1024:
+            buckets *= 2
+        self.size_mb = size_mb
+        self.mask = buckets - 1
+        entries = buckets * 2
+        self.keys = array('Q', bytes(8 * entries))
+        self.scores = array('i', bytes(4 * entries))
+        self.moves = array('H', bytes(2 * entries))
+        self.depths = bytearray(entries)
+        self.flags = bytearray(entries)
+        self.ages = bytearray(entries)
+        self.age = 0
+        self.probes = self.hits = self.cutoffs = self.stores = 0
+    
+    def __len__(self):
+        """槽位数"""
+        return len(self.keys)
+    
+    def new_search(self):
+        """开始新一次搜索：之前的记录变为可被深度优先槽替换"""
+        self.age = (self.age + 1) & 0xFF
+    
+    def clear(self):
+        """清空全部记录与统计"""
+        entries = len(self.keys)
+        self.keys = array('Q', bytes(8 * entries))
+        self.depths = bytearray(entries)
+        self.flags = bytearray(entries)
+        self.ages = bytearray(entries)
+        self.age = 0
+        self.probes = self.hits = self.cutoffs = self.stores = 0
+    
+    def probe(self, key):
+        """
+        查询局面
+        :return: (depth, flag, score, move) 或 None
+        """
+        self.probes += 1
+        index = (key & self.mask) << 1
+        keys = self.keys
+        if keys[index] != key:
+            index += 1
+            if keys[index] != key:
+                return None
+        self.hits += 1
+        return self.depths[index], self.flags[index], self.scores[index], self.moves[index]
+    
+    def store(self, key, depth, flag, score, move):
+        """写入搜索结果，按深度优先 / 总是替换选择槽位"""
+        index = (key & self.mask) << 1
+        if self.ages[index] == self.age and depth < self.depths[index] and self.keys[index] != key:
+            index += 1
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.flags[index] = flag
+        self.scores[index] = score
+        self.moves[index] = move
+        self.ages[index] = self.age
+        self.stores += 1
+    
+    def nbytes(self):
+        """数组占用的内存（字节）"""
+        entries = len(self.keys)
+        return entries * self.ENTRY_BYTES
+    
+    def hashfull(self):
+        """抽样前 1000 个槽，返回本次搜索写入的比例（千分比）"""
+        sample = min(1000, len(self.keys))
+        ages, keys, age = self.ages, self.keys, self.age
+        used = sum(1 for index in range(sample) if keys[index] and ages[index] == age)
+        return used * 1000 // sample
+    
+    def stats(self):
+        """
+        命中统计（累计值，用于按服务器调整置换表大小）
+        :return: dict {size_mb, entries, bytes, probes, hits, hit_rate, cutoffs, stores, hashfull}
+        """
+        return {
+            'size_mb': self.size_mb,
+            'entries': len(self.keys),
+            'bytes': self.nbytes(),
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'cutoffs': self.cutoffs,
+            'stores': self.stores,
+            'hashfull': self.hashfull(),
+        }
 
 
 class ChessAI:
     """象棋 AI"""
     
-    PIECE_VALUES = {
-        'k': 10000,
-        'r': 100,
-        'n': 45,
-        'c': 50,
-        'a': 20,
-        'b': 20,
-        'p': 10
-    }
-    
-    POSITION_BONUS = {
-        'p': {
-            0: 0, 1: 0, 2: 0, 3: 0, 4: 0,
-            5: 10, 6: 20, 7: 30, 8: 30, 9: 30
-        },
-        'n': {
-            0: 0, 1: 5, 2: 10, 3: 10, 4: 10,
-            5: 10, 6: 10, 7: 10, 8: 5, 9: 0
-        }
-    }
+    MATE_SCORE = 20000  # 无合法走法（被将死或困毙）的分值，离根节点越近绝对值越大
+    MATE_BOUND = MATE_SCORE - 1000  # 绝对值不低于此值的分数表示杀棋
+    PERPETUAL_SCORE = 10000  # 长将/长捉犯规判负的分值
     
-    def __init__(self, color, depth=3):
+    PIECE_VALUES = PIECE_VALUES  # 子力价值，位置分见 game.PIECE_SQUARE_TABLES
+    CAPTURE_VALUES = (0,) + tuple(map(PIECE_VALUES.get, PIECE_TYPES))  # 按兵种编码索引
+    
+    def __init__(self, color, depth=3, tt_size_mb=TT_SIZE_MB, time_limit=None, node_limit=None,
+                 move_ordering=True, quiescence=True, pruning=True, workers=1):
         """
         初始化 AI
+        搜索按迭代加深进行：深度 1、2、3……直到 depth 或预算用尽，
+        预算用尽时返回最后一次完整迭代（或本次迭代已搜完部分）的最佳走法
         :param color: AI 执棋颜色 'r' 或 'b'
-        :param depth: 搜索深度
+        :param depth: 最大搜索深度
+        :param tt_size_mb: 置换表大小（MB），同一实例在整局对局中复用；并行搜索时为每个工作进程的大小
+        :param time_limit: 每步的时间预算（秒），None 表示不限
+        :param node_limit: 每步的节点预算，None 表示不限
+        :param move_ordering: 是否启用吃子/杀手/历史启发排序（关闭时只把置换表走法提前，用于对比节点数）
+        :param quiescence: 深度用尽后是否继续静态搜索（关闭时直接估值，用于对比）
+        :param pruning: 是否启用 PVS 零窗口搜索、空着剪枝、后期走法缩减与渴望窗口
+                        （关闭时为普通全窗口 Alpha-Beta，用于对比）
+        :param workers: 大于 1 时把根节点走法分给这么多个工作进程并行搜索（见 parallel.py）
         """
         self.color = color
         self.depth = depth
         self.opponent = 'b' if color == 'r' else 'r'
+        self.tt_size_mb = tt_size_mb
+        # 并行搜索时只用工作进程中的置换表，这里的只占位（两个槽）
+        self.tt = TranspositionTable(tt_size_mb if workers <= 1 else 0)
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.search_info = {}  # 最近一次搜索的 {depth, nodes, seconds, score, move}
+        self.iterations = []  # 最近一次搜索每次完成迭代的 (depth, 走法编码, 分值)
+        self.workers = workers
+        self._deadline = None
+        self._next_check = CHECK_INTERVAL
+        self._completed_depth = 0
+        self._stop_requested = False
+        self._cancel_token = None
+        self.move_ordering = move_ordering
+        self.use_quiescence = quiescence
+        self.pruning = pruning
+        self.killers = [[0, 0] for _ in range(depth + 1)]  # 每层两个引起截断的非吃子走法
+        self.history = {}  # 走法 -> 历史启发分（引起截断时加 depth²）
+        self._null_plies = 0  # 当前处在几层空着之下（空着之下不做循环裁决）
     
     def evaluate(self, game):
         """
         评估棋盘局面
+        子力与位置分由对局在走子/撤销时增量维护（game.eval_score，红方视角），这里只需读取
         :return: 评价值 (对 AI 有利为正)
         """
-        score = 0
-        
-        for row in range(10):
-            for col in range(9):
-                piece = game.board[row][col]
-                if piece:
-                    piece_value = self.PIECE_VALUES.get(piece[1], 0)
-                    
-                    position_bonus = 0
-                    if piece[1] in self.POSITION_BONUS:
-                        position_map = self.POSITION_BONUS[piece[1]]
-                        if piece[0] == self.color:
-                            position_bonus = position_map.get(row, 0)
-                        else:
-                            position_bonus = position_map.get(9 - row, 0)
-                    
-                    if piece[0] == self.color:
-                        score += piece_value + position_bonus
-                    else:
-                        score -= piece_value + position_bonus
+        score = self._side_score(game)
+        return score if game.current_player == self.color else -score
+    
+    def _side_score(self, game):
+        """走棋方视角的估值（negamax 使用）"""
+        side = game.current_player
+        score = game.eval_score if side == ChineseChess.RED else -game.eval_score
         
-        if game.winner == self.color:
+        winner = game.winner
+        if winner == side:
             score += 10000
-        elif game.winner == self.opponent:
+        elif winner and winner != 'draw':
             score -= 10000
         
         return score
     
-    def minimax(self, game, depth, alpha, beta, is_maximizing):
+    def negamax(self, game, depth, alpha, beta, ply, null_allowed=True):
         """
-        Minimax 算法 + Alpha-Beta 剪枝
+        Negamax + 主要变例搜索（PVS），分值均为走棋方视角
+        第一个走法用完整窗口，其余先用零窗口验证，超出窗口再重搜；
+        非 PV 节点尝试空着剪枝，靠后的非吃子走法先缩减一层搜索（LMR）。
+        在同一个 game 对象上 push/pop，返回时局面保持不变
+        :param ply: 距根节点的步数（杀棋分值与杀手走法使用）
+        :param null_allowed: 是否允许空着（空着之后紧接着不再走空着）
+        :raises SearchAborted: 预算用尽或被要求停止，此时 game 停在搜索中途的局面
         """
-        if depth == 0 or game.game_over:
-            return self.evaluate(game)
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            self._check_budget()
         
-        if is_maximizing:
-            max_eval = float('-inf')
-            for move in game.get_all_moves(self.color):
-                fr, fc, tr, tc = move
-                new_game = game.copy()
-                new_game.make_move(fr, fc, tr, tc)
-                eval_score = self.minimax(new_game, depth - 1, alpha, beta, False)
-                max_eval = max(max_eval, eval_score)
-                alpha = max(alpha, eval_score)
-                if beta <= alpha:
-                    break
-            return max_eval
+        # 搜索中第一次回到重复局面就按循环规则裁决：判和或长将/长捉方判负
+        # 空着之下的局面历史不连续，不做裁决
+        if not self._null_plies:
+            verdict = game.repetition_verdict(2)
+            if verdict:
+                return self._verdict_score(verdict[0], game)
+        
+        if game.game_over:
+            return self._side_score(game)
+        if depth <= 0:
+            if self.use_quiescence:
+                return self.quiescence(game, alpha, beta, ply)
+            return self._side_score(game)
+        
+        # 置换表：深度足够时直接使用缓存的分值或边界，否则只取其最佳走法
+        tt = self.tt
+        key = game.zobrist_key
+        hash_move = 0
+        entry = tt.probe(key)
+        if entry:
+            tt_depth, tt_flag, tt_score, hash_move = entry
+            tt_score = self._score_from_tt(tt_score, ply)
+            if tt_depth >= depth and (tt_flag == TT_EXACT or
+                                      (tt_flag == TT_LOWER and tt_score >= beta) or
+                                      (tt_flag == TT_UPPER and tt_score <= alpha)):
+                tt.cutoffs += 1
+                return tt_score
+        
+        color = game.current_player
+        in_check = game.is_check(color)
+        pv_node = beta - alpha > 1
+        
+        # 空着剪枝：让对方连走两步仍然 >= beta，说明这里不必细搜
+        # 只剩士象兵时容易出现“不走更好”（等着），不做空着
+        if (self.pruning and null_allowed and not pv_node and not in_check and
+                depth >= NULL_MOVE_MIN_DEPTH and self._has_major_pieces(game, color) and
+                self._side_score(game) >= beta):
+            reduction = 3 if depth >= 6 else 2
+            game.current_player = self.opponent if color == self.color else self.color
+            self._null_plies += 1
+            score = -self.negamax(game, depth - 1 - reduction, -beta, -beta + 1, ply + 1, False)
+            self._null_plies -= 1
+            game.current_player = color
+            if score >= beta:
+                return beta if score >= self.MATE_BOUND else score
+        
+        moves = game.generate_legal_moves(color)
+        if not moves:
+            # 象棋规则下被将死和困毙都判负，越早越严重
+            return -(self.MATE_SCORE - ply)
+        
+        if self.move_ordering:
+            self._order_moves(game, moves, ply)
+        if hash_move and hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+        
+        alpha_orig = alpha
+        best_score, best_move = float('-inf'), moves[0]
+        squares = game.squares
+        killers = self.killers[ply] if ply < len(self.killers) else (0, 0)
+        for index, move in enumerate(moves):
+            quiet = not squares[move & 0xFF]
+            game.push(move)
+            if index == 0 or not self.pruning:
+                score = -self.negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                # 靠后的非吃子、非杀手、不将军的走法先缩减深度
+                reduction = 0
+                if (index >= LMR_MIN_INDEX and depth >= LMR_MIN_DEPTH and quiet and not in_check and
+                        move not in killers and not game.is_check(game.current_player)):
+                    reduction = 2 if index >= 10 and depth >= 6 else 1
+                score = -self.negamax(game, depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+                if reduction and score > alpha:
+                    score = -self.negamax(game, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            game.pop()
+            
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if quiet:
+                            self._record_cutoff(move, depth, ply)
+                        break
+        
+        if best_score <= alpha_orig:
+            flag = TT_UPPER
+        elif best_score >= beta:
+            flag = TT_LOWER
         else:
-            min_eval = float('inf')
-            for move in game.get_all_moves(self.opponent):
-                fr, fc, tr, tc = move
-                new_game = game.copy()
-                new_game.make_move(fr, fc, tr, tc)
-                eval_score = self.minimax(new_game, depth - 1, alpha, beta, True)
-                min_eval = min(min_eval, eval_score)
-                beta = min(beta, eval_score)
-                if beta <= alpha:
-                    break
-            return min_eval
+            flag = TT_EXACT
+        tt.store(key, depth, flag, self._score_to_tt(best_score, ply), best_move)
+        return best_score
+    
+    def quiescence(self, game, alpha, beta, ply, qply=0):
+        """
+        静态搜索：深度用尽后只搜吃子，直到局面平稳，避免在兑子途中估值（水平线效应）
+        未被将军时可以不吃子（stand pat），静态估值已超出窗口就直接返回；
+        吃到子加上 DELTA_MARGIN 仍追不上 alpha 的吃子不搜（增量剪枝）。
+        被将军时搜索全部应将走法，无路可走即被将死
+        应将走法可能反将，双方交替将军时不吃子也能一直搜下去，所以只在静态搜索的前
+        QUIESCENCE_EVASION_PLIES 层搜应将，更深处按未被将军处理；此后每步都是吃子，搜索必然结束
+        :param qply: 进入静态搜索后的层数
+        """
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            self._check_budget()
+        
+        if game.game_over:
+            return self._side_score(game)
+        
+        color = game.current_player
+        in_check = qply < QUIESCENCE_EVASION_PLIES and game.is_check(color)
+        if in_check:
+            moves = game.generate_legal_moves(color)
+            if not moves:
+                return -(self.MATE_SCORE - ply)
+            best_score = float('-inf')
+        else:
+            best_score = stand_pat = self._side_score(game)
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            moves = game.generate_legal_moves(color, captures_only=True)
+        
+        self._order_moves(game, moves, None)
+        squares = game.squares
+        values = self.CAPTURE_VALUES
+        for move in moves:
+            if not in_check and stand_pat + values[squares[move & 0xFF] & TYPE_MASK] + DELTA_MARGIN <= alpha:
+                continue
+            game.push(move)
+            score = -self.quiescence(game, -beta, -alpha, ply + 1, qply + 1)
+            game.pop()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score
+    
+    @staticmethod
+    def _has_major_pieces(game, color):
+        """是否还有车马炮（空着剪枝的等着保护）"""
+        flag = COLOR_FLAGS[color]
+        material = game.material
+        return material[flag | CHARIOT] or material[flag | HORSE] or material[flag | CANNON]
+    
+    def _score_to_tt(self, score, ply):
+        """杀棋分值按“距当前节点”存入置换表，与所在层数无关"""
+        if score >= self.MATE_BOUND:
+            return score + ply
+        if score <= -self.MATE_BOUND:
+            return score - ply
+        return score
+    
+    def _score_from_tt(self, score, ply):
+        """_score_to_tt 的逆操作"""
+        if score >= self.MATE_BOUND:
+            return score - ply
+        if score <= -self.MATE_BOUND:
+            return score + ply
+        return score
+    
+    def _order_moves(self, game, moves, ply):
+        """
+        就地排序：吃子按 MVV-LVA，其次杀手走法，其余按历史启发分
+        :param ply: 距根节点的步数，None 表示不使用杀手走法（静态搜索）
+        """
+        squares = game.squares
+        killers = self.killers[ply] if ply is not None and ply < len(self.killers) else (0, 0)
+        history = self.history
+        
+        def order(move):
+            victim = squares[move & 0xFF]
+            if victim:
+                return (CAPTURE_ORDER + ORDER_VALUES[victim & TYPE_MASK] * 16
+                        - ORDER_VALUES[squares[move >> 8] & TYPE_MASK])
+            if move == killers[0]:
+                return KILLER_ORDER + 1
+            if move == killers[1]:
+                return KILLER_ORDER
+            return history.get(move, 0)
+        
+        moves.sort(key=order, reverse=True)
+    
+    def _record_cutoff(self, move, depth, ply):
+        """非吃子走法引起截断：记为本层杀手走法并累加历史分"""
+        if ply < len(self.killers):
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        score = self.history.get(move, 0) + depth * depth
+        self.history[move] = score
+        if score > HISTORY_LIMIT:
+            self.history = {key: value >> 1 for key, value in self.history.items()}
     
-    def get_best_move(self, game, force_break=False):
+    def _verdict_score(self, winner, game):
+        """循环裁决结果 -> 走棋方视角的分值"""
+        if winner == game.current_player:
+            return self.PERPETUAL_SCORE
+        if winner == 'draw':
+            return 0
+        return -self.PERPETUAL_SCORE
+    
+    def stop(self):
+        """要求正在进行的搜索尽快结束（可从其他线程调用）"""
+        self._stop_requested = True
+    
+    def _check_budget(self):
+        """
+        定期检查停止请求与时间/节点预算
+        深度 1 的迭代总会完成，保证始终有可用的走法
         """
-        获取最佳走法
+        self._next_check = self.nodes + CHECK_INTERVAL
+        if self.node_limit:
+            self._next_check = min(self._next_check, self.node_limit)
+        if self._stop_requested or (self._cancel_token is not None and self._cancel_token.is_set()):
+            raise SearchAborted()
+        if not self._completed_depth:
+            return
+        if self.node_limit and self.nodes >= self.node_limit:
+            raise SearchAborted()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchAborted()
+    
+    def get_best_move(self, game, root_moves=None, cancel_token=None):
+        """
+        获取最佳走法（迭代加深）
+        每次迭代按上一次迭代的分值给根节点走法排序，内部节点则由置换表提供最佳走法；
+        从 ASPIRATION_MIN_DEPTH 起先用上次分值附近的窄窗口搜索，落在窗口外再放宽重搜
+        循环局面由搜索中的 repetition_verdict 处理，不再单独做防重复筛选
         :param game: 当前游戏状态
-        :param force_break: 是否强制打破循环
+        :param root_moves: 只在这些走法编码中选择（并行搜索的工作进程使用）
+        :param cancel_token: CancelToken（或任何带 is_set() 的对象），取消后尽快结束，
+                             返回已完成迭代的最佳走法
         :return: (from_row, from_col, to_row, to_col) 或 None
         """
-        moves = game.get_all_moves(self.color)
+        self.iterations = []
+        if self.workers > 1 and root_moves is None:
+            return self._parallel_best_move(game, cancel_token)
+        
+        moves = game.generate_legal_moves(self.color)
+        if root_moves is not None:
+            moves = [move for move in moves if move in root_moves]
         
         if not moves:
             return None
         
-        if len(moves) == 1:
-            return moves[0]
+        if len(moves) == 1 and root_moves is None:
+            # 不搜索，但统计也要更新，否则回报的是上一步的深度和节点数
+            self.nodes = 0
+            self.search_info = {'depth': 0, 'nodes': 0, 'seconds': 0.0, 'score': None,
+                                'move': decode_move(moves[0])}
+            return decode_move(moves[0])
         
-        # 检测是否处于循环局面
-        current_fen = game.get_board_fen()
-        in_repetition = game.is_repetition(current_fen)
-        
-        # 如果在循环中或强制变招，增加随机性并避免导致重复的走法
-        if in_repetition or force_break:
-            return self._get_anti_repetition_move(game, moves, force_break)
+        # 打乱后稳定排序：同分走法之间保留随机性，避免每局走得一样
+        random.shuffle(moves)
+        self.killers = [[0, 0] for _ in range(self.depth + 1)]
+        self.history = {key: value >> 2 for key, value in self.history.items() if value >> 2}
+        if self.move_ordering:
+            self._order_moves(game, moves, 0)
         
-        best_move = None
-        best_eval = float('-inf')
-        alpha = float('-inf')
-        beta = float('inf')
+        # 上一步搜索留下的最佳走法先搜，更早收紧 alpha
+        self.tt.new_search()
+        key = game.zobrist_key
+        entry = self.tt.probe(key)
+        if entry and entry[3] in moves:
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
         
-        random.shuffle(moves)
+        start = time.perf_counter()
+        self.nodes = 0
+        self._next_check = min(CHECK_INTERVAL, self.node_limit or CHECK_INTERVAL)
+        self._deadline = start + self.time_limit if self.time_limit else None
+        self._completed_depth = 0
+        self._stop_requested = False
+        self._cancel_token = cancel_token
+        self._null_plies = 0
         
-        for move in moves:
-            fr, fc, tr, tc = move
-            new_game = game.copy()
-            new_game.make_move(fr, fc, tr, tc)
-            eval_score = self.minimax(new_game, self.depth - 1, alpha, beta, False)
+        # 只在根节点复制一次，搜索过程中不改动调用方的对局
+        search_game = game.copy()
+        best_move, best_eval = moves[0], None
+        for depth in range(1, self.depth + 1):
+            alpha, beta = float('-inf'), float('inf')
+            if (self.pruning and depth >= ASPIRATION_MIN_DEPTH and
+                    abs(best_eval) < self.MATE_BOUND):
+                alpha, beta = best_eval - ASPIRATION_WINDOW, best_eval + ASPIRATION_WINDOW
+            try:
+                while True:
+                    scores = {}
+                    score = self._search_root(search_game, moves, depth, scores, alpha, beta)
+                    if score <= alpha:
+                        alpha = float('-inf')
+                    elif score >= beta:
+                        beta = float('inf')
+                    else:
+                        break
+            except SearchAborted:
+                # 本次迭代已搜完的走法中，只有超过了上次最佳走法（排在第一位）的才可信
+                if moves[0] in scores:
+                    move = max(scores, key=scores.get)
+                    if scores[move] > max(scores[moves[0]], alpha):
+                        best_move, best_eval = move, scores[move]
+                break
+            
+            # 下一次迭代按本次分值排序（稳定排序，同分保持原顺序）
+            moves.sort(key=lambda move: scores.get(move, float('-inf')), reverse=True)
+            best_move, best_eval = moves[0], scores[moves[0]]
+            self._completed_depth = depth
+            self.iterations.append((depth, best_move, best_eval))
+            # 只搜了部分根走法时，最高分只是整个局面分值的下界
+            self.tt.store(key, depth, TT_EXACT if root_moves is None else TT_LOWER, best_eval, best_move)
             
-            if eval_score > best_eval:
-                best_eval = eval_score
-                best_move = move
-                alpha = max(alpha, eval_score)
+            # 已找到杀棋，或剩余时间不够再完成一次更深的迭代
+            if abs(best_eval) >= self.MATE_BOUND:
+                break
+            if self._deadline is not None and time.perf_counter() - start >= (self._deadline - start) / 2:
+                break
+            if self.node_limit and self.nodes >= self.node_limit:
+                break
         
-        return best_move if best_move else random.choice(moves)
+        self.search_info = {
+            'depth': self._completed_depth,
+            'nodes': self.nodes,
+            'seconds': time.perf_counter() - start,
+            'score': best_eval,
+            'move': decode_move(best_move),
+        }
+        return decode_move(best_move)
+    
+    def _parallel_best_move(self, game, cancel_token):
+        """交给共用的进程池按根节点拆分搜索（置换表在各工作进程中）"""
+        try:
+            from .parallel import shared_search
+        except ImportError:
+            from parallel import shared_search
+        
+        def should_stop():
+            return self._stop_requested or (cancel_token is not None and cancel_token.is_set())
+        
+        self._stop_requested = False
+        move, info = shared_search(self.workers).best_move(
+            game, self.color, depth=self.depth, time_limit=self.time_limit, node_limit=self.node_limit,
+            should_stop=should_stop, tt_size_mb=self.tt_size_mb, move_ordering=self.move_ordering,
+            quiescence=self.use_quiescence, pruning=self.pruning)
+        if info:
+            self.search_info = info
+            self.nodes = info['nodes']
+        return move
     
-    def _get_anti_repetition_move(self, game, moves, force_break=False):
+    def _search_root(self, game, moves, depth, scores, alpha, beta):
         """
-        获取打破循环的走法
-        :param game: 当前游戏状态
-        :param moves: 所有合法走法
-        :param force_break: 是否强制打破循环
-        :return: 最佳走法
+        搜索一次根节点迭代（窗口为 alpha..beta），scores 记录已搜完走法的分值
+        未提高 alpha 的走法分值只是上界，但仍可用于下一次迭代排序
+        :return: 最高分；不高于 alpha 或不低于 beta 时需放宽窗口重搜
         """
-        # 过滤掉会导致重复局面的走法
-        non_repeating_moves = []
-        for move in moves:
-            fr, fc, tr, tc = move
-            new_game = game.copy()
-            new_game.make_move(fr, fc, tr, tc)
-            new_fen = new_game.get_board_fen()
-            if not game.is_repetition(new_fen):
-                non_repeating_moves.append(move)
-        
-        # 如果有不重复的走法，从中选择最佳的
-        if non_repeating_moves:
-            best_move = None
-            best_eval = float('-inf')
-            alpha = float('-inf')
-            beta = float('inf')
-            
-            for move in non_repeating_moves:
-                fr, fc, tr, tc = move
-                new_game = game.copy()
-                new_game.make_move(fr, fc, tr, tc)
-                eval_score = self.minimax(new_game, self.depth - 1, alpha, beta, False)
-                
-                if eval_score > best_eval:
-                    best_eval = eval_score
-                    best_move = move
-                    alpha = max(alpha, eval_score)
-            
-            return best_move if best_move else random.choice(non_repeating_moves)
-        else:
-            # 如果所有走法都会重复，force_break 时选择评估值变化最大的走法
-            # 否则增加随机性选择
-            if force_break and len(moves) > 1:
-                # 选择能带来最大变化的走法（通过评估走棋后的局面差异）
-                best_change_move = None
-                max_change = float('-inf')
-                
-                for move in moves:
-                    fr, fc, tr, tc = move
-                    new_game = game.copy()
-                    new_game.make_move(fr, fc, tr, tc)
-                    # 使用评估值的绝对变化作为变化度量
-                    change = abs(self.evaluate(new_game) - self.evaluate(game))
-                    if change > max_change:
-                        max_change = change
-                        best_change_move = move
-                
-                if best_change_move:
-                    return best_change_move
-            
-            random.shuffle(moves)
-            return moves[0]
+        best_score = float('-inf')
+        for index, move in enumerate(moves):
+            game.push(move)
+            if index == 0 or not self.pruning:
+                score = -self.negamax(game, depth - 1, -beta, -alpha, 1)
+            else:
+                score = -self.negamax(game, depth - 1, -alpha - 1, -alpha, 1)
+                if alpha < score < beta:
+                    score = -self.negamax(game, depth - 1, -beta, -alpha, 1)
+            game.pop()
+            scores[move] = score
+            best_score = max(best_score, score)
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return best_score
@@ -0,0 +1,187 @@
+"""
+批量走法验证（NumPy 向量化）
+
+一次验证大量（局面, 走法）对，结果与逐一调用 ChineseChess.is_valid_move 完全一致，
+供训练数据生成、棋谱导入和批量分析使用:
+
+    boards = boards_from_fens(fens)                 # N×90 int8
+    mask = validate_moves(boards, moves)            # 每个局面一步走法
+    mask = validate_moves(boards, moves, index)     # 多步走法对应到各自局面
+
+局面按行优先排成 90 格，取值为 game.py 中的棋子编码（0 为空格）；
+走法为 M×4 的 (from_row, from_col, to_row, to_col)。
+马腿、象眼、车炮之间的棋子都通过预计算的 90×90 查表完成，不逐步调用 Python。
+NumPy 是可选依赖，只有调用本模块的函数时才需要安装。
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from .game import (
+        BOARD_SQUARES, PIECE_CODES, RED_FLAG, BLACK_FLAG, TYPE_MASK, COLOR_MASK,
+        KING, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, PAWN,
+        IN_PALACE, LINE_BETWEEN, HORSE_MOVES, KING_MOVES, ADVISOR_MOVES, ELEPHANT_MOVES, PAWN_MOVES,
+        parse_fen,
+    )
+except ImportError:
+    from game import (
+        BOARD_SQUARES, PIECE_CODES, RED_FLAG, BLACK_FLAG, TYPE_MASK, COLOR_MASK,
+        KING, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, PAWN,
+        IN_PALACE, LINE_BETWEEN, HORSE_MOVES, KING_MOVES, ADVISOR_MOVES, ELEPHANT_MOVES, PAWN_MOVES,
+        parse_fen,
+    )
+
+BOARD_CELLS = 90
+PAD = BOARD_CELLS  # 补在每个局面末尾、恒为空的一格，查表的“无”都指向它
+MAX_BETWEEN = 8  # 同一直线上两格之间最多 8 格
+
+_tables = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('批量走法验证需要 NumPy：pip install numpy')
+
+
+def _build_tables():
+    """
+    预计算 90 格坐标下的查表（首次调用时生成）
+    geom[兵种, 颜色, 起点, 终点]：不考虑阻挡时走法是否成立
+    block[起点, 终点]：马腿/象眼所在格
+    between[起点, 终点]：同一直线上两格之间的格子（不足 8 格用 PAD 补齐）
+    """
+    index_of = {sq: index for index, sq in enumerate(BOARD_SQUARES)}
+    geom = np.zeros((TYPE_MASK + 1, 2, BOARD_CELLS, BOARD_CELLS), dtype=bool)
+    block = np.full((BOARD_CELLS, BOARD_CELLS), PAD, dtype=np.intp)
+    between = np.full((BOARD_CELLS, BOARD_CELLS, MAX_BETWEEN), PAD, dtype=np.intp)
+    line = np.zeros((BOARD_CELLS, BOARD_CELLS), dtype=bool)
+    palace = np.zeros((2, BOARD_CELLS), dtype=bool)
+
+    for from_sq, f in index_of.items():
+        for to_sq, leg in HORSE_MOVES[from_sq]:
+            geom[HORSE, :, f, index_of[to_sq]] = True
+            block[f, index_of[to_sq]] = index_of[leg]
+        for to_sq, squares in LINE_BETWEEN[from_sq].items():
+            t = index_of[to_sq]
+            line[f, t] = True
+            between[f, t, :len(squares)] = [index_of[sq] for sq in squares]
+
+        for color, flag in enumerate((RED_FLAG, BLACK_FLAG)):
+            palace[color, f] = IN_PALACE[flag][from_sq]
+            for piece_type, table in ((KING, KING_MOVES), (ADVISOR, ADVISOR_MOVES), (PAWN, PAWN_MOVES)):
+                for to_sq in table[flag][from_sq]:
+                    geom[piece_type, color, f, index_of[to_sq]] = True
+            for to_sq, eye in ELEPHANT_MOVES[flag][from_sq]:
+                geom[ELEPHANT, color, f, index_of[to_sq]] = True
+                block[f, index_of[to_sq]] = index_of[eye]
+
+    geom[CHARIOT] = line
+    geom[CANNON] = line
+    valid_codes = np.zeros(256, dtype=bool)
+    valid_codes[0] = True
+    valid_codes[list(PIECE_CODES.values())] = True
+    return {
+        'geom': geom, 'block': block, 'between': between, 'line': line,
+        'palace': palace, 'valid_codes': valid_codes,
+    }
+
+
+def _get_tables():
+    global _tables
+    _require_numpy()
+    if _tables is None:
+        _tables = _build_tables()
+    return _tables
+
+
+def boards_from_games(games):
+    """
+    把若干 ChineseChess 对局转换为 N×90 int8 数组
+    :param games: 可迭代的 ChineseChess
+    """
+    _require_numpy()
+    cells = np.array(BOARD_SQUARES, dtype=np.intp)
+    games = list(games)
+    boards = np.empty((len(games), BOARD_CELLS), dtype=np.int8)
+    for row, game in enumerate(games):
+        boards[row] = np.frombuffer(game.squares, dtype=np.uint8)[cells]
+    return boards
+
+
+def boards_from_fens(fens):
+    """
+    把若干 FEN 转换为 N×90 int8 数组（走棋方等字段被忽略）
+    :raises ValueError: 任一 FEN 不合法
+    """
+    _require_numpy()
+    cells = np.array(BOARD_SQUARES, dtype=np.intp)
+    fens = list(fens)
+    boards = np.empty((len(fens), BOARD_CELLS), dtype=np.int8)
+    for row, fen in enumerate(fens):
+        boards[row] = np.frombuffer(parse_fen(fen)[0], dtype=np.uint8)[cells]
+    return boards
+
+
+def validate_moves(boards, moves, board_index=None):
+    """
+    批量判断走法是否合法（与 ChineseChess.is_valid_move 一致，不检查送将）
+    :param boards: N×90 数组，棋子编码
+    :param moves: M×4 数组 (from_row, from_col, to_row, to_col)
+    :param board_index: 长度 M，每步走法所属的局面下标；省略时要求 M == N，一一对应
+    :return: 长度 M 的 bool 数组
+    :raises ValueError: 数组形状不对或含有非法棋子编码
+    """
+    tables = _get_tables()
+    boards = np.asarray(boards)
+    if boards.ndim != 2 or boards.shape[1] != BOARD_CELLS:
+        raise ValueError(f'boards 应为 N×{BOARD_CELLS} 数组，实际 {boards.shape}')
+    moves = np.asarray(moves, dtype=np.intp)
+    if moves.ndim != 2 or moves.shape[1] != 4:
+        raise ValueError(f'moves 应为 M×4 数组，实际 {moves.shape}')
+    if board_index is None:
+        if len(moves) != len(boards):
+            raise ValueError('省略 board_index 时走法数必须等于局面数')
+        board_index = np.arange(len(moves))
+    else:
+        board_index = np.asarray(board_index, dtype=np.intp)
+        if board_index.shape != (len(moves),):
+            raise ValueError('board_index 长度必须等于走法数')
+        if len(board_index) and (board_index.min() < 0 or board_index.max() >= len(boards)):
+            raise ValueError('board_index 超出局面范围')
+
+    codes = boards.astype(np.intp)
+    if codes.size and (codes.min() < 0 or codes.max() > 255 or not tables['valid_codes'][codes].all()):
+        raise ValueError('boards 含有非法棋子编码')
+    padded = np.zeros((len(boards), BOARD_CELLS + 1), dtype=np.uint8)
+    padded[:, :BOARD_CELLS] = codes
+
+    from_row, from_col, to_row, to_col = moves.T
+    in_range = ((from_row >= 0) & (from_row < 10) & (from_col >= 0) & (from_col < 9) &
+                (to_row >= 0) & (to_row < 10) & (to_col >= 0) & (to_col < 9))
+    f = np.where(in_range, from_row * 9 + from_col, 0)
+    t = np.where(in_range, to_row * 9 + to_col, 0)
+
+    b = board_index
+    piece = padded[b, f]
+    target = padded[b, t]
+    piece_type = piece & TYPE_MASK
+    color = (piece & COLOR_MASK) == BLACK_FLAG
+    legal = in_range & (piece != 0) & ((target & piece & COLOR_MASK) == 0)
+
+    # 走法几何 + 马腿/象眼（其余兵种的 block 指向恒空的 PAD）
+    geom_ok = tables['geom'][piece_type, color.astype(np.intp), f, t]
+    geom_ok &= padded[b, tables['block'][f, t]] == 0
+
+    # 车炮：两格之间的棋子数
+    count = (padded[b[:, None], tables['between'][f, t]] != 0).sum(axis=1)
+    count_ok = np.where(piece_type == CANNON, np.where(target == 0, count == 0, count == 1),
+                        (piece_type != CHARIOT) | (count == 0))
+
+    # 飞将：同列无遮挡、目标是将帅且仍在己方九宫内
+    flying = ((piece_type == KING) & (from_col == to_col) & tables['line'][f, t] &
+              ((target & TYPE_MASK) == KING) & tables['palace'][color.astype(np.intp), t] & (count == 0))
+
+    return legal & ((geom_ok & count_ok) | flying)
@@ -0,0 +1,142 @@
+"""
+AI 搜索基准测试
+
+在固定局面上以固定深度搜索，比较不同搜索配置的节点数与耗时，
+可以作为库调用，也可以直接在命令行运行:
+
+    python core/bench.py              # 全部基准局面，深度 4
+    python core/bench.py -d 5         # 深度 5
+    python core/bench.py -n 50000     # 每步 5 万节点预算，比较各配置能搜到的深度
+    python core/bench.py -p 4         # 并行搜索 1~4 个工作进程的加速比
+"""
+
+import argparse
+import random
+import sys
+import time
+
+try:
+    from .ai import ChessAI, MAX_SEARCH_DEPTH
+    from .parallel import ParallelSearch
+    from .perft import load_position
+except ImportError:
+    from ai import ChessAI, MAX_SEARCH_DEPTH
+    from parallel import ParallelSearch
+    from perft import load_position
+
+
+# 基准局面：开局、中局、残局各有代表，FEN 含走棋方
+BENCH_POSITIONS = [
+    {'name': '初始局面', 'fen': 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w'},
+    {'name': '中局（黑方走）', 'fen': 'r1bakab1r/9/1cn4cn/p1p1p1p1p/9/2P6/P3P1P1P/1C2C1N2/9/RNBAKAB1R b'},
+    {'name': '中局对攻', 'fen': '2bakab2/9/2n1c1n2/p1p1p1p1p/9/2P6/P3P1P1P/2N1C1N2/4A4/2BAK1B2 w'},
+    {'name': '吃子交换', 'fen': 'r1bakabr1/9/1cn3n1c/p1p1p3p/6p2/2P6/P3P1P1P/1CN1C1N2/9/R1BAKAB1R w'},
+    {'name': '炮架与牵制', 'fen': '3ak4/4a4/4c4/9/4R4/9/4C4/9/4A4/3AK4 w'},
+    {'name': '车马残局', 'fen': '3k5/4a4/4b4/9/2n6/9/9/4B4/4A4/3AKR3 w'},
+]
+
+# 对比的搜索配置：名称 -> ChessAI 参数
+BENCH_CONFIGS = {
+    '无排序': {'move_ordering': False, 'quiescence': False, 'pruning': False},
+    '走法排序': {'quiescence': False, 'pruning': False},
+    '静态搜索': {'pruning': False},
+    'PVS 剪枝': {},
+}
+
+
+def run_search(fen, depth, seed=0, **options):
+    """
+    用全新的 AI（空置换表）搜索一个局面
+    :param options: 传给 ChessAI 的其他参数
+    :return: dict {nodes, seconds, depth, score, move}
+    """
+    random.seed(seed)
+    game = load_position(fen)
+    ai = ChessAI(game.current_player, depth=depth, **options)
+    ai.get_best_move(game)
+    return dict(ai.search_info)
+
+
+def compare(depth=4, configs=BENCH_CONFIGS, positions=BENCH_POSITIONS, node_limit=None):
+    """
+    在每个基准局面上运行每种配置
+    :param node_limit: 指定时改为在节点预算内迭代加深（深度上限 MAX_SEARCH_DEPTH），比较完成的深度
+    :return: list of {name, results: {config: search_info}}
+    """
+    if node_limit:
+        depth = MAX_SEARCH_DEPTH
+    report = []
+    for position in positions:
+        results = {name: run_search(position['fen'], depth, node_limit=node_limit, **options)
+                   for name, options in configs.items()}
+        report.append({'name': position['name'], 'results': results})
+    return report
+
+
+def speedup(depth=4, max_workers=4, positions=BENCH_POSITIONS):
+    """
+    并行搜索的加速比：在全部基准局面上以固定深度搜索，比较串行与 1~max_workers 个工作进程的总耗时
+    每种进程数使用新的进程池，计时前先搜一次预热（进程启动与模块导入不计入）
+    :return: list of {workers, seconds, nodes, speedup}，workers 为 0 的一项是串行基准
+    """
+    serial = [run_search(position['fen'], depth) for position in positions]
+    base = sum(result['seconds'] for result in serial)
+    report = [{'workers': 0, 'seconds': base, 'nodes': sum(result['nodes'] for result in serial), 'speedup': 1.0}]
+    for workers in range(1, max_workers + 1):
+        search = ParallelSearch(workers)
+        try:
+            search.best_move(load_position(positions[0]['fen']), 'r', depth=1)
+            seconds = nodes = 0
+            for position in positions:
+                random.seed(0)
+                game = load_position(position['fen'])
+                start = time.perf_counter()
+                info = search.best_move(game, game.current_player, depth=depth)[1]
+                seconds += time.perf_counter() - start
+                nodes += info['nodes']
+        finally:
+            search.close()
+        report.append({'workers': workers, 'seconds': seconds, 'nodes': nodes,
+                       'speedup': base / seconds if seconds else 0})
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='中国象棋 AI 搜索基准测试')
+    parser.add_argument('-d', '--depth', type=int, default=4, help='搜索深度（默认 4）')
+    parser.add_argument('-n', '--nodes', type=int, help='改为每步节点预算，比较完成的深度')
+    parser.add_argument('-p', '--parallel', type=int, metavar='N', help='改为测量 1~N 个工作进程的并行加速比')
+    args = parser.parse_args(argv)
+
+    if args.parallel:
+        print(f"深度 {args.depth} 并行加速比:")
+        for item in speedup(args.depth, args.parallel):
+            name = f"{item['workers']} 进程" if item['workers'] else '串行'
+            print(f"{name}: {item['nodes']} 节点 {item['seconds']:.2f}s 加速 {item['speedup']:.2f}x")
+        return 0
+
+    names = list(BENCH_CONFIGS)
+    totals = {name: {'nodes': 0, 'seconds': 0.0, 'depth': 0} for name in names}
+    title = f"节点预算 {args.nodes}" if args.nodes else f"深度 {args.depth}"
+    print(f"{title}: " + ' | '.join(names))
+    for item in compare(args.depth, node_limit=args.nodes):
+        cells = []
+        for name in names:
+            result = item['results'][name]
+            totals[name]['nodes'] += result['nodes']
+            totals[name]['seconds'] += result['seconds']
+            totals[name]['depth'] += result['depth']
+            cells.append(f"{result['nodes']} 节点 深度 {result['depth']} {result['seconds']:.2f}s {result['move']}")
+        print(f"{item['name']}: " + ' | '.join(cells))
+
+    base = totals[names[0]]['nodes']
+    for name in names:
+        total = totals[name]
+        ratio = total['nodes'] / base if base else 0
+        depth = total['depth'] / len(BENCH_POSITIONS)
+        print(f"合计 {name}: {total['nodes']} 节点（{ratio:.0%}），平均深度 {depth:.1f}，{total['seconds']:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,6 +6,11 @@ import sqlite3
 import json
 from datetime import datetime
 
+try:
+    from .game import MoveHistory
+except ImportError:
+    from game import MoveHistory
+
 
 class Database:
     """数据库管理类"""
@@ -96,11 +101,9 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        board_state = json.dumps(game.board)
-        move_history = json.dumps([
-            {'from': m['from'], 'to': m['to'], 'piece': m['piece'], 'captured': m['captured']}
-            for m in game.move_history
-        ])
+        board_state = json.dumps(game.board.tolist())
+        # 走棋历史以打包整数保存，读取时再解码为 dict
+        move_history = json.dumps(game.move_history.pack())
         
         cursor.execute('''
             UPDATE games 
@@ -133,11 +136,21 @@ class Database:
             'board_state': json.loads(row['board_state']) if row['board_state'] else None,
             'current_player': row['current_player'],
             'winner': row['winner'],
-            'move_history': json.loads(row['move_history']) if row['move_history'] else [],
+            'move_history': self._decode_move_history(row['move_history']),
             'created_at': row['created_at'],
             'is_active': row['is_active']
         }
     
+    @staticmethod
+    def _decode_move_history(text):
+        """解析走棋历史：兼容旧的 dict 列表与新的打包整数列表"""
+        if not text:
+            return []
+        moves = json.loads(text)
+        if moves and isinstance(moves[0], int):
+            return [move.to_dict() for move in MoveHistory.unpack(moves)]
+        return moves
+    
     def record_move(self, game_id, move_number, move_data):
         """记录走棋"""
         conn = self.get_connection()
@@ -0,0 +1,465 @@
+"""
+AI 引擎进程池
+
+搜索是 CPU 密集型任务，在 Web 进程里为每步棋开一个线程会与请求线程争抢 GIL。
+这里用固定数量的常驻工作进程执行搜索，Web 进程只负责排队和落子:
+
+    pool = EnginePool(processes=4, on_result=apply_move, time_limit=1.0)
+    pool.submit(game_id, 'b', game)    # 轮到 AI 时提交（调用方持有该对局的锁）
+    pool.cancel(game_id)               # 暂停/悔棋：丢弃排队中的任务，中止进行中的搜索
+    pool.forget(game_id)               # 删除对局：同上，并释放工作进程中的 AI
+    pool.close()
+
+- 同一对局同时最多只有一个任务在执行（含结果落子），后提交的按顺序排队
+- 并发上限即工作进程数；同一对局优先交给上次服务它的进程，以复用置换表
+- 两个优先级：有人在等的对局（PRIORITY_INTERACTIVE）先于纯 AI 对局（PRIORITY_BACKGROUND），
+  后台任务等待时前台最多连续调度 INTERACTIVE_BURST 次，避免后台饿死；
+  同一优先级内按对局轮转，每局每次只调度一个任务
+- 排队任务数有上限，超出时 submit 抛出 EnginePoolBusy（后台任务只能占用一半名额，至少一个）；
+  stats() 给出各优先级的排队等待时间
+- 每个任务带一个 CancelToken；取消时同时置位该工作进程在共享内存中的取消标志，
+  搜索在下一次预算检查时中止，结果也不再回调
+- 搜索出错、没有给出走法或工作进程意外退出时调用 on_error；收集线程无法再读取结果时
+  池转为关闭状态，之后的 submit 抛出 EnginePoolClosed
+- 工作进程按 (对局, 颜色) 缓存 ChessAI，超过 ENGINE_CACHE_SIZE 时淘汰最久未用的
+- 提交时即以 parallel.encode_position 把局面编码为快照，之后只把快照传给工作进程，
+  不再读取对局本身；局面改变（走子、悔棋、改局面）时调用方应先 cancel
+进程以 spawn 方式启动，会重新导入主模块，因此进程池应在首次使用时再创建，不要在模块顶层创建。
+"""
+
+import atexit
+import heapq
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+
+try:
+    from .ai import ChessAI, CancelToken
+    from .parallel import encode_position, decode_position
+except ImportError:
+    from ai import ChessAI, CancelToken
+    from parallel import encode_position, decode_position
+
+
+ENGINE_CACHE_SIZE = 16  # 每个工作进程缓存的 ChessAI 数（每个带一张置换表）
+QUEUE_LIMIT = 64  # 默认的排队任务数上限
+PRIORITY_INTERACTIVE = 0  # 人机对局：有人在等 AI 回应
+PRIORITY_BACKGROUND = 1  # AI 对 AI 等无人等待的对局
+PRIORITY_NAMES = ('interactive', 'background')
+INTERACTIVE_BURST = 4  # 有后台任务在等时，前台任务最多连续调度的次数
+WAIT_SAMPLES = 1000  # 每个优先级保留最近多少次排队等待时间，用于计算分位数
+HEALTH_CHECK_INTERVAL = 1.0  # 收集线程检查工作进程是否存活的间隔（秒）
+SHUTDOWN_TIMEOUT = 5.0  # 关闭时等待工作进程退出的时间（秒）
+
+
+def _engine_main(inbox, outbox, index, cancel_flags, ai_options, cache_size):
+    """
+    工作进程主循环，cancel_flags[index] 是本进程当前任务的取消标志（由主进程置位/复位）
+    消息：('search', job_id, game_id, color, fen, moves) / ('forget', game_id) / None（退出）
+    回报：(index, job_id, move, search_info, tt_stats, error)
+    """
+    engines = OrderedDict()  # (game_id, color) -> ChessAI，按最近使用排序
+    token = CancelToken(cancel_flags, index)
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        if message[0] == 'forget':
+            for key in [key for key in engines if key[0] == message[1]]:
+                del engines[key]
+            continue
+
+        _, job_id, game_id, color, fen, moves = message
+        key = (game_id, color)
+        ai = engines.pop(key, None) or ChessAI(color, **ai_options)
+        engines[key] = ai
+        while len(engines) > cache_size:
+            engines.popitem(last=False)
+        try:
+            move = ai.get_best_move(decode_position(fen, moves), cancel_token=token)
+            outbox.put((index, job_id, move, ai.search_info, ai.tt.stats(), None))
+        except Exception:
+            outbox.put((index, job_id, None, {}, None, traceback.format_exc()))
+
+
+class EnginePoolBusy(Exception):
+    """排队任务已达上限"""
+    pass
+
+
+class EnginePoolClosed(Exception):
+    """进程池已关闭（或收集线程已失效），不再接受任务"""
+    pass
+
+
+class AIJob:
+    """一次 AI 走棋任务"""
+
+    __slots__ = ('id', 'game_id', 'color', 'position', 'priority', 'token', 'submitted', 'started', 'not_before')
+
+    def __init__(self, job_id, game_id, color, position, priority, delay):
+        self.id = job_id
+        self.game_id = game_id
+        self.color = color
+        self.position = position  # encode_position 的 (fen, moves) 快照
+        self.priority = priority
+        self.token = CancelToken()  # 取消后不再执行，也不再回调
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.not_before = self.submitted + delay
+
+
+class _Worker:
+    __slots__ = ('index', 'inbox', 'process', 'job')
+
+    def __init__(self, index, inbox, process):
+        self.index = index
+        self.inbox = inbox
+        self.process = process
+        self.job = None  # 正在执行的 AIJob
+
+
+class EnginePool:
+    """固定数量工作进程的 AI 引擎池，可被多个线程同时调用"""
+
+    def __init__(self, processes, on_result, queue_limit=QUEUE_LIMIT, cache_size=ENGINE_CACHE_SIZE,
+                 on_error=None, **ai_options):
+        """
+        :param processes: 工作进程数，即同时进行的搜索数上限
+        :param queue_limit: 排队（尚未开始）的任务数上限，后台任务只能用到一半（至少一个）
+        :param on_result: 结果回调 on_result(game_id, color, move, token)，在池的收集线程中调用；
+                          已取消的任务不会回调。回调与 cancel 之间仍有竞争，
+                          调用方应在与取消相同的锁内再检查一次 token.is_set()
+        :param on_error: 失败回调 on_error(game_id, color, error, token)，error 为说明文字；
+                         搜索出错、没有给出走法、工作进程退出或池失效时调用，已取消的任务不会回调
+        :param cache_size: 每个工作进程缓存的 ChessAI 数
+        :param ai_options: 创建 ChessAI 的参数（depth / tt_size_mb / time_limit / node_limit / workers 等）
+        """
+        self.on_result = on_result
+        self.on_error = on_error
+        self._context = multiprocessing.get_context('spawn')
+        self._ai_options = ai_options
+        self._cache_size = cache_size
+        self._outbox = self._context.Queue()
+        self._cancel_flags = self._context.RawArray('b', max(1, processes))  # 每个工作进程一位
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+        self._workers = []
+        self._idle = deque()  # 空闲工作进程下标
+        self._pending = {}  # game_id -> deque[AIJob]，尚未开始的任务
+        self.queue_limit = queue_limit
+        self._ready = (deque(), deque())  # 按优先级：有排队任务、且没有任务在执行的对局（先进先出）
+        self._queued = [0, 0]  # 按优先级的排队任务数
+        self._streak = 0  # 后台任务等待期间前台连续调度的次数
+        self._waits = tuple(deque(maxlen=WAIT_SAMPLES) for _ in PRIORITY_NAMES)  # 最近的排队等待（秒）
+        self._wait_totals = [[0, 0.0] for _ in PRIORITY_NAMES]  # [次数, 总秒数]
+        self._rejected = [0, 0]
+        self._active = {}  # game_id -> 正在执行或等待落子的 AIJob
+        self._affinity = {}  # game_id -> 上次服务该对局的工作进程
+        self._tt_stats = {}  # (game_id, color) -> 最近一次搜索后的置换表统计
+        self._delayed = []  # (not_before, job_id, job, move) 等待落子的结果
+        self._closed = False
+        for index in range(max(1, processes)):
+            self._workers.append(self._start_worker(index))
+            self._idle.append(index)
+        self._collector = threading.Thread(target=self._collect, name='engine-pool', daemon=True)
+        self._collector.start()
+        # 工作进程不是守护进程（以便再开并行搜索的进程池），退出前必须先关闭
+        atexit.register(self.close)
+
+    def _start_worker(self, index):
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=_engine_main, name=f'engine-{index}',
+            args=(inbox, self._outbox, index, self._cancel_flags, self._ai_options, self._cache_size))
+        process.start()
+        return _Worker(index, inbox, process)
+
+    @property
+    def closed(self):
+        """进程池是否已关闭（包括收集线程失效后自动关闭）"""
+        return self._closed
+
+    def accepts(self, priority=PRIORITY_INTERACTIVE):
+        """现在提交该优先级的任务是否会被接受（未关闭且排队未满）"""
+        with self._lock:
+            return not self._closed and self._has_room(priority)
+
+    def _has_room(self, priority):
+        # 后台任务至少能排一个，否则上限很小时 AI 对 AI 永远提交不进来
+        limit = self.queue_limit if priority == PRIORITY_INTERACTIVE else max(1, self.queue_limit // 2)
+        return sum(self._queued) < limit
+
+    def submit(self, game_id, color, game, priority=PRIORITY_INTERACTIVE, delay=0.0):
+        """
+        提交一次 AI 走棋
+        局面在提交时编码为快照，调用方需持有该对局的锁，使快照与之后的取消保持一致
+        :param game: ChineseChess，应轮到 color 走棋
+        :param priority: PRIORITY_INTERACTIVE 或 PRIORITY_BACKGROUND
+        :param delay: 从提交到落子的最短间隔（秒），避免 AI 在界面上“秒回”
+        :return: AIJob；同一对局同一颜色已有任务在排队或执行（且未被取消）时返回 None
+        :raises EnginePoolBusy: 排队任务已达上限
+        :raises EnginePoolClosed: 进程池已关闭
+        """
+        position = encode_position(game)
+        with self._lock:
+            if self._closed:
+                raise EnginePoolClosed('AI 引擎进程池已关闭')
+            jobs = self._pending.get(game_id)
+            active = self._active.get(game_id)
+            if jobs and any(job.color == color for job in jobs):
+                return None
+            if active is not None and active.color == color and not active.token.is_set():
+                return None
+            if not self._has_room(priority):
+                self._rejected[priority] += 1
+                raise EnginePoolBusy(f'AI 排队任务已达上限（{self.queue_limit}）')
+            job = AIJob(next(self._job_ids), game_id, color, position, priority, delay)
+            self._queued[priority] += 1
+            if jobs is None:
+                jobs = self._pending[game_id] = deque([job])
+                if game_id not in self._active:
+                    self._ready[priority].append(game_id)
+            else:
+                jobs.append(job)
+            self._dispatch()
+        return job
+
+    def cancel(self, game_id):
+        """
+        取消对局的全部任务：排队中的直接丢弃，正在搜索的通知工作进程中止，
+        等待落子的不再回调
+        """
+        with self._lock:
+            active = self._active.get(game_id)
+            if active is not None:
+                active.token.cancel()
+                for worker in self._workers:
+                    if worker.job is active:
+                        self._cancel_flags[worker.index] = 1
+            jobs = self._pending.pop(game_id, None)
+            if jobs is not None:
+                for job in jobs:
+                    job.token.cancel()
+                    self._queued[job.priority] -= 1
+                for ready in self._ready:
+                    if game_id in ready:
+                        ready.remove(game_id)
+
+    def forget(self, game_id):
+        """对局已删除：取消任务，并让所有工作进程释放该对局的 AI"""
+        self.cancel(game_id)
+        with self._lock:
+            self._affinity.pop(game_id, None)
+            for key in [key for key in self._tt_stats if key[0] == game_id]:
+                del self._tt_stats[key]
+            for worker in self._workers:
+                worker.inbox.put(('forget', game_id))
+
+    def tt_stats(self):
+        """各 AI 最近一次搜索后的置换表统计"""
+        with self._lock:
+            return list(self._tt_stats.values())
+
+    def stats(self):
+        """
+        进程池概况
+        :return: dict {workers, busy, games, queue_limit, queued, rejected, wait}；
+                 queued / rejected / wait 按优先级名称分项，
+                 wait 为排队等待秒数 {count, mean, p50, p99, max}（分位数取最近 WAIT_SAMPLES 次）
+        """
+        with self._lock:
+            wait = {}
+            for priority, name in enumerate(PRIORITY_NAMES):
+                samples = sorted(self._waits[priority])
+                count, total = self._wait_totals[priority]
+                wait[name] = {
+                    'count': count,
+                    'mean': total / count if count else 0.0,
+                    'p50': samples[len(samples) // 2] if samples else 0.0,
+                    'p99': samples[min(len(samples) - 1, len(samples) * 99 // 100)] if samples else 0.0,
+                    'max': samples[-1] if samples else 0.0,
+                }
+            return {
+                'workers': len(self._workers),
+                'busy': len(self._workers) - len(self._idle),
+                'games': len(self._active),
+                'queue_limit': self.queue_limit,
+                'queued': dict(zip(PRIORITY_NAMES, self._queued)),
+                'rejected': dict(zip(PRIORITY_NAMES, self._rejected)),
+                'wait': wait,
+            }
+
+    def _mark_ready(self, game_id):
+        """对局的下一个任务可以调度了，按其优先级排到队尾（需持有锁）"""
+        self._ready[self._pending[game_id][0].priority].append(game_id)
+
+    def _next_ready(self):
+        """按优先级取下一个对局；后台有任务在等时，前台连续调度 INTERACTIVE_BURST 次后让出一次"""
+        interactive, background = self._ready
+        if interactive and not (background and self._streak >= INTERACTIVE_BURST):
+            if background:
+                self._streak += 1
+            return interactive.popleft()
+        self._streak = 0
+        return background.popleft()
+
+    def _dispatch(self):
+        """把排队的任务交给空闲的工作进程（需持有锁）"""
+        while self._idle and (self._ready[0] or self._ready[1]):
+            game_id = self._next_ready()
+            jobs = self._pending[game_id]
+            job = jobs.popleft()
+            self._queued[job.priority] -= 1
+            if not jobs:
+                del self._pending[game_id]
+
+            index = self._affinity.get(game_id)
+            if index in self._idle:
+                self._idle.remove(index)
+            else:
+                index = self._idle.popleft()
+            worker = self._workers[index]
+            self._cancel_flags[index] = 0
+            job.started = time.perf_counter()
+            wait = job.started - job.submitted
+            self._waits[job.priority].append(wait)
+            self._wait_totals[job.priority][0] += 1
+            self._wait_totals[job.priority][1] += wait
+            worker.job = job
+            self._active[game_id] = job
+            self._affinity[game_id] = index
+            worker.inbox.put(('search', job.id, game_id, job.color) + job.position)
+
+    def _finish(self, job):
+        """任务结束（已落子或被丢弃），放行该对局的下一个任务（需持有锁）"""
+        if self._active.get(job.game_id) is job:
+            del self._active[job.game_id]
+            if job.game_id in self._pending:
+                self._mark_ready(job.game_id)
+        self._dispatch()
+
+    def _collect(self):
+        """收集线程：接收结果、按 delay 落子、重启意外退出的工作进程"""
+        next_check = time.perf_counter() + HEALTH_CHECK_INTERVAL
+        while True:
+            now = time.perf_counter()
+            timeout = next_check - now
+            if self._delayed:
+                timeout = min(timeout, self._delayed[0][0] - now)
+            try:
+                message = self._outbox.get(timeout=max(0.0, timeout))
+            except queue.Empty:
+                message = None
+            except (EOFError, OSError) as exc:
+                if not self._closed:
+                    print(f'AI 引擎进程池无法读取结果（{exc!r}），已停止接受任务')
+                    self._abort(f'AI 引擎进程池失效：{exc!r}')
+                return
+            if message is not None:
+                self._receive(*message)
+            while self._delayed and self._delayed[0][0] <= time.perf_counter():
+                _, _, job, move = heapq.heappop(self._delayed)
+                self._apply(job, move)
+            if time.perf_counter() >= next_check:
+                if self._closed:
+                    return
+                self._check_workers()
+                next_check = time.perf_counter() + HEALTH_CHECK_INTERVAL
+
+    def _receive(self, index, job_id, move, info, stats, error):
+        with self._lock:
+            worker = self._workers[index]
+            job = worker.job
+            if job is None or job.id != job_id:
+                return
+            worker.job = None
+            self._idle.append(index)
+            if stats is not None:
+                self._tt_stats[(job.game_id, job.color)] = stats
+            failed = not job.token.is_set() and (error or move is None)
+            if failed or job.token.is_set():
+                self._finish(job)
+            else:
+                self._dispatch()
+        if failed:
+            if error:
+                print(f'AI 搜索出错（对局 {job.game_id}）:\n{error}')
+            self._fail(job, 'AI 搜索出错' if error else 'AI 没有给出走法')
+        elif not job.token.is_set():
+            heapq.heappush(self._delayed, (job.not_before, job.id, job, move))
+
+    def _fail(self, job, error):
+        """失败回调（不持有锁调用）；已取消的任务直接丢弃"""
+        if self.on_error is None or job.token.is_set():
+            return
+        try:
+            self.on_error(job.game_id, job.color, error, job.token)
+        except Exception:
+            traceback.print_exc()
+
+    def _apply(self, job, move):
+        """落子回调；已取消的任务直接丢弃"""
+        try:
+            if not job.token.is_set():
+                self.on_result(job.game_id, job.color, move, job.token)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._finish(job)
+
+    def _check_workers(self):
+        """重启意外退出的工作进程，其正在执行的任务作废并回调 on_error"""
+        lost = []
+        with self._lock:
+            for index, worker in enumerate(self._workers):
+                if worker.process.is_alive():
+                    continue
+                print(f'AI 工作进程 {index} 意外退出（exitcode={worker.process.exitcode}），正在重启')
+                job = worker.job
+                self._workers[index] = self._start_worker(index)
+                if index not in self._idle:
+                    self._idle.append(index)
+                if job is not None:
+                    self._finish(job)
+                    lost.append(job)
+        for job in lost:
+            self._fail(job, 'AI 工作进程意外退出')
+
+    def _abort(self, error):
+        """收集线程失效：关闭进程池，排队、执行中和等待落子的任务全部回调 on_error"""
+        with self._lock:
+            jobs = [job for jobs in self._pending.values() for job in jobs]
+            jobs += [worker.job for worker in self._workers if worker.job is not None]
+            jobs += [job for _, _, job, _ in self._delayed]
+            self._delayed.clear()
+        self.close()
+        for job in jobs:
+            self._fail(job, error)
+
+    def close(self):
+        """取消全部任务并关闭工作进程"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending.clear()
+            for ready in self._ready:
+                ready.clear()
+            self._queued = [0, 0]
+            workers = list(self._workers)
+            for index in range(len(workers)):
+                self._cancel_flags[index] = 1
+        for worker in workers:
+            worker.inbox.put(None)
+        deadline = time.perf_counter() + SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.process.join(max(0.0, deadline - time.perf_counter()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
@@ -2,6 +2,11 @@
 中国象棋游戏规则逻辑
 """
 
+import random
+import sys
+import threading
+from array import array
+
 # 棋子位置约束规则（摆子阶段）
 PIECE_POSITION_RULES = {
     'r': {  # 红方
@@ -27,6 +32,637 @@ PIECE_POSITION_RULES = {
 # 每方棋子最大数量
 MAX_PIECES = {'k': 1, 'a': 2, 'b': 2, 'n': 2, 'r': 2, 'c': 2, 'p': 5}
 
+# 自然限着：连续多少个半回合（单方走一步）无吃子判和，默认 60 回合
+NO_CAPTURE_LIMIT = 120
+
+# 对局结束原因（ChineseChess.end_reason）
+END_KING_CAPTURED = 'king_captured'
+END_CHECKMATE = 'checkmate'
+END_STALEMATE = 'stalemate'  # 困毙：无子可动，判负
+END_NO_CAPTURE = 'no_capture'
+END_INSUFFICIENT_MATERIAL = 'insufficient_material'
+END_RESIGN = 'resign'
+END_REPETITION = 'repetition'
+END_PERPETUAL_CHECK = 'perpetual_check'
+END_PERPETUAL_CHASE = 'perpetual_chase'
+END_REASON_TEXT = {
+    END_KING_CAPTURED: '获胜',
+    END_CHECKMATE: '绝杀获胜',
+    END_STALEMATE: '困毙对方获胜',
+    END_NO_CAPTURE: '长时间无吃子，按自然限着判和',
+    END_INSUFFICIENT_MATERIAL: '双方均无过河进攻棋子，判和',
+    END_RESIGN: '认输',
+    END_REPETITION: '循环重复且双方均未犯规，判和',
+    END_PERPETUAL_CHECK: '胜（对方长将）',
+    END_PERPETUAL_CHASE: '胜（对方长捉）',
+}
+
+# 同一局面（同一方走棋）出现几次时按循环重复裁决
+REPETITION_LIMIT = 3
+
+# ========== 一维棋盘 ==========
+# 10×9 棋盘四周各加两圈哨兵格，任何一步（包括马、象）越界都会落在哨兵格上，
+# 无需再做行列范围判断
+BOARD_WIDTH = 13
+BOARD_HEIGHT = 14
+BOARD_SIZE = BOARD_WIDTH * BOARD_HEIGHT
+
+
+def square(row, col):
+    """(row, col) -> 一维棋盘下标"""
+    return (row + 2) * BOARD_WIDTH + col + 2
+
+
+# 一维下标 -> 行/列（哨兵格为 -1）
+SQUARE_ROW = [-1] * BOARD_SIZE
+SQUARE_COL = [-1] * BOARD_SIZE
+BOARD_SQUARES = []  # 90 个棋盘格的下标，按行优先顺序
+for _row in range(10):
+    for _col in range(9):
+        _sq = square(_row, _col)
+        SQUARE_ROW[_sq] = _row
+        SQUARE_COL[_sq] = _col
+        BOARD_SQUARES.append(_sq)
+
+# 棋子编码：颜色位 | 兵种序号，空格为 0，哨兵格为 OFFBOARD
+EMPTY = 0
+OFFBOARD = 32
+RED_FLAG = 8
+BLACK_FLAG = 16
+COLOR_MASK = RED_FLAG | BLACK_FLAG
+TYPE_MASK = 7
+KING, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, PAWN = range(1, 8)
+
+PIECE_TYPES = ('k', 'a', 'b', 'n', 'r', 'c', 'p')
+COLOR_FLAGS = {'r': RED_FLAG, 'b': BLACK_FLAG}
+FLAG_COLORS = {RED_FLAG: 'r', BLACK_FLAG: 'b'}
+PIECE_CODES = {
+    (color, piece_type): flag | (index + 1)
+    for color, flag in COLOR_FLAGS.items()
+    for index, piece_type in enumerate(PIECE_TYPES)
+}
+CODE_PIECES = [None] * (OFFBOARD + 1)  # 编码 -> (color, type)
+for _piece, _code in PIECE_CODES.items():
+    CODE_PIECES[_code] = _piece
+
+# 空棋盘模板：棋盘格为 EMPTY，其余为哨兵
+EMPTY_SQUARES = bytearray([OFFBOARD]) * BOARD_SIZE
+for _sq in BOARD_SQUARES:
+    EMPTY_SQUARES[_sq] = EMPTY
+
+# 九宫 / 己方半场的格子标记，按颜色位索引
+IN_PALACE = {RED_FLAG: bytearray(BOARD_SIZE), BLACK_FLAG: bytearray(BOARD_SIZE)}
+IN_HALF = {RED_FLAG: bytearray(BOARD_SIZE), BLACK_FLAG: bytearray(BOARD_SIZE)}
+for _sq in BOARD_SQUARES:
+    _row, _col = SQUARE_ROW[_sq], SQUARE_COL[_sq]
+    if 3 <= _col <= 5:
+        IN_PALACE[RED_FLAG][_sq] = 7 <= _row <= 9
+        IN_PALACE[BLACK_FLAG][_sq] = _row <= 2
+    IN_HALF[RED_FLAG][_sq] = _row >= 5
+    IN_HALF[BLACK_FLAG][_sq] = _row <= 4
+
+# 走法生成用的一维偏移
+ORTHOGONAL_OFFSETS = (-BOARD_WIDTH, -1, 1, BOARD_WIDTH)
+DIAGONAL_OFFSETS = (-BOARD_WIDTH - 1, -BOARD_WIDTH + 1, BOARD_WIDTH - 1, BOARD_WIDTH + 1)
+# 马：(目标偏移, 马腿偏移)
+HORSE_OFFSETS = (
+    (-2 * BOARD_WIDTH - 1, -BOARD_WIDTH), (-2 * BOARD_WIDTH + 1, -BOARD_WIDTH),
+    (-BOARD_WIDTH - 2, -1), (-BOARD_WIDTH + 2, 1),
+    (BOARD_WIDTH - 2, -1), (BOARD_WIDTH + 2, 1),
+    (2 * BOARD_WIDTH - 1, BOARD_WIDTH), (2 * BOARD_WIDTH + 1, BOARD_WIDTH),
+)
+# 象：(目标偏移, 象眼偏移)
+ELEPHANT_OFFSETS = tuple((2 * step, step) for step in DIAGONAL_OFFSETS)
+# 能把将帅憋住/放开马腿的格子（将帅的斜邻格），相对将帅的偏移
+KING_LEG_OFFSETS = frozenset(DIAGONAL_OFFSETS)
+# 能过河进攻的棋子编码（马、车、炮、兵），双方都没有时无法分出胜负
+ATTACKING_CODES = tuple(flag | piece_type for flag in (RED_FLAG, BLACK_FLAG)
+                        for piece_type in (HORSE, CHARIOT, CANNON, PAWN))
+
+# 每步的长将/长捉标记（按需计算，PLY_UNKNOWN 表示尚未计算）
+PLY_CHECK = 1
+PLY_CHASE = 2
+PLY_UNKNOWN = 0x80
+# 判定“捉”时比较的子力大小，按兵种序号索引：以小捉大即使对方有根也算捉
+CHASE_VALUES = (0, 0, 2, 2, 4, 9, 4, 1)
+
+# ========== 预计算走法表 ==========
+# 按下标（以及颜色位）索引，导入时一次性生成，只包含棋盘内的格子；
+# 走法验证与生成都只需遍历表项，不再临时计算几何关系与九宫/河界范围
+RAYS = [()] * BOARD_SIZE  # 车炮：四个方向（上、左、右、下）由近及远的格子
+LINE_BETWEEN = [{}] * BOARD_SIZE  # 同行/同列目标格 -> 两者之间的格子
+HORSE_MOVES = [()] * BOARD_SIZE  # 马：(目标格, 马腿)
+HORSE_ATTACKS = [()] * BOARD_SIZE  # 能攻击该格的 (马位, 马腿)
+KING_MOVES = {RED_FLAG: [()] * BOARD_SIZE, BLACK_FLAG: [()] * BOARD_SIZE}
+ADVISOR_MOVES = {RED_FLAG: [()] * BOARD_SIZE, BLACK_FLAG: [()] * BOARD_SIZE}
+ELEPHANT_MOVES = {RED_FLAG: [()] * BOARD_SIZE, BLACK_FLAG: [()] * BOARD_SIZE}  # (目标格, 象眼)
+PAWN_MOVES = {RED_FLAG: [()] * BOARD_SIZE, BLACK_FLAG: [()] * BOARD_SIZE}
+# 反查表：能走到该格的棋子位置
+KING_ATTACKS = {RED_FLAG: [()] * BOARD_SIZE, BLACK_FLAG: [()] * BOARD_SIZE}
+ADVISOR_ATTACKS = {RED_FLAG: [()] * BOARD_SIZE, BLACK_FLAG: [()] * BOARD_SIZE}
+ELEPHANT_ATTACKS = {RED_FLAG: [()] * BOARD_SIZE, BLACK_FLAG: [()] * BOARD_SIZE}  # (象位, 象眼)
+PAWN_ATTACKS = {RED_FLAG: [()] * BOARD_SIZE, BLACK_FLAG: [()] * BOARD_SIZE}
+
+
+def _build_move_tables():
+    """生成全部走法表"""
+    def reverse(table):
+        result = [[] for _ in range(BOARD_SIZE)]
+        for from_sq in BOARD_SQUARES:
+            for entry in table[from_sq]:
+                if isinstance(entry, tuple):
+                    result[entry[0]].append((from_sq, entry[1]))
+                else:
+                    result[entry].append(from_sq)
+        return [tuple(entries) for entries in result]
+    
+    for sq in BOARD_SQUARES:
+        rays = []
+        between = {}
+        for step in ORTHOGONAL_OFFSETS:
+            ray = []
+            to_sq = sq + step
+            while SQUARE_ROW[to_sq] >= 0:
+                between[to_sq] = tuple(ray)
+                ray.append(to_sq)
+                to_sq += step
+            rays.append(tuple(ray))
+        RAYS[sq] = tuple(rays)
+        LINE_BETWEEN[sq] = between
+        HORSE_MOVES[sq] = tuple((sq + offset, sq + leg) for offset, leg in HORSE_OFFSETS
+                                if SQUARE_ROW[sq + offset] >= 0)
+        
+        for flag in (RED_FLAG, BLACK_FLAG):
+            KING_MOVES[flag][sq] = tuple(sq + step for step in ORTHOGONAL_OFFSETS
+                                         if IN_PALACE[flag][sq + step])
+            ADVISOR_MOVES[flag][sq] = tuple(sq + step for step in DIAGONAL_OFFSETS
+                                            if IN_PALACE[flag][sq + step])
+            ELEPHANT_MOVES[flag][sq] = tuple((sq + offset, sq + eye) for offset, eye in ELEPHANT_OFFSETS
+                                             if IN_HALF[flag][sq + offset])
+            forward = -BOARD_WIDTH if flag == RED_FLAG else BOARD_WIDTH
+            steps = (forward,) if IN_HALF[flag][sq] else (forward, -1, 1)
+            PAWN_MOVES[flag][sq] = tuple(sq + step for step in steps if SQUARE_ROW[sq + step] >= 0)
+    
+    # 反查表里的马腿、象眼仍是同一格
+    HORSE_ATTACKS[:] = reverse(HORSE_MOVES)
+    for flag in (RED_FLAG, BLACK_FLAG):
+        KING_ATTACKS[flag][:] = reverse(KING_MOVES[flag])
+        ADVISOR_ATTACKS[flag][:] = reverse(ADVISOR_MOVES[flag])
+        ELEPHANT_ATTACKS[flag][:] = reverse(ELEPHANT_MOVES[flag])
+        PAWN_ATTACKS[flag][:] = reverse(PAWN_MOVES[flag])
+
+
+_build_move_tables()
+
+# 摆子阶段每种棋子允许放置的格子，由 PIECE_POSITION_RULES 展开
+SETUP_SQUARES = {color: {} for color in PIECE_POSITION_RULES}
+for _color, _rules in PIECE_POSITION_RULES.items():
+    for _piece_type, _rule in _rules.items():
+        if 'fixed' in _rule:
+            _allowed = set(_rule['fixed'])
+        elif _piece_type == 'k':
+            _allowed = {(_row, _col)
+                        for _row in range(_rule['min_row'], _rule['max_row'] + 1)
+                        for _col in range(_rule['min_col'], _rule['max_col'] + 1)}
+        elif _piece_type == 'p':
+            if 'home_row_min' in _rule:
+                _home_rows = range(_rule['home_row_min'], 10)
+            else:
+                _home_rows = range(0, _rule['home_row_max'] + 1)
+            _allowed = {(_row, _col) for _row in range(10) for _col in range(9)
+                        if _row not in _home_rows or _col in _rule['home_cols']}
+        else:
+            _allowed = {(_row, _col) for _row in range(10) for _col in range(9)}
+        SETUP_SQUARES[_color][_piece_type] = frozenset(_allowed)
+
+# Zobrist 哈希随机数（固定种子，保证跨进程稳定），按 [棋子编码][下标] 索引
+# 空格一行全为 0，走棋时吃子与否都可以直接异或
+_zobrist_rng = random.Random(0x5A0B12)
+ZOBRIST_PIECES = [[0] * BOARD_SIZE for _ in range(OFFBOARD + 1)]
+for _color in ('r', 'b'):
+    for _piece_type in PIECE_TYPES:
+        _table = ZOBRIST_PIECES[PIECE_CODES[(_color, _piece_type)]]
+        for _sq in BOARD_SQUARES:
+            _table[_sq] = _zobrist_rng.getrandbits(64)
+ZOBRIST_BLACK_TO_MOVE = _zobrist_rng.getrandbits(64)
+
+
+# ========== 子力与位置分 ==========
+# 估值 = 子力 + 位置分，按红方视角存储（黑方棋子取负、行号上下翻转），
+# 走子时在 _apply_move / _revert_move 中增量更新，AI 估值只需读取 eval_score
+PIECE_VALUES = {'k': 0, 'a': 20, 'b': 20, 'n': 45, 'r': 100, 'c': 50, 'p': 10}
+
+# 红方位置分表，第 0 行为对方底线，第 9 行为己方底线
+PIECE_SQUARE_TABLES = {
+    'k': [
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, -8, -6, -8, 0, 0, 0],
+        [0, 0, 0, -3, -2, -3, 0, 0, 0],
+        [0, 0, 0, 0, 2, 0, 0, 0, 0],
+    ],
+    'a': [
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, -1, 0, -1, 0, 0, 0],
+        [0, 0, 0, 0, 3, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+    ],
+    'b': [
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, -2, 0, 0, 0, -2, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [-1, 0, 0, 0, 3, 0, 0, 0, -1],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+    ],
+    'n': [
+        [2, 2, 2, 4, 2, 4, 2, 2, 2],
+        [2, 4, 8, 5, 3, 5, 8, 4, 2],
+        [2, 5, 6, 8, 6, 8, 6, 5, 2],
+        [3, 10, 6, 10, 6, 10, 6, 10, 3],
+        [1, 6, 6, 8, 8, 8, 6, 6, 1],
+        [1, 5, 7, 7, 8, 7, 7, 5, 1],
+        [2, 3, 5, 4, 5, 4, 5, 3, 2],
+        [2, 2, 3, 4, 2, 4, 3, 2, 2],
+        [-2, 1, 2, 3, -5, 3, 2, 1, -2],
+        [0, -2, 1, 0, 1, 0, 1, -2, 0],
+    ],
+    'r': [
+        [3, 4, 4, 6, 7, 6, 4, 4, 3],
+        [3, 6, 5, 8, 16, 8, 5, 6, 3],
+        [3, 4, 4, 7, 8, 7, 4, 4, 3],
+        [3, 6, 6, 8, 8, 8, 6, 6, 3],
+        [4, 6, 6, 7, 8, 7, 6, 6, 4],
+        [4, 6, 6, 7, 8, 7, 6, 6, 4],
+        [2, 5, 2, 6, 7, 6, 2, 5, 2],
+        [-1, 4, 2, 6, 6, 6, 2, 4, -1],
+        [2, 4, 3, 6, 0, 6, 3, 4, 2],
+        [-3, 3, 2, 6, 0, 6, 2, 3, -3],
+    ],
+    'c': [
+        [4, 4, 0, -5, -6, -5, 0, 4, 4],
+        [2, 2, 0, -4, -7, -4, 0, 2, 2],
+        [1, 1, 0, -5, -4, -5, 0, 1, 1],
+        [0, 3, 3, 2, 4, 2, 3, 3, 0],
+        [0, 0, 0, 0, 4, 0, 0, 0, 0],
+        [-1, 0, 3, 0, 4, 0, 3, 0, -1],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [1, 0, 4, 3, 5, 3, 4, 0, 1],
+        [0, 1, 2, 2, 2, 2, 2, 1, 0],
+        [0, 0, 1, 3, 3, 3, 1, 0, 0],
+    ],
+    'p': [
+        [0, 2, 4, 6, 6, 6, 4, 2, 0],
+        [10, 16, 20, 26, 28, 26, 20, 16, 10],
+        [10, 16, 20, 24, 26, 24, 20, 16, 10],
+        [8, 12, 16, 20, 22, 20, 16, 12, 8],
+        [6, 10, 12, 14, 16, 14, 12, 10, 6],
+        [2, 0, 4, 0, 6, 0, 4, 0, 2],
+        [0, 0, 0, 0, 2, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0, 0],
+    ],
+}
+
+# [棋子编码][下标] -> 红方视角的子力 + 位置分；空格一行全为 0，吃子与否都可以直接相减
+PIECE_SQUARE_VALUES = [[0] * BOARD_SIZE for _ in range(OFFBOARD + 1)]
+for (_color, _piece_type), _code in PIECE_CODES.items():
+    _table = PIECE_SQUARE_TABLES[_piece_type]
+    for _sq in BOARD_SQUARES:
+        _row, _col = SQUARE_ROW[_sq], SQUARE_COL[_sq]
+        if _color == 'r':
+            PIECE_SQUARE_VALUES[_code][_sq] = PIECE_VALUES[_piece_type] + _table[_row][_col]
+        else:
+            PIECE_SQUARE_VALUES[_code][_sq] = -(PIECE_VALUES[_piece_type] + _table[9 - _row][_col])
+
+# ========== 走法编码 ==========
+# 一步棋编码为 16 位整数：高 8 位为起点下标，低 8 位为终点下标（一维棋盘下标 < 256）
+
+def encode_move(from_row, from_col, to_row, to_col):
+    """(from_row, from_col, to_row, to_col) -> 16 位走法编码"""
+    return square(from_row, from_col) << 8 | square(to_row, to_col)
+
+
+def decode_move(move):
+    """16 位走法编码 -> (from_row, from_col, to_row, to_col)"""
+    from_sq, to_sq = move >> 8, move & 0xFF
+    return SQUARE_ROW[from_sq], SQUARE_COL[from_sq], SQUARE_ROW[to_sq], SQUARE_COL[to_sq]
+
+
+def move_to_dict(move, piece, captured):
+    """走法编码 + 棋子编码 -> 旧的 dict 形式 {from, to, piece, captured}"""
+    from_sq, to_sq = move >> 8, move & 0xFF
+    return {
+        'from': (SQUARE_ROW[from_sq], SQUARE_COL[from_sq]),
+        'to': (SQUARE_ROW[to_sq], SQUARE_COL[to_sq]),
+        'piece': CODE_PIECES[piece],
+        'captured': CODE_PIECES[captured]
+    }
+
+
+# ========== FEN ==========
+# 格式：'<棋盘> <走棋方> - - <无吃子半回合数> <回合数>'，红方记为 w（也接受 r），
+# 走棋方及之后的字段可以省略（默认红方先走）
+
+FEN_SIDES = {'w': 'r', 'r': 'r', 'b': 'b'}
+FEN_PIECE_CODES = {}  # FEN 字符 -> 棋子编码
+_fen_table = bytearray(range(256))  # 棋子编码 -> FEN 字符（空格先记为 '1'，再合并）
+_fen_table[EMPTY] = ord('1')
+for (_color, _piece_type), _code in PIECE_CODES.items():
+    _char = _piece_type.upper() if _color == 'r' else _piece_type
+    FEN_PIECE_CODES[_char] = _code
+    _fen_table[_code] = ord(_char)
+FEN_TABLE = bytes(_fen_table)
+ROW_STARTS = tuple(square(_row, 0) for _row in range(10))
+# 连续空格合并为数字：从长到短替换，生成的数字都不是 '1'，不会互相干扰
+EMPTY_RUNS = tuple(('1' * _count, str(_count)) for _count in range(9, 1, -1))
+
+
+def board_to_fen(squares):
+    """一维棋盘 -> FEN 棋盘字段（按行切片后整体转换，不逐格拼接字符串）"""
+    text = b'/'.join([squares[start:start + 9] for start in ROW_STARTS]).translate(FEN_TABLE).decode('ascii')
+    for run, count in EMPTY_RUNS:
+        text = text.replace(run, count)
+    return text
+
+
+def parse_fen(fen):
+    """
+    严格解析 FEN
+    :param fen: FEN 字符串
+    :return: (一维棋盘 bytearray, 走棋方 'r'/'b', 无吃子半回合数, 回合数)
+    :raises ValueError: 格式不合法、兵种数量超限或缺少将帅
+    """
+    if not isinstance(fen, str):
+        raise ValueError('FEN 必须是字符串')
+    fields = fen.split()
+    if len(fields) not in (1, 2, 6):
+        raise ValueError('FEN 字段数应为 1、2 或 6')
+    
+    rows = fields[0].split('/')
+    if len(rows) != 10:
+        raise ValueError(f'FEN 棋盘应有 10 行，实际 {len(rows)} 行')
+    squares = bytearray(EMPTY_SQUARES)
+    counts = bytearray(OFFBOARD + 1)
+    for row, row_str in enumerate(rows):
+        col = 0
+        previous_digit = False
+        for char in row_str:
+            if char in '123456789':
+                if previous_digit:
+                    raise ValueError(f'FEN 第 {row + 1} 行有连续数字')
+                col += int(char)
+                previous_digit = True
+                continue
+            code = FEN_PIECE_CODES.get(char)
+            if code is None:
+                raise ValueError(f'FEN 第 {row + 1} 行有非法字符 {char!r}')
+            if col >= 9:
+                raise ValueError(f'FEN 第 {row + 1} 行超过 9 列')
+            squares[square(row, col)] = code
+            counts[code] += 1
+            col += 1
+            previous_digit = False
+        if col != 9:
+            raise ValueError(f'FEN 第 {row + 1} 行应有 9 列')
+    
+    for color, flag in COLOR_FLAGS.items():
+        if counts[flag | KING] != 1:
+            raise ValueError(f'{"红方" if color == "r" else "黑方"}应有且只有一个将帅')
+        for index, piece_type in enumerate(PIECE_TYPES, 1):
+            if counts[flag | index] > MAX_PIECES[piece_type]:
+                raise ValueError(f'{"红方" if color == "r" else "黑方"} {piece_type} 数量超过上限')
+    
+    side, halfmove, fullmove = 'r', 0, 1
+    if len(fields) > 1:
+        side = FEN_SIDES.get(fields[1])
+        if side is None:
+            raise ValueError(f'FEN 走棋方应为 w 或 b，实际 {fields[1]!r}')
+    if len(fields) == 6:
+        if fields[2] != '-' or fields[3] != '-':
+            raise ValueError('FEN 第 3、4 字段应为 -')
+        if not (fields[4].isdigit() and fields[5].isdigit()):
+            raise ValueError('FEN 回合计数应为非负整数')
+        halfmove, fullmove = int(fields[4]), int(fields[5])
+        if halfmove > 0xFFFF or fullmove < 1:
+            raise ValueError('FEN 回合计数超出范围（回合数从 1 开始）')
+    return squares, side, halfmove, fullmove
+
+
+class Move:
+    """
+    一步棋（只读）
+    只保存三个小整数；仍支持 move['from'] / move['to'] / move['piece'] / move['captured']
+    的旧 dict 读法，需要 JSON 序列化时用 to_dict()
+    """
+    
+    __slots__ = ('move', 'piece_code', 'captured_code')
+    
+    KEYS = ('from', 'to', 'piece', 'captured')
+    
+    def __init__(self, move, piece_code, captured_code):
+        self.move = move
+        self.piece_code = piece_code
+        self.captured_code = captured_code
+    
+    @property
+    def from_pos(self):
+        sq = self.move >> 8
+        return SQUARE_ROW[sq], SQUARE_COL[sq]
+    
+    @property
+    def to_pos(self):
+        sq = self.move & 0xFF
+        return SQUARE_ROW[sq], SQUARE_COL[sq]
+    
+    @property
+    def piece(self):
+        return CODE_PIECES[self.piece_code]
+    
+    @property
+    def captured(self):
+        return CODE_PIECES[self.captured_code]
+    
+    def __getitem__(self, key):
+        if key == 'from':
+            return self.from_pos
+        if key == 'to':
+            return self.to_pos
+        if key == 'piece':
+            return self.piece
+        if key == 'captured':
+            return self.captured
+        raise KeyError(key)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def keys(self):
+        return self.KEYS
+    
+    def to_dict(self):
+        """转换为 dict {from, to, piece, captured}"""
+        return move_to_dict(self.move, self.piece_code, self.captured_code)
+    
+    def __eq__(self, other):
+        if isinstance(other, Move):
+            return (self.move, self.piece_code, self.captured_code) == \
+                (other.move, other.piece_code, other.captured_code)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+    
+    def __hash__(self):
+        return hash((self.move, self.piece_code, self.captured_code))
+    
+    def __repr__(self):
+        return f'Move({self.to_dict()!r})'
+
+
+class MoveHistory:
+    """
+    紧凑的走棋历史
+    走法编码存入 array('H')，走子与被吃棋子编码各存一个 bytearray，
+    每步只占 4 字节；按下标读取时返回 Move 对象
+    """
+    
+    __slots__ = ('moves', 'pieces', 'captures')
+    
+    def __init__(self):
+        self.moves = array('H')
+        self.pieces = bytearray()
+        self.captures = bytearray()
+    
+    def __len__(self):
+        return len(self.moves)
+    
+    def __getitem__(self, index):
+        return Move(self.moves[index], self.pieces[index], self.captures[index])
+    
+    def __iter__(self):
+        for index in range(len(self.moves)):
+            yield self[index]
+    
+    def append(self, move, piece, captured):
+        self.moves.append(move)
+        self.pieces.append(piece)
+        self.captures.append(captured)
+    
+    def pop(self):
+        """弹出最后一步：(走法编码, 走子编码, 被吃棋子编码)"""
+        return self.moves.pop(), self.pieces.pop(), self.captures.pop()
+    
+    def copy(self):
+        history = MoveHistory()
+        history.moves = array('H', self.moves)
+        history.pieces = bytearray(self.pieces)
+        history.captures = bytearray(self.captures)
+        return history
+    
+    def pack(self):
+        """打包为整数列表（用于保存）：走子 << 24 | 被吃棋子 << 16 | 走法"""
+        return [piece << 24 | captured << 16 | move
+                for move, piece, captured in zip(self.moves, self.pieces, self.captures)]
+    
+    def nbytes(self):
+        """占用内存（字节）"""
+        return (sys.getsizeof(self) + sys.getsizeof(self.moves)
+                + sys.getsizeof(self.pieces) + sys.getsizeof(self.captures))
+    
+    @classmethod
+    def unpack(cls, packed):
+        """从 pack() 的结果恢复"""
+        history = cls()
+        for value in packed:
+            history.append(value & 0xFFFF, value >> 24, (value >> 16) & 0xFF)
+        return history
+
+
+class BoardRowView:
+    """棋盘一行的只读视图"""
+    
+    __slots__ = ('_squares', '_base')
+    
+    def __init__(self, squares, row):
+        self._squares = squares
+        self._base = square(row, 0)
+    
+    def __len__(self):
+        return 9
+    
+    def __getitem__(self, col):
+        if col < 0:
+            col += 9
+        if not 0 <= col < 9:
+            raise IndexError('column out of range')
+        return CODE_PIECES[self._squares[self._base + col]]
+    
+    def __iter__(self):
+        squares, base = self._squares, self._base
+        for col in range(9):
+            yield CODE_PIECES[squares[base + col]]
+    
+    def tolist(self):
+        return list(self)
+
+
+class BoardView:
+    """
+    一维棋盘的二维兼容视图
+    board[row][col] 返回 (color, type) 或 None，与旧的 list-of-lists 读法一致
+    """
+    
+    __slots__ = ('_squares',)
+    
+    def __init__(self, squares):
+        self._squares = squares
+    
+    def __len__(self):
+        return 10
+    
+    def __getitem__(self, row):
+        if row < 0:
+            row += 10
+        if not 0 <= row < 10:
+            raise IndexError('row out of range')
+        return BoardRowView(self._squares, row)
+    
+    def __iter__(self):
+        for row in range(10):
+            yield BoardRowView(self._squares, row)
+    
+    def tolist(self):
+        """转换为 list-of-lists（用于 JSON 序列化）"""
+        return [row.tolist() for row in self]
+
+
+def _perpetual_level(flags):
+    """一方在循环中每步的标记 -> 2 长将 / 1 长捉（含将捉交替）/ 0 未犯规"""
+    if all(flag & PLY_CHECK for flag in flags):
+        return 2
+    if all(flag & (PLY_CHECK | PLY_CHASE) for flag in flags):
+        return 1
+    return 0
+
 
 class ChineseChess:
     """中国象棋游戏类"""
@@ -39,14 +675,28 @@ class ChineseChess:
         'b': {'k': '将', 'a': '士', 'b': '象', 'n': '马', 'r': '车', 'c': '炮', 'p': '卒'}
     }
     
-    def __init__(self, max_history=6):
-        self.board = self.init_board()
+    # 服务器为每局对局常驻一个实例，用 __slots__ 省掉每个实例的 __dict__
+    __slots__ = (
+        'squares', 'current_player', 'game_over', 'winner',
+        'move_history', 'position_history', 'position_counts', '_ply_moves', '_ply_flags',
+        '_undo_stack', 'piece_squares', 'king_squares', '_board_key',
+        'end_reason', 'capture_clock', 'no_capture_limit', 'material', '_clock_stack',
+        '_fullmove_base', '_fen_key', '_fen_board', 'eval_score',
+    )
+    
+    def __init__(self, no_capture_limit=NO_CAPTURE_LIMIT):
+        self.squares = bytearray(EMPTY_SQUARES)  # 一维棋盘，存放棋子编码
+        self._load_rows(self.init_board())
         self.current_player = self.RED
-        self.game_over = False
-        self.winner = None
-        self.move_history = []
-        self.position_history = []
-        self.max_history = max_history
+        self.no_capture_limit = no_capture_limit
+        self._fen_key = None  # get_board_fen 的缓存：棋盘键与对应的 FEN
+        self._fen_board = None
+        self._reset_state()
+    
+    @property
+    def board(self):
+        """二维兼容视图：board[row][col] -> (color, type) 或 None"""
+        return BoardView(self.squares)
     
     def init_board(self):
         """初始化棋盘"""
@@ -84,160 +734,239 @@ class ChineseChess:
         
         return board
     
+    def _load_rows(self, rows):
+        """把 list-of-lists 形式的棋盘写入一维棋盘"""
+        squares = self.squares
+        squares[:] = EMPTY_SQUARES
+        for row in range(10):
+            for col in range(9):
+                piece = rows[row][col]
+                if piece:
+                    squares[square(row, col)] = PIECE_CODES[piece]
+    
+    def _index_pieces(self):
+        """根据一维棋盘重建棋子列表、将帅位置、子力位置分和 Zobrist 键"""
+        squares = self.squares
+        self.piece_squares = {RED_FLAG: set(), BLACK_FLAG: set()}  # 颜色位 -> 棋子所在下标
+        self.king_squares = {RED_FLAG: None, BLACK_FLAG: None}  # 颜色位 -> 将帅下标
+        self.material = bytearray(OFFBOARD + 1)  # 棋子编码 -> 在盘数量
+        self.eval_score = 0  # 红方视角的子力 + 位置分（见 PIECE_SQUARE_VALUES）
+        for sq in BOARD_SQUARES:
+            piece = squares[sq]
+            if piece:
+                self.material[piece] += 1
+                self.eval_score += PIECE_SQUARE_VALUES[piece][sq]
+                color = piece & COLOR_MASK
+                self.piece_squares[color].add(sq)
+                if piece & TYPE_MASK == KING and self.king_squares[color] is None:
+                    self.king_squares[color] = sq
+        self._board_key = self._compute_board_key()
+    
+    def _move_piece(self, piece, from_sq, to_sq, captured):
+        """同步棋子列表与将帅位置（走子）"""
+        color = piece & COLOR_MASK
+        own_squares = self.piece_squares[color]
+        own_squares.remove(from_sq)
+        own_squares.add(to_sq)
+        if piece & TYPE_MASK == KING:
+            self.king_squares[color] = to_sq
+        if captured:
+            self.material[captured] -= 1
+            enemy = color ^ COLOR_MASK
+            self.piece_squares[enemy].discard(to_sq)
+            if captured & TYPE_MASK == KING:
+                self.king_squares[enemy] = None
+    
+    def _unmove_piece(self, piece, from_sq, to_sq, captured):
+        """同步棋子列表与将帅位置（撤销走子）"""
+        color = piece & COLOR_MASK
+        own_squares = self.piece_squares[color]
+        own_squares.remove(to_sq)
+        own_squares.add(from_sq)
+        if piece & TYPE_MASK == KING:
+            self.king_squares[color] = from_sq
+        if captured:
+            self.material[captured] += 1
+            enemy = color ^ COLOR_MASK
+            self.piece_squares[enemy].add(to_sq)
+            if captured & TYPE_MASK == KING:
+                self.king_squares[enemy] = to_sq
+    
+    def get_king_position(self, color):
+        """
+        获取将/帅位置
+        :param color: 'r' 或 'b'
+        :return: (row, col) 或 None
+        """
+        sq = self.king_squares[COLOR_FLAGS[color]]
+        if sq is None:
+            return None
+        return SQUARE_ROW[sq], SQUARE_COL[sq]
+    
+    def _compute_board_key(self):
+        """从头计算棋盘部分的 Zobrist 键（不含走棋方）"""
+        key = 0
+        squares = self.squares
+        for sq in BOARD_SQUARES:
+            key ^= ZOBRIST_PIECES[squares[sq]][sq]
+        return key
+    
+    @property
+    def zobrist_key(self):
+        """当前局面的 64 位 Zobrist 键（包含走棋方）"""
+        if self.current_player == self.BLACK:
+            return self._board_key ^ ZOBRIST_BLACK_TO_MOVE
+        return self._board_key
+    
+    def _record_position(self, move):
+        """
+        记录一步及走后的局面（make_move 与 push 共用）
+        position_history 存棋盘部分的键，走棋方由下标奇偶决定
+        """
+        key = self._board_key
+        self.position_history.append(key)
+        self.position_counts[key] = self.position_counts.get(key, 0) + 1
+        self._ply_moves.append(move)
+        self._ply_flags.append(PLY_UNKNOWN)
+    
+    def _forget_position(self):
+        """撤销 _record_position"""
+        key = self.position_history.pop()
+        count = self.position_counts[key] - 1
+        if count:
+            self.position_counts[key] = count
+        else:
+            del self.position_counts[key]
+        self._ply_moves.pop()
+        self._ply_flags.pop()
+    
     def get_piece(self, row, col):
         """获取棋子"""
         if 0 <= row < 10 and 0 <= col < 9:
-            return self.board[row][col]
+            return CODE_PIECES[self.squares[square(row, col)]]
         return None
     
     def is_valid_move(self, from_row, from_col, to_row, to_col):
         """判断走法是否合法"""
-        if not (0 <= from_row < 10 and 0 <= from_col < 9 and 
+        if not (0 <= from_row < 10 and 0 <= from_col < 9 and
                 0 <= to_row < 10 and 0 <= to_col < 9):
             return False
         
-        piece = self.board[from_row][from_col]
+        from_sq, to_sq = square(from_row, from_col), square(to_row, to_col)
+        piece = self.squares[from_sq]
         if not piece:
             return False
         
-        target = self.board[to_row][to_col]
-        if target and target[0] == piece[0]:
+        target = self.squares[to_sq]
+        if target & piece & COLOR_MASK:
             return False
         
-        piece_type = piece[1]
+        piece_type = piece & TYPE_MASK
         
-        if piece_type == 'k':
-            return self._validate_king(piece, from_row, from_col, to_row, to_col)
-        elif piece_type == 'a':
-            return self._validate_advisor(piece, from_row, from_col, to_row, to_col)
-        elif piece_type == 'b':
-            return self._validate_elephant(piece, from_row, from_col, to_row, to_col)
-        elif piece_type == 'n':
-            return self._validate_horse(piece, from_row, from_col, to_row, to_col)
-        elif piece_type == 'r':
-            return self._validate_chariot(piece, from_row, from_col, to_row, to_col)
-        elif piece_type == 'c':
-            return self._validate_cannon(piece, from_row, from_col, to_row, to_col)
-        elif piece_type == 'p':
-            return self._validate_soldier(piece, from_row, from_col, to_row, to_col)
+        if piece_type == KING:
+            return self._validate_king(piece, from_sq, to_sq)
+        elif piece_type == ADVISOR:
+            return self._validate_advisor(piece, from_sq, to_sq)
+        elif piece_type == ELEPHANT:
+            return self._validate_elephant(piece, from_sq, to_sq)
+        elif piece_type == HORSE:
+            return self._validate_horse(piece, from_sq, to_sq)
+        elif piece_type == CHARIOT:
+            return self._validate_chariot(piece, from_sq, to_sq)
+        elif piece_type == CANNON:
+            return self._validate_cannon(piece, from_sq, to_sq)
+        elif piece_type == PAWN:
+            return self._validate_soldier(piece, from_sq, to_sq)
         
         return False
     
-    def _validate_king(self, piece, fr, fc, tr, tc):
+    def _count_between(self, from_sq, to_sq):
+        """统计同一直线上两格之间的棋子数（不在同一直线返回 None）"""
+        between = LINE_BETWEEN[from_sq].get(to_sq)
+        if between is None:
+            return None
+        squares = self.squares
+        count = 0
+        for sq in between:
+            if squares[sq]:
+                count += 1
+        return count
+    
+    def _validate_king(self, piece, from_sq, to_sq):
         """验证将/帅"""
-        if tc < 3 or tc > 5:
-            return False
-        if piece[0] == self.BLACK and (tr < 0 or tr > 2):
-            return False
-        if piece[0] == self.RED and (tr < 7 or tr > 9):
-            return False
-        
-        dr, dc = abs(tr - fr), abs(tc - fc)
-        if (dr == 1 and dc == 0) or (dr == 0 and dc == 1):
+        if to_sq in KING_MOVES[piece & COLOR_MASK][from_sq]:
             return True
         
-        # 飞将
-        if fc == tc and self.board[tr][tc] and self.board[tr][tc][1] == 'k':
-            for r in range(min(fr, tr) + 1, max(fr, tr)):
-                if self.board[r][fc]:
-                    return False
-            return True
+        # 飞将：同列、目标是将帅且仍在己方九宫内
+        if (SQUARE_COL[from_sq] == SQUARE_COL[to_sq] and IN_PALACE[piece & COLOR_MASK][to_sq] and
+                self.squares[to_sq] & TYPE_MASK == KING):
+            return self._count_between(from_sq, to_sq) == 0
         return False
     
-    def _validate_advisor(self, piece, fr, fc, tr, tc):
+    def _validate_advisor(self, piece, from_sq, to_sq):
         """验证士/仕"""
-        if tc < 3 or tc > 5:
-            return False
-        if piece[0] == self.BLACK and (tr < 0 or tr > 2):
-            return False
-        if piece[0] == self.RED and (tr < 7 or tr > 9):
-            return False
-        
-        dr, dc = abs(tr - fr), abs(tc - fc)
-        return dr == 1 and dc == 1
+        return to_sq in ADVISOR_MOVES[piece & COLOR_MASK][from_sq]
     
-    def _validate_elephant(self, piece, fr, fc, tr, tc):
+    def _validate_elephant(self, piece, from_sq, to_sq):
         """验证象/相"""
-        if piece[0] == self.BLACK and (tr < 0 or tr > 4):
-            return False
-        if piece[0] == self.RED and (tr < 5 or tr > 9):
-            return False
-        
-        dr, dc = abs(tr - fr), abs(tc - fc)
-        if dr == 2 and dc == 2:
-            eye_row, eye_col = (fr + tr) // 2, (fc + tc) // 2
-            return self.board[eye_row][eye_col] is None
+        for dest, eye in ELEPHANT_MOVES[piece & COLOR_MASK][from_sq]:
+            if dest == to_sq:
+                return self.squares[eye] == EMPTY
         return False
     
-    def _validate_horse(self, piece, fr, fc, tr, tc):
+    def _validate_horse(self, piece, from_sq, to_sq):
         """验证马"""
-        dr, dc = abs(tr - fr), abs(tc - fc)
-        if dr == 2 and dc == 1:
-            leg_row, leg_col = fr + (1 if tr > fr else -1), fc
-            return self.board[leg_row][leg_col] is None
-        if dr == 1 and dc == 2:
-            leg_row, leg_col = fr, fc + (1 if tc > fc else -1)
-            return self.board[leg_row][leg_col] is None
+        for dest, leg in HORSE_MOVES[from_sq]:
+            if dest == to_sq:
+                return self.squares[leg] == EMPTY
         return False
     
-    def _validate_chariot(self, piece, fr, fc, tr, tc):
+    def _validate_chariot(self, piece, from_sq, to_sq):
         """验证车"""
-        if fr != tr and fc != tc:
-            return False
-        
-        if fr == tr:
-            step = 1 if tc > fc else -1
-            for c in range(fc + step, tc, step):
-                if self.board[fr][c]:
-                    return False
-        else:
-            step = 1 if tr > fr else -1
-            for r in range(fr + step, tr, step):
-                if self.board[r][fc]:
-                    return False
-        return True
+        return self._count_between(from_sq, to_sq) == 0
     
-    def _validate_cannon(self, piece, fr, fc, tr, tc):
+    def _validate_cannon(self, piece, from_sq, to_sq):
         """验证炮"""
-        if fr != tr and fc != tc:
-            return False
-        
-        count = 0
-        if fr == tr:
-            step = 1 if tc > fc else -1
-            for c in range(fc + step, tc, step):
-                if self.board[fr][c]:
-                    count += 1
-        else:
-            step = 1 if tr > fr else -1
-            for r in range(fr + step, tr, step):
-                if self.board[r][fc]:
-                    count += 1
-        
-        target = self.board[tr][tc]
-        if target is None:
+        count = self._count_between(from_sq, to_sq)
+        if self.squares[to_sq] == EMPTY:
             return count == 0
         else:
             return count == 1
     
-    def _validate_soldier(self, piece, fr, fc, tr, tc):
+    def _validate_soldier(self, piece, from_sq, to_sq):
         """验证兵/卒"""
-        dr, dc = abs(tr - fr), abs(tc - fc)
+        return to_sq in PAWN_MOVES[piece & COLOR_MASK][from_sq]
+    
+    def _apply_move(self, from_sq, to_sq):
+        """在棋盘、棋子列表、子力位置分与 Zobrist 键上执行走子，返回 (走子编码, 被吃棋子编码)"""
+        squares = self.squares
+        piece = squares[from_sq]
+        captured = squares[to_sq]
         
-        if piece[0] == self.BLACK:
-            if tr < fr:
-                return False
-            if fr <= 4:
-                return dr == 1 and dc == 0
-            else:
-                return (dr == 1 and dc == 0) or (dr == 0 and dc == 1)
-        else:
-            if tr > fr:
-                return False
-            if fr >= 5:
-                return dr == 1 and dc == 0
-            else:
-                return (dr == 1 and dc == 0) or (dr == 0 and dc == 1)
+        squares[to_sq] = piece
+        squares[from_sq] = EMPTY
+        self._move_piece(piece, from_sq, to_sq, captured)
+        
+        values = PIECE_SQUARE_VALUES[piece]
+        self.eval_score += values[to_sq] - values[from_sq] - PIECE_SQUARE_VALUES[captured][to_sq]
+        self._board_key ^= (ZOBRIST_PIECES[piece][from_sq] ^ ZOBRIST_PIECES[piece][to_sq] ^
+                            ZOBRIST_PIECES[captured][to_sq])
+        return piece, captured
+    
+    def _revert_move(self, from_sq, to_sq, captured):
+        """_apply_move 的逆操作"""
+        squares = self.squares
+        piece = squares[to_sq]
+        
+        squares[from_sq] = piece
+        squares[to_sq] = captured
+        self._unmove_piece(piece, from_sq, to_sq, captured)
+        
+        values = PIECE_SQUARE_VALUES[piece]
+        self.eval_score += values[from_sq] - values[to_sq] + PIECE_SQUARE_VALUES[captured][to_sq]
+        self._board_key ^= (ZOBRIST_PIECES[piece][from_sq] ^ ZOBRIST_PIECES[piece][to_sq] ^
+                            ZOBRIST_PIECES[captured][to_sq])
+        return piece
     
     def make_move(self, from_row, from_col, to_row, to_col):
         """执行走棋"""
@@ -247,136 +976,554 @@ class ChineseChess:
         if not self.is_valid_move(from_row, from_col, to_row, to_col):
             return False, "非法走法"
         
-        piece = self.board[from_row][from_col]
-        captured = self.board[to_row][to_col]
+        move = encode_move(from_row, from_col, to_row, to_col)
+        piece, captured = self._apply_move(move >> 8, move & 0xFF)
+        self.move_history.append(move, piece, captured)
         
-        self.board[to_row][to_col] = piece
-        self.board[from_row][from_col] = None
+        if captured:
+            self._clock_stack.append(self.capture_clock)
+            self.capture_clock = 0
+        else:
+            self.capture_clock += 1
         
-        move = {
-            'from': (from_row, from_col),
-            'to': (to_row, to_col),
-            'piece': piece,
-            'captured': captured
-        }
-        self.move_history.append(move)
+        self.current_player = self.BLACK if self.current_player == self.RED else self.RED
         
         # 记录当前局面到历史（用于检测重复）
-        current_fen = self.get_board_fen()
-        self.position_history.append(current_fen)
-        # 保持历史记录长度，但至少要保留足够的记录来检测三次重复
-        if len(self.position_history) > self.max_history * 2:
-            self.position_history.pop(0)
-        
-        if captured and captured[1] == 'k':
-            self.game_over = True
-            self.winner = piece[0]
+        self._record_position(move)
         
-        self.current_player = self.BLACK if self.current_player == self.RED else self.RED
+        if captured & TYPE_MASK == KING:
+            self._end_game(FLAG_COLORS[piece & COLOR_MASK], END_KING_CAPTURED)
+        else:
+            self._update_game_status(captured)
         
         return True, "走棋成功"
     
+    def _end_game(self, winner, reason):
+        """结束对局：winner 为 'r' / 'b' / 'draw'"""
+        self.game_over = True
+        self.winner = winner
+        self.end_reason = reason
+    
+    def _update_game_status(self, captured):
+        """
+        走子后判定对局是否自然结束（轮到 current_player 走）
+        绝杀/困毙需要生成一次合法走法；子力不足只在吃子后才可能发生；
+        自然限着只看 capture_clock
+        """
+        color = self.current_player
+        if not self.generate_legal_moves(color):
+            winner = self.BLACK if color == self.RED else self.RED
+            self._end_game(winner, END_CHECKMATE if self.is_check(color) else END_STALEMATE)
+            return
+        
+        verdict = None if captured else self.repetition_verdict()
+        if verdict:
+            self._end_game(*verdict)
+        elif captured and self.is_insufficient_material():
+            self._end_game('draw', END_INSUFFICIENT_MATERIAL)
+        elif self.capture_clock >= self.no_capture_limit:
+            self._end_game('draw', END_NO_CAPTURE)
+    
+    def is_insufficient_material(self):
+        """双方都没有马、车、炮、兵（士象不能过河，无法将死对方）"""
+        material = self.material
+        for code in ATTACKING_CODES:
+            if material[code]:
+                return False
+        return True
+    
+    def resign(self, color):
+        """
+        认输
+        :param color: 认输方
+        :return: 获胜方
+        """
+        winner = self.BLACK if color == self.RED else self.RED
+        self._end_game(winner, END_RESIGN)
+        return winner
+    
+    def get_end_message(self):
+        """对局结束原因的中文说明（未结束返回 None）"""
+        if not self.game_over:
+            return None
+        return END_REASON_TEXT.get(self.end_reason, '游戏结束')
+    
     def undo_move(self):
         """悔棋"""
         if not self.move_history:
             return False
         
-        move = self.move_history.pop()
-        fr, fc = move['from']
-        tr, tc = move['to']
+        move, piece, captured = self.move_history.pop()
+        self._revert_move(move >> 8, move & 0xFF, captured)
         
-        self.board[fr][fc] = move['piece']
-        self.board[tr][tc] = move['captured']
+        if captured:
+            self.capture_clock = self._clock_stack.pop() if self._clock_stack else 0
+        elif self.capture_clock:
+            self.capture_clock -= 1
         
-        self.current_player = move['piece'][0]
+        self.current_player = FLAG_COLORS[piece & COLOR_MASK]
         
         if self.winner:
             self.game_over = False
             self.winner = None
+            self.end_reason = None
         
-        if self.position_history:
-            self.position_history.pop()
+        self._forget_position()
         
         return True
     
+    def push(self, move):
+        """
+        搜索用的轻量走棋：原地修改棋盘，只保留撤销所需信息
+        不做合法性检查，也不写入 move_history；position_history 照常记录，
+        搜索中可以直接用 repetition_verdict 判断循环
+        :param move: 16 位走法编码（见 encode_move）
+        """
+        self._undo_stack.append((move, self.squares[move & 0xFF], self.game_over, self.winner,
+                                 self.capture_clock))
+        piece, captured = self._apply_move(move >> 8, move & 0xFF)
+        self.capture_clock = 0 if captured else self.capture_clock + 1
+        
+        if captured & TYPE_MASK == KING:
+            self.game_over = True
+            self.winner = FLAG_COLORS[piece & COLOR_MASK]
+        
+        self.current_player = self.BLACK if self.current_player == self.RED else self.RED
+        self._record_position(move)
+    
+    def pop(self):
+        """
+        撤销最近一次 push
+        :return: 被撤销的走法编码
+        """
+        move, captured, self.game_over, self.winner, self.capture_clock = self._undo_stack.pop()
+        self._revert_move(move >> 8, move & 0xFF, captured)
+        self.current_player = self.BLACK if self.current_player == self.RED else self.RED
+        self._forget_position()
+        return move
+    
     def get_all_moves(self, color):
-        """获取某一方所有合法走法"""
+        """
+        获取某一方所有合法走法
+        与逐格调用 is_valid_move 的结果完全一致（按棋盘扫描顺序排列）
+        """
+        moves = [decode_move(move) for move in self.generate_moves(color)]
+        moves.sort()
+        return moves
+    
+    def generate_moves(self, color):
+        """
+        生成某一方全部走法（不排序）
+        :return: list of 16 位走法编码
+        """
+        squares = self.squares
         moves = []
-        for fr in range(10):
-            for fc in range(9):
-                piece = self.board[fr][fc]
-                if piece and piece[0] == color:
-                    for tr in range(10):
-                        for tc in range(9):
-                            if self.is_valid_move(fr, fc, tr, tc):
-                                moves.append((fr, fc, tr, tc))
+        for from_sq in self.piece_squares[COLOR_FLAGS[color]]:
+            base = from_sq << 8
+            for to_sq in self._piece_targets(squares[from_sq], from_sq):
+                moves.append(base | to_sq)
         return moves
     
-    def is_check(self, color):
-        """判断某一方是否被将军"""
-        king_pos = None
-        for r in range(10):
-            for c in range(9):
-                piece = self.board[r][c]
-                if piece and piece[0] == color and piece[1] == 'k':
-                    king_pos = (r, c)
-                    break
-            if king_pos:
-                break
+    def get_legal_moves(self, color):
+        """
+        获取某一方所有严格合法的走法（不会让己方将帅被将军或与对方将帅对面）
+        :return: list of (from_row, from_col, to_row, to_col)，按棋盘扫描顺序排列
+        """
+        moves = [decode_move(move) for move in self.generate_legal_moves(color)]
+        moves.sort()
+        return moves
+    
+    def is_legal_move(self, from_row, from_col, to_row, to_col):
+        """判断走法是否严格合法（符合走法规则且不送将）"""
+        if not self.is_valid_move(from_row, from_col, to_row, to_col):
+            return False
+        piece = self.squares[square(from_row, from_col)]
+        own = piece & COLOR_MASK
+        if self.king_squares[own] is None:
+            return False
+        return self._leaves_king_safe(square(from_row, from_col), square(to_row, to_col), own)
+    
+    def generate_legal_moves(self, color, captures_only=False):
+        """
+        生成严格合法走法（不排序）
+        未被将军时，只有起点落在己方将帅所在行/列或马腿位（将帅斜邻格）、
+        或终点落在将帅所在行/列的走法才可能影响将帅安全，其余走法无需验证；
+        被将军时、以及将帅自身的走法逐一原地验证
+        :param captures_only: 只生成吃子走法（静态搜索用）
+        :return: list of 16 位走法编码
+        """
+        own = COLOR_FLAGS[color]
+        king_sq = self.king_squares[own]
+        if king_sq is None:
+            # 与 is_check 一致：没有将帅视为已被将死
+            return []
+        moves = self.generate_moves(color)
+        if captures_only:
+            squares = self.squares
+            moves = [move for move in moves if squares[move & 0xFF]]
+        
+        in_check = self._is_attacked(king_sq, own ^ COLOR_MASK)
+        king_row, king_col = SQUARE_ROW[king_sq], SQUARE_COL[king_sq]
+        legal = []
+        for move in moves:
+            from_sq, to_sq = move >> 8, move & 0xFF
+            if (not in_check and from_sq != king_sq and
+                    SQUARE_ROW[from_sq] != king_row and SQUARE_COL[from_sq] != king_col and
+                    SQUARE_ROW[to_sq] != king_row and SQUARE_COL[to_sq] != king_col and
+                    from_sq - king_sq not in KING_LEG_OFFSETS):
+                legal.append(move)
+            elif self._leaves_king_safe(from_sq, to_sq, own):
+                legal.append(move)
+        return legal
+    
+    def _leaves_king_safe(self, from_sq, to_sq, own):
+        """原地走子后检查己方将帅是否安全，随即还原"""
+        squares = self.squares
+        piece = squares[from_sq]
+        captured = squares[to_sq]
+        squares[to_sq] = piece
+        squares[from_sq] = EMPTY
+        king_sq = to_sq if piece & TYPE_MASK == KING else self.king_squares[own]
+        safe = not self._is_attacked(king_sq, own ^ COLOR_MASK)
+        squares[from_sq] = piece
+        squares[to_sq] = captured
+        return safe
+    
+    def get_piece_targets(self, piece, fr, fc):
+        """
+        生成单个棋子可到达的目标格
+        :return: list of (row, col)
+        """
+        return [(SQUARE_ROW[sq], SQUARE_COL[sq])
+                for sq in self._piece_targets(PIECE_CODES[piece], square(fr, fc))]
+    
+    def _piece_targets(self, piece, from_sq):
+        """生成单个棋子（编码）可到达的目标下标（遍历预计算走法表）"""
+        squares = self.squares
+        own = piece & COLOR_MASK
+        enemy = own ^ COLOR_MASK
+        piece_type = piece & TYPE_MASK
+        targets = []
+        
+        if piece_type == CHARIOT:
+            for ray in RAYS[from_sq]:
+                for to_sq in ray:
+                    target = squares[to_sq]
+                    if target == EMPTY:
+                        targets.append(to_sq)
+                    else:
+                        if target & enemy:
+                            targets.append(to_sq)
+                        break
+        
+        elif piece_type == CANNON:
+            for ray in RAYS[from_sq]:
+                screened = False
+                for to_sq in ray:
+                    target = squares[to_sq]
+                    if not screened:
+                        if target == EMPTY:
+                            targets.append(to_sq)
+                        else:
+                            screened = True
+                    elif target != EMPTY:
+                        # 翻过炮架后的第一个棋子
+                        if target & enemy:
+                            targets.append(to_sq)
+                        break
+        
+        elif piece_type == HORSE:
+            for to_sq, leg in HORSE_MOVES[from_sq]:
+                if squares[leg] == EMPTY:
+                    target = squares[to_sq]
+                    if target == EMPTY or target & enemy:
+                        targets.append(to_sq)
         
-        if not king_pos:
+        elif piece_type == ELEPHANT:
+            for to_sq, eye in ELEPHANT_MOVES[own][from_sq]:
+                if squares[eye] == EMPTY:
+                    target = squares[to_sq]
+                    if target == EMPTY or target & enemy:
+                        targets.append(to_sq)
+        
+        else:
+            if piece_type == PAWN:
+                table = PAWN_MOVES
+            elif piece_type == ADVISOR:
+                table = ADVISOR_MOVES
+            else:
+                table = KING_MOVES
+            for to_sq in table[own][from_sq]:
+                target = squares[to_sq]
+                if target == EMPTY or target & enemy:
+                    targets.append(to_sq)
+            
+            # 飞将：同列无遮挡直接吃对方将帅（目标仍须落在己方九宫内）
+            if piece_type == KING:
+                in_palace = IN_PALACE[own]
+                up, _, _, down = RAYS[from_sq]
+                for ray in (up, down):
+                    for distance, to_sq in enumerate(ray):
+                        target = squares[to_sq]
+                        if target != EMPTY:
+                            if distance > 0 and in_palace[to_sq] and target == enemy | KING:
+                                targets.append(to_sq)
+                            break
+        
+        return targets
+    
+    def is_check(self, color):
+        """
+        判断某一方是否被将军
+        只检查能攻击到将帅的位置：车炮走直线、马兵查固定偏移、将帅对面
+        """
+        own = COLOR_FLAGS[color]
+        king_sq = self.king_squares[own]
+        if king_sq is None:
             return True
+        return self._is_attacked(king_sq, own ^ COLOR_MASK)
+    
+    def _is_attacked(self, sq, attacker):
+        """
+        判断某格是否受到某方（颜色位）攻击
+        格上是将帅时，同列无遮挡的对方将帅也算攻击（将帅对面）
+        """
+        squares = self.squares
+        target_is_king = squares[sq] & TYPE_MASK == KING
         
-        opponent = self.BLACK if color == self.RED else self.RED
-        for fr in range(10):
-            for fc in range(9):
-                piece = self.board[fr][fc]
-                if piece and piece[0] == opponent:
-                    if self.is_valid_move(fr, fc, king_pos[0], king_pos[1]):
+        # 车、炮、将帅对面：沿直线找第一个和第二个棋子
+        chariot, cannon, king = attacker | CHARIOT, attacker | CANNON, attacker | KING
+        for direction, ray in enumerate(RAYS[sq]):
+            screened = False
+            for to_sq in ray:
+                piece = squares[to_sq]
+                if piece == EMPTY:
+                    continue
+                if screened:
+                    if piece == cannon:
                         return True
+                    break
+                if piece == chariot:
+                    return True
+                if piece == king and target_is_king and (direction == 0 or direction == 3):
+                    return True
+                screened = True
+        
+        # 马：反查马位，马腿须为空
+        horse = attacker | HORSE
+        for from_sq, leg in HORSE_ATTACKS[sq]:
+            if squares[from_sq] == horse and squares[leg] == EMPTY:
+                return True
+        
+        # 兵
+        pawn = attacker | PAWN
+        for from_sq in PAWN_ATTACKS[attacker][sq]:
+            if squares[from_sq] == pawn:
+                return True
+        
+        # 士、象、将帅只能攻击己方半场（仅非常规摆法会出现）
+        if IN_HALF[attacker][sq]:
+            for from_sq in KING_ATTACKS[attacker][sq]:
+                if squares[from_sq] == king:
+                    return True
+            advisor = attacker | ADVISOR
+            for from_sq in ADVISOR_ATTACKS[attacker][sq]:
+                if squares[from_sq] == advisor:
+                    return True
+            elephant = attacker | ELEPHANT
+            for from_sq, eye in ELEPHANT_ATTACKS[attacker][sq]:
+                if squares[from_sq] == elephant and squares[eye] == EMPTY:
+                    return True
+        
         return False
     
     def get_board_fen(self):
-        """获取棋盘 FEN 表示"""
-        fen_rows = []
-        for row in self.board:
-            fen_row = ''
-            empty = 0
-            for cell in row:
-                if cell is None:
-                    empty += 1
-                else:
-                    if empty > 0:
-                        fen_row += str(empty)
-                        empty = 0
-                    color, piece = cell
-                    piece_char = piece.upper() if color == self.RED else piece
-                    fen_row += piece_char
-            if empty > 0:
-                fen_row += str(empty)
-            fen_rows.append(fen_row)
-        
-        return '/'.join(fen_rows)
+        """获取棋盘 FEN 表示（按棋盘 Zobrist 键缓存，局面变化后自动失效）"""
+        key = self._board_key
+        if self._fen_key != key:
+            self._fen_board = board_to_fen(self.squares)
+            self._fen_key = key
+        return self._fen_board
+    
+    def get_fen(self, counters=False):
+        """
+        获取完整 FEN：棋盘 + 走棋方（w/b）
+        :param counters: 是否附带 '- - 无吃子半回合数 回合数'
+        """
+        fen = f"{self.get_board_fen()} {'b' if self.current_player == self.BLACK else 'w'}"
+        if counters:
+            fen += f' - - {self.capture_clock} {self.get_fullmove_number()}'
+        return fen
+    
+    def get_fullmove_number(self):
+        """当前回合数（黑方走完一步后加一）"""
+        plies = len(self.move_history)
+        # 开局时黑方先走，则第一回合只有黑方一步
+        black_started = (self.current_player == self.BLACK) == (plies % 2 == 0)
+        return self._fullmove_base + (plies + black_started) // 2
     
     def copy(self):
         """复制游戏状态"""
         new_game = ChineseChess()
-        new_game.board = [row[:] for row in self.board]
+        new_game.squares = bytearray(self.squares)
         new_game.current_player = self.current_player
         new_game.game_over = self.game_over
         new_game.winner = self.winner
-        new_game.move_history = self.move_history[:]
-        new_game.position_history = self.position_history[:]
-        new_game.max_history = self.max_history
+        new_game.move_history = self.move_history.copy()
+        new_game.position_history = array('Q', self.position_history)
+        new_game.position_counts = dict(self.position_counts)
+        new_game._ply_moves = array('H', self._ply_moves)
+        new_game._ply_flags = bytearray(self._ply_flags)
+        new_game._undo_stack = []
+        new_game.piece_squares = {color: set(squares) for color, squares in self.piece_squares.items()}
+        new_game.king_squares = dict(self.king_squares)
+        new_game._board_key = self._board_key
+        new_game.end_reason = self.end_reason
+        new_game.capture_clock = self.capture_clock
+        new_game.no_capture_limit = self.no_capture_limit
+        new_game.material = bytearray(self.material)
+        new_game.eval_score = self.eval_score
+        new_game._clock_stack = array('H', self._clock_stack)
+        new_game._fullmove_base = self._fullmove_base
         return new_game
     
-    def is_repetition(self, fen):
-        """检测局面重复"""
-        return self.position_history.count(fen) >= 2
+    def memory_report(self):
+        """
+        估算本局对局占用的内存（字节，sys.getsizeof 口径，不含共享的常量表）
+        :return: dict {board, history, positions, pieces, undo, object, total, moves}
+        """
+        getsizeof = sys.getsizeof
+        positions = getsizeof(self.position_history) + getsizeof(self.position_counts)
+        positions += sum(getsizeof(key) for key in self.position_counts)
+        positions += getsizeof(self._ply_moves) + getsizeof(self._ply_flags)
+        pieces = getsizeof(self.piece_squares) + getsizeof(self.king_squares)
+        pieces += sum(getsizeof(squares) for squares in self.piece_squares.values())
+        report = {
+            'board': getsizeof(self.squares),
+            'history': self.move_history.nbytes(),
+            'positions': positions,
+            'pieces': pieces,
+            'undo': getsizeof(self._undo_stack),
+            'object': getsizeof(self) + getsizeof(self._board_key),
+        }
+        report['total'] = sum(report.values())
+        report['moves'] = len(self.move_history)
+        return report
+    
+    def is_repetition(self):
+        """当前局面是否在上次吃子之后出现过"""
+        return self.get_repetition_count() >= 2
     
-    def get_repetition_count(self, fen):
-        """获取局面重复次数"""
-        return self.position_history.count(fen)
+    def get_repetition_count(self):
+        """当前局面（同一方走棋）在上次吃子之后出现的次数，含当前"""
+        return self._scan_repetition(None)[0]
+    
+    def _scan_repetition(self, min_count):
+        """
+        在可逆区间（上次吃子之后）内向前查找当前局面
+        先查 position_counts，没有重复时不需要扫描
+        :param min_count: 找到这么多次即停止（None 表示全部统计）
+        :return: (出现次数, 最早一次出现的 position_history 下标)
+        """
+        history = self.position_history
+        end = len(history) - 1
+        key = history[end]
+        if self.position_counts[key] < 2:
+            return 1, end
+        count, start = 1, end
+        for index in range(end - 2, max(end - self.capture_clock, 0) - 1, -2):
+            if history[index] == key:
+                count += 1
+                start = index
+                if count == min_count:
+                    break
+        return count, start
+    
+    def repetition_verdict(self, min_count=REPETITION_LIMIT):
+        """
+        按亚洲规则裁决循环重复：
+        一方每步都将军（长将）或每步都将军/捉子（长捉）而另一方没有，犯规方判负；
+        长将重于长捉；双方犯规程度相同（包括都未犯规）判和
+        :param min_count: 当前局面出现几次才裁决（对局中为 REPETITION_LIMIT，搜索中可用 2）
+        :return: None（不构成重复）或 (winner, end_reason)，winner 为 'r' / 'b' / 'draw'
+        """
+        if self.position_counts[self.position_history[-1]] < min_count:
+            return None
+        count, start = self._scan_repetition(min_count)
+        if count < min_count:
+            return None
+        
+        flags = self._cycle_flags(start, len(self.position_history) - 1)
+        last_level = _perpetual_level(flags[-1::-2])  # 刚走完一步的一方
+        other_level = _perpetual_level(flags[-2::-2])
+        if last_level == other_level:
+            return 'draw', END_REPETITION
+        
+        last = self.BLACK if self.current_player == self.RED else self.RED
+        if last_level > other_level:
+            winner, level = self.current_player, last_level
+        else:
+            winner, level = last, other_level
+        return winner, END_PERPETUAL_CHECK if level == 2 else END_PERPETUAL_CHASE
+    
+    def _cycle_flags(self, start, end):
+        """
+        取 position_history[start] 到 [end] 之间每步的将军/捉子标记
+        未计算过的步先退回到该步之前的局面再逐步重走计算；
+        区间在上次吃子之后，所有走法都不吃子，可以直接还原
+        """
+        flags = self._ply_flags
+        first = flags.find(PLY_UNKNOWN, start, end)
+        if first >= 0:
+            moves = self._ply_moves
+            for index in range(end - 1, first - 1, -1):
+                move = moves[index]
+                self._revert_move(move >> 8, move & 0xFF, EMPTY)
+            for index in range(first, end):
+                flags[index] = self._ply_flag(moves[index])
+        return flags[start:end]
+    
+    def _ply_flag(self, move):
+        """执行一步不吃子的走法，返回它的 PLY_CHECK / PLY_CHASE 标记"""
+        from_sq, to_sq = move >> 8, move & 0xFF
+        squares = self.squares
+        piece = squares[from_sq]
+        own = piece & COLOR_MASK
+        # 将帅、兵卒捉子不算捉
+        chaser = piece & TYPE_MASK not in (KING, PAWN)
+        before = self._piece_targets(piece, from_sq) if chaser else None
+        self._apply_move(from_sq, to_sq)
+        
+        flag = 0
+        king_sq = self.king_squares[own ^ COLOR_MASK]
+        if king_sq is not None and self._is_attacked(king_sq, own):
+            flag |= PLY_CHECK
+        if chaser:
+            for target in self._piece_targets(piece, to_sq):
+                if squares[target] and target not in before and self._is_chase(to_sq, target):
+                    flag |= PLY_CHASE
+                    break
+        return flag
+    
+    def _is_chase(self, from_sq, to_sq):
+        """from_sq 上的棋子能否合法吃掉 to_sq 上的棋子并构成“捉”"""
+        squares = self.squares
+        piece, victim = squares[from_sq], squares[to_sq]
+        victim_type = victim & TYPE_MASK
+        victim_color = victim & COLOR_MASK
+        if victim_type == KING or (victim_type == PAWN and IN_HALF[victim_color][to_sq]):
+            return False  # 未过河的兵卒不算
+        if not self._leaves_king_safe(from_sq, to_sq, piece & COLOR_MASK):
+            return False
+        if CHASE_VALUES[victim_type] > CHASE_VALUES[piece & TYPE_MASK]:
+            return True
+        # 吃掉后不会被反吃（无根子）才算捉
+        squares[to_sq] = piece
+        squares[from_sq] = EMPTY
+        protected = self._is_attacked(to_sq, victim_color)
+        squares[from_sq] = piece
+        squares[to_sq] = victim
+        return not protected
     
     def validate_piece_position(self, piece_type, color, row, col):
         """
@@ -389,6 +1536,10 @@ class ChineseChess:
         if piece_type not in PIECE_POSITION_RULES[color]:
             return False, f"未知的棋子类型：{piece_type}"
         
+        # 快速路径：预先展开的可放置格子
+        if (row, col) in SETUP_SQUARES[color][piece_type]:
+            return True, ""
+        
         rules = PIECE_POSITION_RULES[color][piece_type]
         piece_name = self.PIECE_NAMES[color].get(piece_type, piece_type)
         
@@ -425,18 +1576,109 @@ class ChineseChess:
         
         return True, ""
     
+    def validate_setup(self, board_data, first_move='r'):
+        """
+        一次性检查整个摆子局面，返回全部违规项（局面会被载入本对局）
+        检查：数据格式与重叠、摆放位置（PIECE_POSITION_RULES）、数量（MAX_PIECES）、
+        将帅齐全、将帅照面、先走方能否直接吃掉对方将帅、兵卒位置
+        :param board_data: list of {row, col, color, type}
+        :param first_move: 先手方 'r' 或 'b'
+        :return: list of {kind, message, squares}，squares 为相关格子 [[row, col], ...]；合法时为空列表
+        """
+        violations = []
+        flagged = set()  # 已因摆放位置报错的格子，避免同一棋子重复报告
+        
+        def report(kind, message, squares=()):
+            violations.append({'kind': kind, 'message': message, 'squares': [list(sq) for sq in squares]})
+        
+        if first_move not in COLOR_FLAGS:
+            report('first_move', f"先手方应为 'r' 或 'b'，实际 {first_move!r}")
+            first_move = self.RED
+        
+        placed = []
+        occupied = set()
+        for item in board_data:
+            try:
+                row, col = item['row'], item['col']
+                piece = (item['color'], item['type'])
+            except (KeyError, TypeError):
+                report('invalid', f'无法识别的棋子数据：{item!r}')
+                continue
+            if (piece not in PIECE_CODES or type(row) is not int or type(col) is not int or
+                    not (0 <= row < 10 and 0 <= col < 9)):
+                report('invalid', f'无法识别的棋子数据：{item!r}')
+                continue
+            if (row, col) in occupied:
+                report('duplicate', f'第 {row} 行第 {col} 列放了多个棋子', [(row, col)])
+                continue
+            occupied.add((row, col))
+            placed.append(item)
+            valid, reason = self.validate_piece_position(piece[1], piece[0], row, col)
+            if not valid:
+                report('placement', reason, [(row, col)])
+                flagged.add((row, col))
+        
+        self.set_custom_board(placed, first_move)
+        squares = self.squares
+        
+        def squares_of(code):
+            return sorted((SQUARE_ROW[sq], SQUARE_COL[sq])
+                          for sq in self.piece_squares[code & COLOR_MASK] if squares[sq] == code)
+        
+        for color, flag in COLOR_FLAGS.items():
+            side = '红方' if color == self.RED else '黑方'
+            names = self.PIECE_NAMES[color]
+            counts = self.count_pieces(color)
+            for index, piece_type in enumerate(PIECE_TYPES, 1):
+                if counts[piece_type] > MAX_PIECES[piece_type]:
+                    report('count', f'{side}{names[piece_type]}最多 {MAX_PIECES[piece_type]} 个，'
+                                    f'实际 {counts[piece_type]} 个', squares_of(flag | index))
+            if not counts['k']:
+                report('king_missing', f"{side}缺少{names['k']}")
+            
+            # 兵卒只能前进：不能在初始位置之后，未过河时也不能两个在同一直线上
+            start_row = 6 if color == self.RED else 3
+            home_files = {}
+            for row, col in squares_of(flag | PAWN):
+                if (row, col) in flagged:
+                    continue
+                if (row > start_row) if color == self.RED else (row < start_row):
+                    report('pawn', f"{names['p']}不能在初始位置之后", [(row, col)])
+                elif IN_HALF[flag][square(row, col)]:
+                    home_files.setdefault(col, []).append((row, col))
+            for file_squares in home_files.values():
+                if len(file_squares) > 1:
+                    report('pawn', f"{side}未过河的{names['p']}不能在同一直线上", file_squares)
+        
+        red_king, black_king = self.king_squares[RED_FLAG], self.king_squares[BLACK_FLAG]
+        if red_king is not None and black_king is not None:
+            king_positions = [(SQUARE_ROW[sq], SQUARE_COL[sq]) for sq in (black_king, red_king)]
+            if SQUARE_COL[red_king] == SQUARE_COL[black_king] and self._count_between(red_king, black_king) == 0:
+                report('facing_kings', '将帅不能照面', king_positions)
+            
+            mover = COLOR_FLAGS[first_move]
+            target = self.king_squares[mover ^ COLOR_MASK]
+            attackers = [(SQUARE_ROW[move >> 8], SQUARE_COL[move >> 8])
+                         for move in self.generate_moves(first_move) if move & 0xFF == target]
+            if attackers:
+                enemy = self.BLACK if first_move == self.RED else self.RED
+                report('king_capturable',
+                       f"{'红方' if first_move == self.RED else '黑方'}先走可以直接吃掉"
+                       f"{self.PIECE_NAMES[enemy]['k']}（对方正被将军）",
+                       [(SQUARE_ROW[target], SQUARE_COL[target])] + sorted(attackers))
+        
+        return violations
+    
     def count_pieces(self, color):
         """
         统计某方各棋子数量
         :param color: 'r' 或 'b'
         :return: dict {piece_type: count}
         """
-        counts = {'k': 0, 'a': 0, 'b': 0, 'n': 0, 'r': 0, 'c': 0, 'p': 0}
-        for row in self.board:
-            for cell in row:
-                if cell and cell[0] == color:
-                    counts[cell[1]] += 1
-        return counts
+        flag = COLOR_FLAGS[color]
+        material = self.material
+        return {piece_type: material[flag | index]
+                for index, piece_type in enumerate(PIECE_TYPES, 1)}
     
     def can_add_piece(self, color, piece_type):
         """
@@ -448,59 +1690,55 @@ class ChineseChess:
         counts = self.count_pieces(color)
         return counts.get(piece_type, 0) < MAX_PIECES.get(piece_type, 0)
     
-    def set_custom_board(self, board_data):
+    def _reset_state(self):
+        """摆好新局面后清空对局状态并重建棋子索引"""
+        self.game_over = False
+        self.winner = None
+        self.end_reason = None  # 对局结束原因（END_* 常量）
+        self.move_history = MoveHistory()
+        self._undo_stack = []  # push/pop 使用的撤销信息
+        self.capture_clock = 0  # 距上次吃子的半回合数
+        self._clock_stack = array('H')  # 吃子前的 capture_clock，悔棋时恢复
+        self._fullmove_base = 1  # 开局时的回合数（FEN 最后一个字段）
+        self._index_pieces()
+        self.position_history = array('Q', [self._board_key])  # 每步走后的棋盘键（首项为初始局面）
+        self.position_counts = {self._board_key: 1}  # 棋盘键 -> position_history 中出现次数
+        self._ply_moves = array('H')  # 每步走法编码
+        self._ply_flags = bytearray()  # 每步的 PLY_* 标记
+    
+    def set_custom_board(self, board_data, first_move='r'):
         """
         设置自定义局面
         :param board_data: list of {row, col, color, type}
+        :param first_move: 先手方 'r' 或 'b'
         """
         # 清空棋盘
-        self.board = [[None for _ in range(9)] for _ in range(10)]
+        squares = self.squares
+        squares[:] = EMPTY_SQUARES
         
         # 放置棋子
         for item in board_data:
             row, col = item['row'], item['col']
             color, piece_type = item['color'], item['type']
             if 0 <= row < 10 and 0 <= col < 9:
-                self.board[row][col] = (color, piece_type)
+                squares[square(row, col)] = PIECE_CODES[(color, piece_type)]
         
         # 重置状态
-        self.current_player = self.RED
-        self.game_over = False
-        self.winner = None
-        self.move_history = []
-        self.position_history = []
+        self.current_player = first_move
+        self._reset_state()
     
     def load_from_fen(self, fen):
         """
-        从 FEN 字符串加载局面
+        从 FEN 字符串加载局面（含走棋方与回合计数，省略时红方先走）
         :param fen: FEN 字符串
+        :raises ValueError: FEN 不合法，此时对局保持不变
         """
-        self.board = [[None for _ in range(9)] for _ in range(10)]
-        
-        rows = fen.split('/')
-        for row_idx, row_str in enumerate(rows):
-            col_idx = 0
-            for char in row_str:
-                if char.isdigit():
-                    col_idx += int(char)
-                else:
-                    # 确定颜色：大写=红方，小写=黑方
-                    if char.isupper():
-                        color = 'r'
-                        piece_type = char.lower()
-                    else:
-                        color = 'b'
-                        piece_type = char
-                    
-                    if 0 <= row_idx < 10 and 0 <= col_idx < 9:
-                        self.board[row_idx][col_idx] = (color, piece_type)
-                    col_idx += 1
-        
-        self.current_player = self.RED
-        self.game_over = False
-        self.winner = None
-        self.move_history = []
-        self.position_history = []
+        squares, side, halfmove, fullmove = parse_fen(fen)
+        self.squares[:] = squares
+        self.current_player = side
+        self._reset_state()
+        self.capture_clock = halfmove
+        self._fullmove_base = fullmove
     
     def to_board_data(self):
         """
@@ -508,14 +1746,31 @@ class ChineseChess:
         :return: list of {row, col, color, type}
         """
         data = []
-        for row in range(10):
-            for col in range(9):
-                piece = self.board[row][col]
-                if piece:
-                    data.append({
-                        'row': row,
-                        'col': col,
-                        'color': piece[0],
-                        'type': piece[1]
-                    })
+        squares = self.squares
+        for sq in BOARD_SQUARES:
+            piece = CODE_PIECES[squares[sq]]
+            if piece:
+                data.append({
+                    'row': SQUARE_ROW[sq],
+                    'col': SQUARE_COL[sq],
+                    'color': piece[0],
+                    'type': piece[1]
+                })
         return data
+
+
+_setup_scratch = threading.local()  # 每个线程一个复用的对局，供 validate_setup 载入待检查的局面
+
+
+def validate_setup(board_data, first_move='r'):
+    """
+    检查整个摆子局面（同 ChineseChess.validate_setup），不影响任何对局
+    每个线程复用同一个临时对局，不必每次调用都新建
+    :param board_data: list of {row, col, color, type}
+    :param first_move: 先手方 'r' 或 'b'
+    :return: list of {kind, message, squares}；合法时为空列表
+    """
+    game = getattr(_setup_scratch, 'game', None)
+    if game is None:
+        game = _setup_scratch.game = ChineseChess()
+    return game.validate_setup(board_data, first_move)
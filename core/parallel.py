@@ -0,0 +1,221 @@
+"""
+多进程并行搜索（根节点拆分）
+
+Python 线程受 GIL 限制，一步棋的搜索只能用满一个核。这里把根节点走法分给常驻的
+工作进程，每个进程对分到的走法独立迭代加深，主进程在所有进程都完成的最深一层中
+取分值最高的走法:
+
+    search = ParallelSearch(workers=4)
+    move, info = search.best_move(game, 'b', time_limit=1.0)
+    search.close()
+
+也可以直接用 ChessAI(color, workers=4)，同样工作进程数的 AI 共用一个进程池。
+工作进程只接收紧凑的局面编码：最近一次吃子时的 FEN 加其后的走法编码（循环裁决需要
+这段历史）；每个进程按参数缓存自己的 ChessAI，置换表在相邻几步之间继续复用。
+进程以 spawn 方式启动，会重新导入主模块（主模块的入口代码需放在 if __name__ == '__main__' 之下），
+启动开销只在进程池创建后第一次搜索时付出。
+"""
+
+import atexit
+import multiprocessing
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+try:
+    from .game import ChineseChess, TYPE_MASK, decode_move
+    from .ai import ChessAI, CancelToken, MAX_SEARCH_DEPTH
+except ImportError:
+    from game import ChineseChess, TYPE_MASK, decode_move
+    from ai import ChessAI, CancelToken, MAX_SEARCH_DEPTH
+
+
+MAX_CONCURRENT_SEARCHES = 64  # 同一进程池上同时进行的搜索数（每个占一个停止标志位）
+STOP_POLL_INTERVAL = 0.01  # 等待结果时调用 should_stop 的间隔（秒）
+
+_worker_state = {}  # 工作进程内：停止标志数组与按参数缓存的 ChessAI
+_shared = {}  # 主进程内：工作进程数 -> 共用的 ParallelSearch
+_shared_lock = threading.Lock()
+
+
+def encode_position(game):
+    """
+    对局 -> (fen, moves)
+    fen 为最近一次吃子时（可逆区间起点）的局面，moves 为其后的走法编码，
+    足以在工作进程中重建循环裁决所需的历史
+    """
+    plies = min(game.capture_clock, len(game.move_history))
+    if not plies:
+        return game.get_fen(counters=True), []
+    base = game.copy()
+    for _ in range(plies):
+        base.undo_move()
+    return base.get_fen(counters=True), list(game.move_history.moves[-plies:])
+
+
+def decode_position(fen, moves):
+    """
+    (fen, moves) -> ChineseChess
+    :raises ValueError: FEN 不合法或走法无法重放
+    """
+    game = ChineseChess()
+    game.load_from_fen(fen)
+    for move in moves:
+        ok, message = game.make_move(*decode_move(move))
+        if not ok:
+            raise ValueError(f'无法重放走法 {decode_move(move)}: {message}')
+    return game
+
+
+def _init_worker(flags):
+    _worker_state['flags'] = flags
+    _worker_state['engines'] = {}
+
+
+def _search_task(fen, moves, color, root_moves, depth, time_limit, node_limit, options, slot, seed):
+    """
+    工作进程：只在 root_moves 中迭代加深
+    :return: dict {iterations: [(depth, move, score)], nodes, seconds}
+    """
+    random.seed(seed)
+    game = decode_position(fen, moves)
+    engines = _worker_state['engines']
+    key = (color, tuple(sorted(options.items())))
+    ai = engines.get(key)
+    if ai is None:
+        ai = engines[key] = ChessAI(color, depth=depth, **options)
+    ai.depth = depth
+    ai.time_limit = time_limit
+    ai.node_limit = node_limit
+    ai.get_best_move(game, root_moves=root_moves, cancel_token=CancelToken(_worker_state['flags'], slot))
+    return {'iterations': ai.iterations, 'nodes': ai.nodes, 'seconds': ai.search_info['seconds']}
+
+
+class ParallelSearch:
+    """根节点拆分的多进程搜索，进程池常驻，可被多个线程同时使用"""
+
+    def __init__(self, workers=None):
+        """
+        :param workers: 工作进程数，默认取 CPU 核数
+        """
+        self.workers = max(1, workers or multiprocessing.cpu_count())
+        context = multiprocessing.get_context('spawn')
+        self._flags = context.RawArray('b', MAX_CONCURRENT_SEARCHES)
+        self._free_slots = queue.Queue()
+        for slot in range(MAX_CONCURRENT_SEARCHES):
+            self._free_slots.put(slot)
+        self._active = set()  # 正在使用的标志位
+        self._lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=context,
+                                             initializer=_init_worker, initargs=(self._flags,))
+
+    def best_move(self, game, color, depth=MAX_SEARCH_DEPTH, time_limit=None, node_limit=None,
+                  should_stop=None, **options):
+        """
+        并行搜索一步棋
+        节点预算按进程平分；各进程各自计时，时间预算与串行搜索一致
+        :param should_stop: 无参函数，返回 True 时各进程尽快结束（等待结果期间定期调用）
+        :param options: 传给工作进程中 ChessAI 的其他参数（tt_size_mb / move_ordering / quiescence / pruning）
+        :return: ((from_row, from_col, to_row, to_col) 或 None, search_info)
+        """
+        moves = game.generate_legal_moves(color)
+        if not moves:
+            return None, {}
+
+        # 打乱后把吃子（按被吃子价值）排前面，再轮流分给各进程，使各组的好走法大致均衡
+        random.shuffle(moves)
+        squares = game.squares
+        moves.sort(key=lambda move: ChessAI.CAPTURE_VALUES[squares[move & 0xFF] & TYPE_MASK], reverse=True)
+        count = min(self.workers, len(moves))
+        groups = [moves[index::count] for index in range(count)]
+        if node_limit:
+            node_limit = max(1, node_limit // count)
+
+        fen, history = encode_position(game)
+        slot = self._free_slots.get()
+        self._flags[slot] = 0
+        with self._lock:
+            self._active.add(slot)
+        start = time.perf_counter()
+        futures = []
+        try:
+            for group in groups:
+                futures.append(self._executor.submit(
+                    _search_task, fen, history, color, group, depth, time_limit, node_limit,
+                    options, slot, random.getrandbits(32)))
+            pending = futures
+            while pending:
+                if should_stop is not None and should_stop():
+                    self._flags[slot] = 1
+                pending = wait(pending, timeout=STOP_POLL_INTERVAL)[1]
+            results = [future.result() for future in futures]
+        finally:
+            # 出错或被中止时让其余进程尽快结束，等它们都退出后再归还标志位
+            self._flags[slot] = 1
+            wait(futures)
+            with self._lock:
+                self._active.discard(slot)
+            self._free_slots.put(slot)
+
+        depth, move, score = self._merge(results)
+        if move is None:
+            move = moves[0]  # 没有任何进程完成一次迭代（搜索一开始就被中止）
+        info = {
+            'depth': depth,
+            'nodes': sum(result['nodes'] for result in results),
+            'seconds': time.perf_counter() - start,
+            'score': score,
+            'move': decode_move(move),
+            'workers': count,
+        }
+        return info['move'], info
+
+    @staticmethod
+    def _merge(results):
+        """
+        合并各进程的迭代结果
+        各进程的最佳分值都是对自己那组走法的精确值，同一深度下取最高者即为整体最佳；
+        已判定杀棋（提前结束迭代）的进程不限制合并深度
+        :return: (depth, move, score)
+        """
+        finished = [result['iterations'] for result in results if result['iterations']]
+        if not finished:
+            return 0, None, None
+        open_depths = [iterations[-1][0] for iterations in finished
+                       if abs(iterations[-1][2]) < ChessAI.MATE_BOUND]
+        depth = min(open_depths) if open_depths else max(iterations[-1][0] for iterations in finished)
+        candidates = []
+        for iterations in finished:
+            reached = [item for item in iterations if item[0] <= depth]
+            if reached:
+                candidates.append(reached[-1])
+        return max(candidates, key=lambda item: item[2])
+
+    def stop(self):
+        """中止进程池上正在进行的全部搜索（可从其他线程调用）"""
+        with self._lock:
+            for slot in self._active:
+                self._flags[slot] = 1
+
+    def close(self):
+        """中止所有搜索并关闭进程池"""
+        self.stop()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def shared_search(workers):
+    """按工作进程数取共用的 ParallelSearch（首次调用时创建，进程退出时关闭）"""
+    with _shared_lock:
+        search = _shared.get(workers)
+        if search is None:
+            search = _shared[workers] = ParallelSearch(workers)
+        return search
+
+
+@atexit.register
+def _close_shared():
+    for search in _shared.values():
+        search.close()
+    _shared.clear()
@@ -0,0 +1,209 @@
+"""
+走法生成器性能与正确性测试（perft）
+
+统计从某局面出发走 N 步（严格合法走法）的叶子节点数，
+可以作为库调用，也可以直接在命令行运行:
+
+    python core/perft.py                  # 全部参考局面，深度 3，并比对参考值
+    python core/perft.py -d 4 --detail    # 深度 4，附带吃子/将军统计
+    python core/perft.py --fen "3k5/9/9/9/9/9/9/9/9/4K4 b" -d 2
+    python core/perft.py --divide -d 2    # 按根节点走法拆分节点数
+"""
+
+import argparse
+import sys
+import time
+
+try:
+    from .game import ChineseChess, decode_move
+except ImportError:
+    from game import ChineseChess, decode_move
+
+
+INITIAL_FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR'
+
+# 参考局面与节点数
+# 初始局面的数值与公开的象棋 perft 结果一致（44 / 1920 / 79666 / 3290240），
+# 其余局面的数值由逐步 push + is_check 的暴力过滤核对过
+PERFT_POSITIONS = [
+    {
+        'name': '初始局面',
+        'fen': INITIAL_FEN,
+        'side': 'r',
+        'nodes': {1: 44, 2: 1920, 3: 79666, 4: 3290240},
+    },
+    {
+        'name': '中局（黑方走）',
+        'fen': 'r1bakab1r/9/1cn4cn/p1p1p1p1p/9/2P6/P3P1P1P/1C2C1N2/9/RNBAKAB1R',
+        'side': 'b',
+        'nodes': {1: 40, 2: 1315, 3: 52216, 4: 1774805},
+    },
+    {
+        'name': '炮架与牵制',
+        'fen': '3ak4/4a4/4c4/9/4R4/9/4C4/9/4A4/3AK4',
+        'side': 'r',
+        'nodes': {1: 26, 2: 259, 3: 6669, 4: 81886},
+    },
+    {
+        'name': '将帅对面残局',
+        'fen': '4k4/4P4/9/9/9/9/9/2n6/9/4K4',
+        'side': 'b',
+        'nodes': {1: 2, 2: 7, 3: 30, 4: 132},
+    },
+]
+
+
+def load_position(fen=INITIAL_FEN, side='r'):
+    """
+    从 FEN 和走棋方创建对局
+    :param fen: FEN；只有棋盘字段时走棋方取 side
+    :param side: 'r' 或 'b'
+    """
+    if len(fen.split()) == 1:
+        fen = f"{fen} {'b' if side == 'b' else 'w'}"
+    game = ChineseChess()
+    game.load_from_fen(fen)
+    return game
+
+
+def perft(game, depth):
+    """
+    统计叶子节点数
+    :return: int
+    """
+    moves = game.generate_legal_moves(game.current_player)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+
+    nodes = 0
+    for move in moves:
+        game.push(move)
+        nodes += perft(game, depth - 1)
+        game.pop()
+    return nodes
+
+
+def perft_detail(game, depth):
+    """
+    统计叶子节点数，并按最后一步的走法类型分类
+    :return: dict {nodes, captures, checks}
+    """
+    counts = {'nodes': 0, 'captures': 0, 'checks': 0}
+    _perft_detail(game, depth, counts)
+    return counts
+
+
+def _perft_detail(game, depth, counts):
+    color = game.current_player
+    opponent = ChineseChess.BLACK if color == ChineseChess.RED else ChineseChess.RED
+    for move in game.generate_legal_moves(color):
+        if depth == 1:
+            counts['nodes'] += 1
+            if game.squares[move & 0xFF]:
+                counts['captures'] += 1
+            game.push(move)
+            if game.is_check(opponent):
+                counts['checks'] += 1
+            game.pop()
+        else:
+            game.push(move)
+            _perft_detail(game, depth - 1, counts)
+            game.pop()
+
+
+def divide(game, depth):
+    """
+    按根节点走法拆分节点数（用于定位走法生成差异）
+    :return: dict {(from_row, from_col, to_row, to_col): nodes}
+    """
+    result = {}
+    for move in game.generate_legal_moves(game.current_player):
+        game.push(move)
+        result[decode_move(move)] = perft(game, depth - 1)
+        game.pop()
+    return result
+
+
+def run_perft(fen=INITIAL_FEN, side='r', depth=3, detail=False):
+    """
+    运行一次 perft 并计时
+    :return: dict {nodes, seconds, nps[, captures, checks]}
+    """
+    game = load_position(fen, side)
+    start = time.perf_counter()
+    if detail:
+        result = perft_detail(game, depth)
+    else:
+        result = {'nodes': perft(game, depth)}
+    seconds = time.perf_counter() - start
+    result['seconds'] = seconds
+    result['nps'] = int(result['nodes'] / seconds) if seconds > 0 else 0
+    return result
+
+
+def verify(max_depth=3, positions=PERFT_POSITIONS):
+    """
+    与参考节点数比对
+    :return: list of {name, depth, expected, nodes, ok}
+    """
+    report = []
+    for position in positions:
+        for depth, expected in sorted(position['nodes'].items()):
+            if depth > max_depth:
+                continue
+            game = load_position(position['fen'], position['side'])
+            nodes = perft(game, depth)
+            report.append({
+                'name': position['name'],
+                'depth': depth,
+                'expected': expected,
+                'nodes': nodes,
+                'ok': nodes == expected,
+            })
+    return report
+
+
+def _print_result(name, depth, result):
+    line = f"{name} 深度 {depth}: {result['nodes']} 节点, {result['seconds']:.3f}s, {result['nps']} nps"
+    if 'captures' in result:
+        line += f", 吃子 {result['captures']}, 将军 {result['checks']}"
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='中国象棋走法生成 perft 测试')
+    parser.add_argument('-d', '--depth', type=int, default=3, help='搜索深度（默认 3）')
+    parser.add_argument('--fen', help='指定局面 FEN（不指定则运行全部参考局面）')
+    parser.add_argument('--side', default='r', choices=('r', 'b'), help='走棋方（--fen 不含走棋方时使用）')
+    parser.add_argument('--detail', action='store_true', help='统计吃子与将军数')
+    parser.add_argument('--divide', action='store_true', help='按根节点走法拆分')
+    args = parser.parse_args(argv)
+
+    if args.divide:
+        game = load_position(args.fen or INITIAL_FEN, args.side)
+        total = 0
+        for move, nodes in sorted(divide(game, args.depth).items()):
+            print(f'{move}: {nodes}')
+            total += nodes
+        print(f'合计: {total}')
+        return 0
+
+    if args.fen:
+        _print_result(args.fen, args.depth, run_perft(args.fen, args.side, args.depth, args.detail))
+        return 0
+
+    for position in PERFT_POSITIONS:
+        result = run_perft(position['fen'], position['side'], args.depth, args.detail)
+        _print_result(position['name'], args.depth, result)
+
+    failures = [item for item in verify(args.depth) if not item['ok']]
+    for item in failures:
+        print(f"✗ {item['name']} 深度 {item['depth']}: 期望 {item['expected']}，实际 {item['nodes']}")
+    if failures:
+        return 1
+    print('✓ 参考节点数全部一致')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,9 +2,9 @@
 中国象棋 Flask 后端 + WebSocket
 """
 
+import json
 import os
 import sys
-import time
 import threading
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,12 +17,14 @@ from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 
 try:
-    from .game import ChineseChess
-    from .ai import ChessAI
+    from .game import ChineseChess, validate_setup as check_setup
+    from .ai import TT_SIZE_MB, MAX_SEARCH_DEPTH
+    from .engine_pool import EnginePool, EnginePoolBusy, EnginePoolClosed, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
     from .database import Database
 except ImportError:
-    from game import ChineseChess
-    from ai import ChessAI
+    from game import ChineseChess, validate_setup as check_setup
+    from ai import TT_SIZE_MB, MAX_SEARCH_DEPTH
+    from engine_pool import EnginePool, EnginePoolBusy, EnginePoolClosed, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
     from database import Database
 
 app = Flask(__name__, 
@@ -35,16 +37,104 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 db = Database(os.path.join(PROJECT_ROOT, 'chess.db'))
 
 games = {}
-ai_players = {}
-ai_threads = {}
+ai_players = {}  # 由 AI 执棋的一方：game_id / f'{game_id}_black' -> 颜色（AI 实例在引擎进程中）
 ai_paused = {}
-repetition_count = {}  # 记录每局游戏的连续重复次数
 
+# 每个 AI 实例的置换表大小（MB），按服务器内存与并发对局数调整
+AI_TT_SIZE_MB = int(os.environ.get('CHESS_AI_TT_MB', TT_SIZE_MB))
+# 每步 AI 的思考时间（秒）与节点上限（0 表示不限），迭代加深在预算内尽量搜深
+# 时间不限只在设置了节点上限时有效，否则搜索没有任何预算，按默认时间处理
+DEFAULT_AI_TIME_LIMIT = 1.0
+AI_TIME_LIMIT = float(os.environ.get('CHESS_AI_TIME_LIMIT', DEFAULT_AI_TIME_LIMIT))
+AI_NODE_LIMIT = max(0, int(os.environ.get('CHESS_AI_NODE_LIMIT', 0)))
+if AI_TIME_LIMIT <= 0:
+    if AI_NODE_LIMIT:
+        AI_TIME_LIMIT = None
+    else:
+        print(f'CHESS_AI_TIME_LIMIT 必须为正数（未设置 CHESS_AI_NODE_LIMIT 时），改用默认值 {DEFAULT_AI_TIME_LIMIT} 秒')
+        AI_TIME_LIMIT = DEFAULT_AI_TIME_LIMIT
+# 每步搜索使用的工作进程数，大于 1 时按根节点走法拆分到多个核上并行搜索
+AI_WORKERS = int(os.environ.get('CHESS_AI_WORKERS', 1))
 
-def ai_move_task(game_id, ai_color):
-    """AI 走棋任务"""
-    time.sleep(0.5)
-    
+
+# 引擎进程数，即同时进行的 AI 搜索上限
+# 进程数：AI_ENGINES 个引擎进程；AI_WORKERS > 1 时每个引擎进程再开 AI_WORKERS 个并行搜索进程，
+# 共 AI_ENGINES × (AI_WORKERS + 1) 个额外进程，都以 spawn 方式启动、各自重新导入本模块（含 Flask 应用）
+AI_ENGINES = int(os.environ.get('CHESS_AI_ENGINES', os.cpu_count() or 1))
+# 排队等待引擎的 AI 走棋任务上限，超出时接口返回 503（AI 对 AI 只能占一半名额，至少一个）
+AI_QUEUE_LIMIT = int(os.environ.get('CHESS_AI_QUEUE_LIMIT', 64))
+# 从轮到 AI 到 AI 落子的最短间隔（秒），避免界面上“秒回”
+AI_MOVE_DELAY = 0.5
+
+engine_pool = None
+_engine_pool_lock = threading.Lock()
+game_locks = {}  # game_id -> RLock：走子、悔棋、改局面、提交 AI 任务与 AI 落子互斥，保证取消后不会再落旧局面的走法
+
+
+def get_engine_pool():
+    """
+    获取 AI 引擎进程池（首次使用时创建，进程池失效关闭后重新创建）
+    工作进程会重新导入本模块，所以不能在模块顶层创建
+    """
+    global engine_pool
+    with _engine_pool_lock:
+        if engine_pool is None or engine_pool.closed:
+            engine_pool = EnginePool(
+                AI_ENGINES, on_result=apply_ai_move, on_error=report_ai_error, queue_limit=AI_QUEUE_LIMIT,
+                depth=MAX_SEARCH_DEPTH, tt_size_mb=AI_TT_SIZE_MB,
+                time_limit=AI_TIME_LIMIT, node_limit=AI_NODE_LIMIT or None, workers=AI_WORKERS)
+        return engine_pool
+
+
+def game_lock(game_id):
+    """对局的互斥锁（首次使用时创建，可重入：AI 落子后会在锁内提交下一步）"""
+    return game_locks.setdefault(game_id, threading.RLock())
+
+
+def cancel_ai(game_id):
+    """中止对局正在进行的 AI 搜索并丢弃排队的任务（暂停、悔棋、删除、关闭 AI、改局面时调用）"""
+    if engine_pool is not None:
+        engine_pool.cancel(game_id)
+
+
+def ai_keys(game_id):
+    """ai_players 中对局的两个键：人机对局的 AI 方与 AI 对 AI 的红方用 game_id，AI 对 AI 的黑方用 f'{game_id}_black'"""
+    return game_id, f'{game_id}_black'
+
+
+def ai_enabled(game_id, color):
+    """该方当前是否由 AI 执棋"""
+    return any(ai_players.get(key) == color for key in ai_keys(game_id))
+
+
+def ai_priority(game_id):
+    """双方都是 AI 的对局没有人在等，排在人机对局之后"""
+    if ai_players.get(game_id) == 'r' and ai_players.get(f'{game_id}_black') == 'b':
+        return PRIORITY_BACKGROUND
+    return PRIORITY_INTERACTIVE
+
+
+def ai_busy_response():
+    """AI 排队已满时的 503 响应"""
+    message = 'AI 繁忙，请稍后再试'
+    response = jsonify({'success': False, 'busy': True, 'error': message, 'message': message})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def request_ai_move(game_id, ai_color):
+    """
+    轮到 AI 时把走棋任务交给引擎进程池（同一对局的任务按顺序执行）
+    发起请求的接口应先用 get_engine_pool().accepts() 检查，排队已满时直接返回 ai_busy_response()；
+    若仍被拒绝（如 AI 对 AI 的连续走棋），通知客户端 ai_busy，AI 对 AI 对局转为暂停，可稍后继续
+    局面快照在对局锁内生成，不会与悔棋、改局面交错
+    """
+    with game_lock(game_id):
+        _request_ai_move(game_id, ai_color)
+
+
+def _request_ai_move(game_id, ai_color):
     if game_id not in games:
         return
     
@@ -54,54 +144,67 @@ def ai_move_task(game_id, ai_color):
     if ai_paused.get(game_id, False):
         return
     
-    # 获取 AI 实例 - 根据颜色选择正确的 key
-    if ai_color == 'b' and f'{game_id}_black' in ai_players:
-        ai = ai_players[f'{game_id}_black']
-    else:
-        ai = ai_players.get(game_id)
-    
-    if not ai or game.game_over:
+    # 检查该方是否由 AI 执棋
+    if not ai_enabled(game_id, ai_color) or game.game_over:
         return
     
     if game.current_player != ai_color:
         return
     
-    # 检测循环局面：检查当前局面是否在历史中多次出现
-    current_fen = game.get_board_fen()
-    rep_count = game.get_repetition_count(current_fen)
-    
-    # 更新连续重复计数
-    if rep_count >= 2:
-        repetition_count[game_id] = repetition_count.get(game_id, 0) + 1
-    else:
-        repetition_count[game_id] = 0
-    
-    # 如果连续重复超过 6 次（12 个回合），强制 AI 变招
-    force_break = repetition_count.get(game_id, 0) >= 6
-    
-    # 检测长将/困毙：如果同一局面重复 4 次，判和（仅当双方都没有进攻棋子时）
-    if rep_count >= 4:
-        # 简化判断：如果双方都只剩下将/帅和士/仕，判和
-        red_attack = sum(1 for r in range(10) for c in range(9) 
-                        if game.board[r][c] and game.board[r][c][0] == 'r' 
-                        and game.board[r][c][1] not in ('k', 'a'))
-        black_attack = sum(1 for r in range(10) for c in range(9) 
-                          if game.board[r][c] and game.board[r][c][0] == 'b' 
-                          and game.board[r][c][1] not in ('k', 'a'))
-        
-        if red_attack == 0 and black_attack == 0:
-            game.game_over = True
-            game.winner = 'draw'
-            db.save_game_state(game_id, game)
-            socketio.emit('game_over', {
-                'game_id': game_id,
-                'winner': 'draw',
-                'reason': '双方无进攻棋子，循环重复判和'
-            })
+    priority = ai_priority(game_id)
+    try:
+        get_engine_pool().submit(game_id, ai_color, game, priority=priority, delay=AI_MOVE_DELAY)
+    except EnginePoolBusy:
+        if priority == PRIORITY_BACKGROUND:
+            ai_paused[game_id] = True
+        socketio.emit('ai_busy', {'game_id': game_id, 'paused': priority == PRIORITY_BACKGROUND})
+    except EnginePoolClosed as e:
+        _report_ai_error(game_id, ai_color, str(e))
+
+
+def apply_ai_move(game_id, ai_color, best_move, token):
+    """引擎进程池的结果回调：落子、保存并通知客户端"""
+    with game_lock(game_id):
+        # 悔棋等操作在同一把锁内先取消任务，这里再确认一次
+        if token.is_set():
+            return
+        _apply_ai_move(game_id, ai_color, best_move)
+
+
+def report_ai_error(game_id, ai_color, error, token):
+    """引擎进程池的失败回调：搜索出错、没有给出走法或工作进程退出"""
+    with game_lock(game_id):
+        if token.is_set():
             return
+        _report_ai_error(game_id, ai_color, error)
+
+
+def _report_ai_error(game_id, ai_color, error):
+    """
+    通知客户端 ai_error，不让对局停在 AI 的回合上无人处理
+    AI 对 AI 对局转为暂停，点击继续即重试；人机对局可关闭再开启该方 AI 重试
+    """
+    game = games.get(game_id)
+    if game is None or game.game_over or not ai_enabled(game_id, ai_color):
+        return
+    paused = ai_priority(game_id) == PRIORITY_BACKGROUND
+    if paused:
+        ai_paused[game_id] = True
+    socketio.emit('ai_error', {'game_id': game_id, 'color': ai_color, 'message': error, 'paused': paused})
+
+
+def _apply_ai_move(game_id, ai_color, best_move):
+    game = games.get(game_id)
     
-    best_move = ai.get_best_move(game, force_break=force_break)
+    # 搜索期间对局可能已被删除、暂停、结束或关闭了该方 AI
+    if game is None or ai_paused.get(game_id, False):
+        return
+    if not ai_enabled(game_id, ai_color):
+        return
+    if game.game_over or game.current_player != ai_color:
+        return
     
+    # 循环局面由规则引擎裁决，AI 搜索时也会避开犯规的重复
     if best_move:
         fr, fc, tr, tc = best_move
         success, message = game.make_move(fr, fc, tr, tc)
@@ -128,6 +231,7 @@ def ai_move_task(game_id, ai_color):
                 'current_player': game.current_player,
                 'game_over': game.game_over,
                 'winner': game.winner,
+                'reason': game.get_end_message(),
                 'last_move': {'from': (fr, fc), 'to': (tr, tc)}
             })
             
@@ -136,20 +240,14 @@ def ai_move_task(game_id, ai_color):
                 socketio.emit('game_over', {
                     'game_id': game_id,
                     'winner': game.winner,
-                    'reason': f'{"红方" if game.winner == "r" else "黑方"}获胜'
+                    'reason': game.get_end_message()
                 })
                 return
             
             # AI vs AI 模式下触发下一个 AI
             # 当前走棋的是 ai_color，走完后 current_player 变为对方
-            # 所以下一个应该是 current_player 对应的 AI
             if f'{game_id}_black' in ai_players and not game.game_over:
-                next_ai_color = game.current_player
-                # 只有当前走棋的是红方时才触发黑方，当前是黑方时触发红方
-                if ai_color == 'r':
-                    threading.Thread(target=ai_move_task, args=(game_id, 'b'), daemon=True).start()
-                else:
-                    threading.Thread(target=ai_move_task, args=(game_id, 'r'), daemon=True).start()
+                request_ai_move(game_id, game.current_player)
 
 
 @app.route('/api/games/<int:game_id>/pause', methods=['POST'])
@@ -164,6 +262,7 @@ def pause_game(game_id):
         return jsonify({'error': '仅 AI vs AI 支持暂停'}), 400
     
     ai_paused[game_id] = True
+    cancel_ai(game_id)
     return jsonify({'success': True, 'message': '游戏已暂停'})
 
 
@@ -178,14 +277,16 @@ def resume_game(game_id):
     if not game_data or game_data['game_type'] != 'aivai':
         return jsonify({'error': '仅 AI vs AI 支持暂停'}), 400
     
+    if not game.game_over and not get_engine_pool().accepts(ai_priority(game_id)):
+        return ai_busy_response()
+    
     ai_paused[game_id] = False
     
     # 触发当前玩家的 AI
     if not game.game_over:
         next_ai_color = game.current_player
-        ai_key = f'{game_id}_black' if next_ai_color == 'b' else game_id
-        if ai_key in ai_players:
-            threading.Thread(target=ai_move_task, args=(game_id, next_ai_color), daemon=True).start()
+        if ai_enabled(game_id, next_ai_color):
+            request_ai_move(game_id, next_ai_color)
     
     return jsonify({'success': True, 'message': '游戏已继续'})
 
@@ -236,22 +337,25 @@ def create_game():
     black_player = data.get('black', '黑方')
     first_move = data.get('first_move', 'r')  # AIvAI 模式先手方，默认红方
     
+    if game_type == 'aivai' and not get_engine_pool().accepts(PRIORITY_BACKGROUND):
+        return ai_busy_response()
+    
     game_id = db.create_game(game_type, red_player, black_player)
     
     game = ChineseChess()
     games[game_id] = game
     
     if game_type == 'pvai':
-        ai_players[game_id] = ChessAI('b', depth=3)
+        ai_players[game_id] = 'b'
     elif game_type == 'aivai':
-        ai_players[game_id] = ChessAI('r', depth=3)
-        ai_players[f'{game_id}_black'] = ChessAI('b', depth=3)
+        ai_players[game_id] = 'r'
+        ai_players[f'{game_id}_black'] = 'b'
         # 根据先手方决定哪个 AI 先走
         if first_move == 'b':
             game.current_player = 'b'
-            threading.Thread(target=ai_move_task, args=(game_id, 'b'), daemon=True).start()
+            request_ai_move(game_id, 'b')
         else:
-            threading.Thread(target=ai_move_task, args=(game_id, 'r'), daemon=True).start()
+            request_ai_move(game_id, 'r')
     
     db.save_game_state(game_id, game)
     
@@ -284,6 +388,7 @@ def get_game(game_id):
             'current_player': game.current_player,
             'game_over': game.game_over,
             'winner': game.winner,
+            'reason': game.get_end_message(),
             'move_history': game_data['move_history']
         })
     
@@ -301,51 +406,59 @@ def make_move(game_id):
     tr, tc = data.get('to')
     
     game = games[game_id]
-    success, message = game.make_move(fr, fc, tr, tc)
-    
-    if success:
-        db.save_game_state(game_id, game)
-        db.record_move(game_id, len(game.move_history), {
-            'from': (fr, fc),
-            'to': (tr, tc),
-            'piece': game.board[tr][tc],
-            'captured': None
-        })
+    with game_lock(game_id):
+        if not game.game_over and game.is_valid_move(fr, fc, tr, tc) and not game.is_legal_move(fr, fc, tr, tc):
+            return jsonify({'success': False, 'message': '走法会导致己方被将军'}), 400
         
-        if game_id in ai_players and not game.game_over:
-            ai = ai_players[game_id]
-            ai_color = ai.color
-            if game.current_player == ai_color:
-                if game_id not in ai_threads or not ai_threads[game_id].is_alive():
-                    thread = threading.Thread(target=ai_move_task, args=(game_id, ai_color), daemon=True)
-                    ai_threads[game_id] = thread
-                    thread.start()
+        # AI 排队已满时先拒绝，不让玩家走了棋却等不到 AI 回应
+        if game_id in ai_players and not get_engine_pool().accepts(ai_priority(game_id)):
+            return ai_busy_response()
         
-        board = [[None for _ in range(9)] for _ in range(10)]
-        for r in range(10):
-            for c in range(9):
-                piece = game.board[r][c]
-                if piece:
-                    board[r][c] = {'color': piece[0], 'type': piece[1]}
+        success, message = game.make_move(fr, fc, tr, tc)
         
-        socketio.emit('game_update', {
-            'game_id': game_id,
-            'board': board,
-            'current_player': game.current_player,
-            'game_over': game.game_over,
-            'winner': game.winner,
-            'last_move': {'from': (fr, fc), 'to': (tr, tc)}
-        })
+        if success:
+            # 局面已变，旧局面上正在进行或排队的搜索作废
+            cancel_ai(game_id)
+            db.save_game_state(game_id, game)
+            db.record_move(game_id, len(game.move_history), {
+                'from': (fr, fc),
+                'to': (tr, tc),
+                'piece': game.board[tr][tc],
+                'captured': None
+            })
+
+            if game_id in ai_players and not game.game_over:
+                ai_color = ai_players[game_id]
+                if game.current_player == ai_color:
+                    request_ai_move(game_id, ai_color)
+            
+            board = [[None for _ in range(9)] for _ in range(10)]
+            for r in range(10):
+                for c in range(9):
+                    piece = game.board[r][c]
+                    if piece:
+                        board[r][c] = {'color': piece[0], 'type': piece[1]}
+            
+            socketio.emit('game_update', {
+                'game_id': game_id,
+                'board': board,
+                'current_player': game.current_player,
+                'game_over': game.game_over,
+                'winner': game.winner,
+                'reason': game.get_end_message(),
+                'last_move': {'from': (fr, fc), 'to': (tr, tc)}
+            })
+            
+            return jsonify({
+                'success': True,
+                'message': message,
+                'current_player': game.current_player,
+                'game_over': game.game_over,
+                'winner': game.winner,
+                'reason': game.get_end_message()
+            })
         
-        return jsonify({
-            'success': True,
-            'message': message,
-            'current_player': game.current_player,
-            'game_over': game.game_over,
-            'winner': game.winner
-        })
-    
-    return jsonify({'success': False, 'message': message}), 400
+        return jsonify({'success': False, 'message': message}), 400
 
 
 @app.route('/api/games/<int:game_id>/undo', methods=['POST'])
@@ -355,7 +468,10 @@ def undo_move(game_id):
         return jsonify({'error': '游戏不存在'}), 404
     
     game = games[game_id]
-    success = game.undo_move()
+    with game_lock(game_id):
+        # 先中止 AI，悔棋后旧局面上的搜索结果不会再落子
+        cancel_ai(game_id)
+        success = game.undo_move()
     
     if success:
         db.save_game_state(game_id, game)
@@ -374,14 +490,14 @@ def resign_game(game_id):
     if game.game_over:
         return jsonify({'error': '游戏已结束'}), 400
     
-    current_player = game.current_player
-    winner = 'b' if current_player == 'r' else 'r'
-    resigner = current_player
-    
-    # 设置游戏结束
-    game.game_over = True
-    game.winner = winner
-    db.save_game_state(game_id, game)
+    with game_lock(game_id):
+        # 先中止 AI，认输后不会再落子
+        cancel_ai(game_id)
+        resigner = game.current_player
+        
+        # 设置游戏结束
+        winner = game.resign(resigner)
+        db.save_game_state(game_id, game)
     
     # 广播游戏结束
     socketio.emit('game_over', {
@@ -402,10 +518,14 @@ def resign_game(game_id):
 @app.route('/api/games/<int:game_id>', methods=['DELETE'])
 def delete_game(game_id):
     """删除游戏"""
-    if game_id in games:
-        del games[game_id]
-    if game_id in ai_players:
-        del ai_players[game_id]
+    with game_lock(game_id):
+        games.pop(game_id, None)
+        ai_players.pop(game_id, None)
+        ai_players.pop(f'{game_id}_black', None)
+        ai_paused.pop(game_id, None)
+        if engine_pool is not None:
+            engine_pool.forget(game_id)
+    game_locks.pop(game_id, None)
     
     db.delete_game(game_id)
     return jsonify({'success': True, 'message': '游戏已删除'})
@@ -418,9 +538,83 @@ def get_fen(game_id):
         return jsonify({'error': '游戏不存在'}), 404
     
     game = games[game_id]
-    fen = game.get_board_fen()
     
-    return jsonify({'fen': fen, 'current_player': game.current_player})
+    return jsonify({
+        'fen': game.get_fen(counters=True),
+        'board_fen': game.get_board_fen(),
+        'current_player': game.current_player,
+        'position_key': format(game.zobrist_key, '016x')
+    })
+
+
+@app.route('/api/games/<int:game_id>/fen', methods=['POST'])
+def load_fen(game_id):
+    """从 FEN 加载局面（含走棋方与回合计数）"""
+    if game_id not in games:
+        return jsonify({'error': '游戏不存在'}), 404
+    
+    data = request.json or {}
+    game = games[game_id]
+    with game_lock(game_id):
+        try:
+            game.load_from_fen(data.get('fen'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        cancel_ai(game_id)
+    
+    db.save_game_state(game_id, game)
+    
+    # 如果轮到 AI 走棋，触发 AI
+    if ai_enabled(game_id, game.current_player) and not ai_paused.get(game_id, False):
+        request_ai_move(game_id, game.current_player)
+    
+    return jsonify({
+        'success': True,
+        'fen': game.get_fen(counters=True),
+        'current_player': game.current_player
+    })
+
+
+@app.route('/api/games/<int:game_id>/memory', methods=['GET'])
+def get_memory_report(game_id):
+    """获取单局对局的内存占用（字节）"""
+    if game_id not in games:
+        return jsonify({'error': '游戏不存在'}), 404
+
+    return jsonify(games[game_id].memory_report())
+
+
+@app.route('/api/memory', methods=['GET'])
+def get_memory_summary():
+    """汇总所有常驻对局的内存占用，用于估算服务器可承载的并发对局数"""
+    reports = [game.memory_report() for game in list(games.values())]
+    total = sum(report['total'] for report in reports)
+    return jsonify({
+        'games': len(reports),
+        'total': total,
+        'average': total // len(reports) if reports else 0,
+        'max': max((report['total'] for report in reports), default=0)
+    })
+
+
+@app.route('/api/ai/stats', methods=['GET'])
+def get_ai_stats():
+    """汇总引擎进程中各 AI 的置换表命中情况与进程池负载，用于调整 CHESS_AI_TT_MB / CHESS_AI_ENGINES"""
+    pool = engine_pool
+    stats = pool.tt_stats() if pool is not None else []
+    probes = sum(item['probes'] for item in stats)
+    hits = sum(item['hits'] for item in stats)
+    return jsonify({
+        'engines': len(stats),
+        'tt_size_mb': AI_TT_SIZE_MB,
+        'bytes': sum(item['bytes'] for item in stats),
+        'probes': probes,
+        'hits': hits,
+        'hit_rate': hits / probes if probes else 0.0,
+        'cutoffs': sum(item['cutoffs'] for item in stats),
+        'hashfull': max((item['hashfull'] for item in stats), default=0),
+        'pool': pool.stats() if pool is not None else None
+    })
 
 
 # ========== 自定义局面 API ==========
@@ -436,13 +630,18 @@ def create_custom_game():
     red_player = data.get('red', '红方')
     black_player = data.get('black', '黑方')
     
+    # 先手方是 AI 时先确认能排上队
+    if ai_config.get(first_move):
+        priority = PRIORITY_BACKGROUND if ai_config.get('r') and ai_config.get('b') else PRIORITY_INTERACTIVE
+        if not get_engine_pool().accepts(priority):
+            return ai_busy_response()
+    
     # 创建游戏记录
     game_id = db.create_custom_game(game_type, red_player, black_player, ai_config, first_move)
     
     # 创建游戏实例
     game = ChineseChess()
-    game.set_custom_board(board_data)
-    game.current_player = first_move
+    game.set_custom_board(board_data, first_move)
     games[game_id] = game
     
     # 保存初始状态
@@ -450,13 +649,13 @@ def create_custom_game():
     
     # 设置 AI
     if ai_config.get('r'):
-        ai_players[game_id] = ChessAI('r', depth=3)
+        ai_players[game_id] = 'r'
     if ai_config.get('b'):
-        ai_players[f'{game_id}_black'] = ChessAI('b', depth=3)
+        ai_players[f'{game_id}_black'] = 'b'
     
     # 如果先手方是 AI，触发 AI 走棋
     if (first_move == 'r' and ai_config.get('r')) or (first_move == 'b' and ai_config.get('b')):
-        threading.Thread(target=ai_move_task, args=(game_id, first_move), daemon=True).start()
+        request_ai_move(game_id, first_move)
     
     return jsonify({
         'game_id': game_id,
@@ -476,7 +675,9 @@ def game_setup(game_id):
         board_data = data.get('board', [])
         
         game = games[game_id]
-        game.set_custom_board(board_data)
+        with game_lock(game_id):
+            cancel_ai(game_id)
+            game.set_custom_board(board_data)
         db.save_game_state(game_id, game)
         
         return jsonify({'success': True, 'message': '局面已保存'})
@@ -485,7 +686,7 @@ def game_setup(game_id):
         game = games[game_id]
         return jsonify({
             'board': game.to_board_data(),
-            'fen': game.get_board_fen()
+            'fen': game.get_fen()
         })
 
 
@@ -503,23 +704,32 @@ def toggle_ai(game_id):
         return jsonify({'error': '颜色参数错误'}), 400
     
     game = games[game_id]
-    
-    # 更新 AI 配置
-    game_data = db.load_game_state(game_id)
-    ai_config = json.loads(game_data['ai_config']) if game_data.get('ai_config') else {'r': False, 'b': False}
-    ai_config[color] = enabled
-    db.update_game_ai_config(game_id, ai_config)
-    
-    # 设置或移除 AI 实例
-    ai_key = f'{game_id}_black' if color == 'b' else game_id
-    if enabled:
-        ai_players[ai_key] = ChessAI(color, depth=3)
-        # 如果当前是该方走棋，触发 AI
-        if game.current_player == color and not game.game_over:
-            threading.Thread(target=ai_move_task, args=(game_id, color), daemon=True).start()
-    else:
-        if ai_key in ai_players:
-            del ai_players[ai_key]
+    with game_lock(game_id):
+        if enabled and game.current_player == color and not game.game_over:
+            if not get_engine_pool().accepts(PRIORITY_INTERACTIVE):
+                return ai_busy_response()
+        
+        # 更新 AI 配置
+        game_data = db.load_game_state(game_id)
+        ai_config = json.loads(game_data['ai_config']) if game_data.get('ai_config') else {'r': False, 'b': False}
+        ai_config[color] = enabled
+        db.update_game_ai_config(game_id, ai_config)
+        
+        # 设置或移除 AI 实例
+        ai_key = f'{game_id}_black' if color == 'b' else game_id
+        if enabled:
+            ai_players[ai_key] = color
+            # 如果当前是该方走棋，触发 AI
+            if game.current_player == color and not game.game_over:
+                request_ai_move(game_id, color)
+        else:
+            # 人机对局的 AI 方记在 game_id 下，两个键都要检查
+            for key in ai_keys(game_id):
+                if ai_players.get(key) == color:
+                    del ai_players[key]
+            # 正轮到该方时中止它的搜索
+            if game.current_player == color:
+                cancel_ai(game_id)
     
     return jsonify({
         'success': True,
@@ -545,10 +755,10 @@ def setups():
         if not name:
             return jsonify({'error': '需要提供局面名称'}), 400
         
-        # 生成 FEN
+        # 生成 FEN（含先手方）
         game = ChineseChess()
-        game.set_custom_board(board_data)
-        fen = game.get_board_fen()
+        game.set_custom_board(board_data, first_move)
+        fen = game.get_fen()
         
         if db.save_custom_setup(name, fen, board_data, ai_config, first_move):
             return jsonify({'success': True, 'message': '局面已保存'})
@@ -573,24 +783,18 @@ def manage_setup(name):
             return jsonify({'error': '局面不存在'}), 404
 
 
-@app.route('/api/validate-position', methods=['POST'])
-def validate_position():
-    """验证棋子摆放位置"""
-    data = request.json
-    piece_type = data.get('type')
-    color = data.get('color')
-    row = data.get('row')
-    col = data.get('col')
-    
-    if not all([piece_type, color, row is not None, col is not None]):
+@app.route('/api/validate-setup', methods=['POST'])
+def validate_setup():
+    """一次性验证整个摆子局面，返回全部违规项"""
+    data = request.json or {}
+    board_data = data.get('board')
+    if not isinstance(board_data, list):
         return jsonify({'error': '参数不完整'}), 400
     
-    game = ChineseChess()
-    valid, reason = game.validate_piece_position(piece_type, color, row, col)
-    
+    violations = check_setup(board_data, data.get('first_move', 'r'))
     return jsonify({
-        'valid': valid,
-        'reason': reason if not valid else ''
+        'valid': not violations,
+        'violations': violations
     })
 
 
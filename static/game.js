@@ -270,6 +270,28 @@ function initSocket() {
         }
     });
     
+    socket.on('ai_busy', (data) => {
+        if (data.game_id !== currentGameId) return;
+        if (data.paused) {
+            aiPaused = true;
+            document.getElementById('pauseBtn').textContent = '▶️ 继续';
+            alert('AI 繁忙，对局已暂停，请稍后点击继续');
+        } else {
+            alert('AI 繁忙，请稍后再试');
+        }
+    });
+    
+    socket.on('ai_error', (data) => {
+        if (data.game_id !== currentGameId) return;
+        if (data.paused) {
+            aiPaused = true;
+            document.getElementById('pauseBtn').textContent = '▶️ 继续';
+            alert(`${data.message}，对局已暂停，点击继续可重试`);
+        } else {
+            alert(`${data.message}，可关闭再开启 AI 重试`);
+        }
+    });
+    
     socket.on('disconnect', () => {
         console.log('WebSocket 已断开');
     });
@@ -450,7 +472,7 @@ function showGameOver(data) {
     const textEl = document.getElementById('gameOverText');
     
     if (data.winner === 'draw') {
-        textEl.textContent = '🤝 和棋！双方握手言和';
+        textEl.textContent = `🤝 和棋！${data.reason || '双方握手言和'}`;
     } else if (data.winner) {
         const winnerText = data.winner === 'r' ? '红方' : '黑方';
         // 检查是否是认输情况
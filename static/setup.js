@@ -10,6 +10,8 @@ let setupBoardState = [];      // 当前棋盘状态
 let setupAiConfig = {'r': false, 'b': false};  // AI 开关状态
 let setupFirstMove = 'r';  // 先手方
 let savedSetupState = null;  // 保存的摆子状态（用于返回时恢复）
+let setupViolations = [];  // 最近一次整盘校验的违规项
+let setupValidateTimer = null;
 
 // 棋子数据
 const PIECE_DATA = {
@@ -592,6 +594,8 @@ function renderSetupBoard() {
         
         board.appendChild(pieceEl);
     });
+    
+    scheduleSetupValidation();
 }
 
 // 清空棋盘
@@ -643,6 +647,14 @@ async function startCustomGame() {
     // 更新先手方
     updateFirstMove();
     
+    // 局面不合法时不允许开始
+    clearTimeout(setupValidateTimer);
+    await validateSetup();
+    if (setupViolations.length) {
+        alert('局面不合法：\n' + setupViolations.map(v => v.message).join('\n'));
+        return;
+    }
+    
     // 保存当前摆子状态
     savedSetupState = {
         board: JSON.parse(JSON.stringify(setupBoardState)),
@@ -807,19 +819,53 @@ function showSetupMenu() {
     initSetupMode();
 }
 
-// 验证位置（调用后端 API）
-async function validatePosition(color, type, row, col) {
+// 整盘校验：棋盘或先手方变化后调用，短时间内的多次变化只发一次请求
+function scheduleSetupValidation() {
+    clearTimeout(setupValidateTimer);
+    setupValidateTimer = setTimeout(validateSetup, 150);
+}
+
+// 验证整个局面（调用后端 API）
+async function validateSetup() {
+    updateFirstMove();
     try {
-        const response = await fetch('/api/validate-position', {
+        const response = await fetch('/api/validate-setup', {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({color, type, row, col})
+            body: JSON.stringify({board: setupBoardState, first_move: setupFirstMove})
         });
         
         const data = await response.json();
-        return data.valid;
+        setupViolations = data.violations || [];
     } catch (error) {
         console.error('验证失败:', error);
-        return true;
+        setupViolations = [];
+    }
+    showSetupViolations();
+}
+
+// 显示校验结果并标记相关棋子
+function showSetupViolations() {
+    const status = document.getElementById('setupStatus');
+    const board = document.getElementById('setupBoard');
+    board.querySelectorAll('.setup-piece.invalid').forEach(el => el.classList.remove('invalid'));
+    
+    if (!setupViolations.length) {
+        status.className = 'setup-status valid';
+        status.textContent = '✅ 局面合法';
+        return;
     }
+    
+    status.className = 'setup-status invalid';
+    const list = document.createElement('ul');
+    setupViolations.forEach(violation => {
+        const item = document.createElement('li');
+        item.textContent = violation.message;
+        list.appendChild(item);
+        violation.squares.forEach(([row, col]) => {
+            const pieceEl = board.querySelector(`.setup-piece[data-row="${row}"][data-col="${col}"]`);
+            if (pieceEl) pieceEl.classList.add('invalid');
+        });
+    });
+    status.replaceChildren(list);
 }
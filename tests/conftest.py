@@ -0,0 +1,53 @@
+"""
+测试公共设置：core 下的模块以顶层模块方式导入（与 python core/perft.py 等直接运行时一致）
+"""
+
+import os
+import random
+import sys
+
+CORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'core')
+if CORE_DIR not in sys.path:
+    sys.path.insert(0, CORE_DIR)
+
+from game import ChineseChess, MAX_PIECES, PIECE_TYPES
+
+
+def random_board(rng):
+    """
+    随机摆子（双方各有将帅，其余棋子数量随机、位置不受摆放规则限制）
+    :return: list of {row, col, color, type}
+    """
+    cells = [(row, col) for row in range(10) for col in range(9)]
+    rng.shuffle(cells)
+    board_data = []
+    for color in ('r', 'b'):
+        for piece_type in PIECE_TYPES:
+            count = 1 if piece_type == 'k' else rng.randint(0, MAX_PIECES[piece_type])
+            for _ in range(count):
+                row, col = cells.pop()
+                board_data.append({'row': row, 'col': col, 'color': color, 'type': piece_type})
+    return board_data
+
+
+def random_positions(seed, count, max_plies=60):
+    """
+    生成随机局面：一半从初始局面随机走若干步，一半为随机摆子（各自再随机走几步）
+    :return: list of ChineseChess
+    """
+    rng = random.Random(seed)
+    positions = []
+    for index in range(count):
+        game = ChineseChess()
+        if index % 2:
+            game.set_custom_board(random_board(rng), rng.choice('rb'))
+            plies = rng.randint(0, 4)
+        else:
+            plies = rng.randint(0, max_plies)
+        for _ in range(plies):
+            moves = game.get_legal_moves(game.current_player)
+            if game.game_over or not moves:
+                break
+            game.make_move(*rng.choice(moves))
+        positions.append(game)
+    return positions
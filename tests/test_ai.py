@@ -0,0 +1,29 @@
+"""
+AI 搜索：每步回报的统计信息
+"""
+
+from ai import ChessAI
+from game import ChineseChess
+
+# 红帅只剩一步可走（黑将对脸、黑车封住下二线）
+SINGLE_MOVE_FEN = '3k5/9/9/9/9/9/9/9/r8/4K4 w'
+
+
+def test_search_info_after_search():
+    ai = ChessAI('r', depth=2)
+    move = ai.get_best_move(ChineseChess())
+    info = ai.search_info
+    assert info['move'] == move
+    assert info['depth'] == 2
+    assert info['nodes'] == ai.nodes > 0
+
+
+def test_single_move_resets_search_info():
+    ai = ChessAI('r', depth=2)
+    ai.get_best_move(ChineseChess())
+    game = ChineseChess()
+    game.load_from_fen(SINGLE_MOVE_FEN)
+    move = ai.get_best_move(game)
+    assert move == (9, 4, 9, 5)
+    assert ai.nodes == 0
+    assert ai.search_info == {'depth': 0, 'nodes': 0, 'seconds': 0.0, 'score': None, 'move': move}
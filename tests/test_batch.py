@@ -0,0 +1,66 @@
+"""
+批量走法验证：validate_moves 与逐一调用 is_valid_move 的结果一致
+"""
+
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from batch import boards_from_fens, boards_from_games, validate_moves
+from conftest import random_positions
+
+POSITIONS = random_positions(seed=7, count=100)
+
+
+def test_matches_is_valid_move_on_random_positions():
+    boards = boards_from_games(POSITIONS)
+    rng = random.Random(7)
+    moves, board_index, expected = [], [], []
+    for index, game in enumerate(POSITIONS):
+        # 每个有子的格子到全部 90 格，再加一些任意起点（含空格、原地不动）
+        origins = [(row, col) for row in range(10) for col in range(9) if game.board[row][col]]
+        origins += [(rng.randrange(10), rng.randrange(9)) for _ in range(5)]
+        for fr, fc in origins:
+            for tr in range(10):
+                for tc in range(9):
+                    moves.append((fr, fc, tr, tc))
+                    board_index.append(index)
+                    expected.append(game.is_valid_move(fr, fc, tr, tc))
+    mask = validate_moves(boards, moves, board_index)
+    assert mask.dtype == bool
+    assert mask.tolist() == expected
+    assert any(expected) and not all(expected)
+
+
+def test_one_move_per_board():
+    games = POSITIONS[:20]
+    rng = random.Random(8)
+    moves = [rng.choice(game.get_all_moves(game.current_player) or [(0, 0, 0, 0)]) for game in games]
+    moves[::3] = [(rng.randrange(10), rng.randrange(9), rng.randrange(10), rng.randrange(9))
+                  for _ in moves[::3]]
+    mask = validate_moves(boards_from_games(games), moves)
+    assert mask.tolist() == [game.is_valid_move(*move) for game, move in zip(games, moves)]
+
+
+def test_boards_from_fens_matches_games():
+    games = POSITIONS[:20]
+    fens = [game.get_fen() for game in games]
+    assert np.array_equal(boards_from_fens(fens), boards_from_games(games))
+
+
+def test_rejects_bad_input():
+    boards = boards_from_games(POSITIONS[:2])
+    with pytest.raises(ValueError):
+        validate_moves(boards[:, :89], [(0, 0, 0, 1)] * 2)
+    with pytest.raises(ValueError):
+        validate_moves(boards, [(0, 0, 0)] * 2)
+    with pytest.raises(ValueError):
+        validate_moves(boards, [(0, 0, 0, 1)] * 3)
+    with pytest.raises(ValueError):
+        validate_moves(boards, [(0, 0, 0, 1)], board_index=[2])
+    bad = boards.copy()
+    bad[0, 0] = 5
+    with pytest.raises(ValueError):
+        validate_moves(bad, [(0, 0, 0, 1)] * 2)
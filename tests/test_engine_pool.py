@@ -0,0 +1,156 @@
+"""
+AI 引擎进程池：失败回调、优先级调度、排队上限与去重
+"""
+
+import queue
+
+import pytest
+
+import engine_pool
+from engine_pool import (
+    INTERACTIVE_BURST, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, EnginePool, EnginePoolBusy, EnginePoolClosed,
+)
+from game import ChineseChess
+
+TIMEOUT = 30
+
+
+class Recorder:
+    """收集 on_result / on_error 回调"""
+
+    def __init__(self):
+        self.results = queue.Queue()
+        self.errors = queue.Queue()
+
+    def on_result(self, game_id, color, move, token):
+        self.results.put((game_id, color, move))
+
+    def on_error(self, game_id, color, error, token):
+        self.errors.put((game_id, color, error))
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+@pytest.fixture
+def make_pool(recorder):
+    pools = []
+
+    def make(processes=1, **options):
+        options.setdefault('depth', 1)
+        pool = EnginePool(processes, on_result=recorder.on_result, on_error=recorder.on_error, **options)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_result_is_reported(make_pool, recorder):
+    pool = make_pool()
+    pool.submit(1, 'r', ChineseChess())
+    game_id, color, move = recorder.results.get(timeout=TIMEOUT)
+    assert (game_id, color) == (1, 'r')
+    assert ChineseChess().is_legal_move(*move)
+
+
+def test_search_error_is_reported(make_pool, recorder, monkeypatch):
+    pool = make_pool()
+    monkeypatch.setattr(engine_pool, 'encode_position', lambda game: ('not a fen', []))
+    pool.submit(1, 'r', ChineseChess())
+    assert recorder.errors.get(timeout=TIMEOUT)[:2] == (1, 'r')
+    assert recorder.results.empty()
+    assert pool.stats()['busy'] == 0
+
+
+def test_dead_worker_is_reported_and_restarted(make_pool, recorder):
+    pool = make_pool(depth=32, time_limit=1.0)
+    pool.submit(1, 'r', ChineseChess())
+    pool._workers[0].process.kill()
+    assert recorder.errors.get(timeout=TIMEOUT)[:2] == (1, 'r')
+    # 重启后的工作进程照常服务
+    pool.submit(2, 'r', ChineseChess())
+    assert recorder.results.get(timeout=TIMEOUT)[:2] == (2, 'r')
+
+
+def test_collector_failure_closes_pool(make_pool, recorder):
+    pool = make_pool(depth=32, time_limit=None)
+    pool.submit(1, 'r', ChineseChess())
+
+    class BrokenOutbox:
+        def get(self, timeout=None):
+            raise OSError('broken pipe')
+
+    pool._outbox = BrokenOutbox()
+    assert recorder.errors.get(timeout=TIMEOUT)[:2] == (1, 'r')
+    pool._collector.join(TIMEOUT)
+    assert pool.closed
+    assert not pool.accepts()
+    with pytest.raises(EnginePoolClosed):
+        pool.submit(2, 'r', ChineseChess())
+
+
+# 以下用例依赖首个任务在工作进程启动（spawn 并导入模块）期间一直占着引擎，其余提交都进入排队
+
+
+def test_interactive_burst_yields_to_background(make_pool, recorder):
+    pool = make_pool()
+    background = [f'b{index}' for index in range(3)]
+    interactive = [f'i{index}' for index in range(2 * INTERACTIVE_BURST + 2)]
+    for game_id in background:
+        pool.submit(game_id, 'r', ChineseChess(), priority=PRIORITY_BACKGROUND)
+    for game_id in interactive:
+        pool.submit(game_id, 'r', ChineseChess(), priority=PRIORITY_INTERACTIVE)
+    order = [recorder.results.get(timeout=TIMEOUT)[0] for _ in range(len(background) + len(interactive))]
+    burst = INTERACTIVE_BURST
+    assert order == (background[:1] + interactive[:burst] + background[1:2]
+                     + interactive[burst:2 * burst] + background[2:] + interactive[2 * burst:])
+
+
+def test_queue_limit_rejects_when_full(make_pool):
+    pool = make_pool(queue_limit=4)
+    pool.submit(0, 'r', ChineseChess(), priority=PRIORITY_BACKGROUND)  # 直接开始执行，不占排队名额
+    # 后台任务只能用一半名额
+    for game_id in (1, 2):
+        pool.submit(game_id, 'r', ChineseChess(), priority=PRIORITY_BACKGROUND)
+    assert not pool.accepts(PRIORITY_BACKGROUND)
+    with pytest.raises(EnginePoolBusy):
+        pool.submit(3, 'r', ChineseChess(), priority=PRIORITY_BACKGROUND)
+    # 前台任务可以用满
+    assert pool.accepts(PRIORITY_INTERACTIVE)
+    for game_id in (4, 5):
+        pool.submit(game_id, 'r', ChineseChess(), priority=PRIORITY_INTERACTIVE)
+    assert not pool.accepts(PRIORITY_INTERACTIVE)
+    with pytest.raises(EnginePoolBusy):
+        pool.submit(6, 'r', ChineseChess(), priority=PRIORITY_INTERACTIVE)
+    stats = pool.stats()
+    assert stats['queued'] == {'interactive': 2, 'background': 2}
+    assert stats['rejected'] == {'interactive': 1, 'background': 1}
+
+
+def test_queue_limit_one_still_accepts_background(make_pool):
+    pool = make_pool(queue_limit=1)
+    pool.submit(0, 'r', ChineseChess(), priority=PRIORITY_BACKGROUND)
+    assert pool.accepts(PRIORITY_BACKGROUND)
+    pool.submit(1, 'r', ChineseChess(), priority=PRIORITY_BACKGROUND)
+    for priority in (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE):
+        assert not pool.accepts(priority)
+        with pytest.raises(EnginePoolBusy):
+            pool.submit(2, 'r', ChineseChess(), priority=priority)
+
+
+def test_duplicate_job_is_ignored(make_pool, recorder):
+    pool = make_pool()
+    black_to_move = ChineseChess()
+    black_to_move.make_move(7, 1, 7, 4)
+    assert pool.submit(1, 'r', ChineseChess()) is not None
+    assert pool.submit(1, 'r', ChineseChess()) is None  # 执行中
+    assert pool.submit(1, 'b', black_to_move) is not None
+    assert pool.submit(1, 'b', black_to_move) is None  # 排队中
+    assert pool.stats()['queued']['interactive'] == 1
+    colors = sorted(recorder.results.get(timeout=TIMEOUT)[1] for _ in range(2))
+    assert colors == ['b', 'r']
+    assert recorder.results.empty()
@@ -0,0 +1,107 @@
+"""
+FEN：严格解析的拒绝路径、带计数的往返，以及并行搜索用的局面编码
+"""
+
+import pytest
+
+from conftest import random_positions
+from game import ChineseChess, parse_fen
+from parallel import decode_position, encode_position
+
+INITIAL_FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR'
+# 吃掉将帅而结束的对局没有合法的 FEN
+POSITIONS = [game for game in random_positions(seed=13, count=100)
+             if game.get_king_position('r') and game.get_king_position('b')]
+
+
+@pytest.mark.parametrize('fen', [
+    None,
+    '',
+    'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9',  # 9 行
+    'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR/9',  # 11 行
+    'rnbakabnr/8/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR',  # 少一列
+    'rnbakabnrr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR',  # 多一列
+    'rnbakabnr/9/1c5c1/p1p1p1p1p/45/9/P1P1P1P1P/1C5C1/9/RNBAKABNR',  # 连续数字
+    'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNX',  # 非法字符
+    'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBA1ABNR',  # 缺少红帅
+    'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBKKABNR',  # 两个红帅
+    'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/R8/RNBAKABNR',  # 三个红车
+    INITIAL_FEN + ' x',  # 走棋方
+    INITIAL_FEN + ' w - -',  # 字段数
+    INITIAL_FEN + ' w a - 0 1',
+    INITIAL_FEN + ' w - - -1 1',
+    INITIAL_FEN + ' w - - 0 0',
+    INITIAL_FEN + ' w - - 0 x',
+    INITIAL_FEN + ' w - - 65536 1',
+])
+def test_parse_fen_rejects(fen):
+    with pytest.raises(ValueError):
+        parse_fen(fen)
+
+
+def test_load_from_fen_keeps_game_on_error():
+    game = ChineseChess()
+    before = game.get_fen(counters=True)
+    with pytest.raises(ValueError):
+        game.load_from_fen(INITIAL_FEN.replace('K', 'A'))
+    assert game.get_fen(counters=True) == before
+
+
+def test_parse_fen_fields():
+    _, side, halfmove, fullmove = parse_fen(INITIAL_FEN)
+    assert (side, halfmove, fullmove) == ('r', 0, 1)
+    _, side, halfmove, fullmove = parse_fen(INITIAL_FEN + ' b - - 12 34')
+    assert (side, halfmove, fullmove) == ('b', 12, 34)
+    assert parse_fen(INITIAL_FEN + ' r')[1] == 'r'
+
+
+@pytest.mark.parametrize('index', range(len(POSITIONS)))
+def test_round_trip_with_counters(index):
+    game = POSITIONS[index]
+    fen = game.get_fen(counters=True)
+    loaded = ChineseChess()
+    loaded.load_from_fen(fen)
+    assert loaded.get_fen(counters=True) == fen
+    assert loaded.squares == game.squares
+    assert loaded.current_player == game.current_player
+    assert loaded.capture_clock == game.capture_clock
+    assert loaded.zobrist_key == game.zobrist_key
+
+
+def test_cached_board_fen_follows_moves():
+    game = ChineseChess()
+    fen = game.get_fen()
+    game.make_move(6, 4, 5, 4)
+    moved = game.get_fen()
+    assert moved != fen
+    assert parse_fen(moved)[0] == game.squares
+    game.undo_move()
+    assert game.get_fen() == fen
+
+
+@pytest.mark.parametrize('index', range(len(POSITIONS)))
+def test_encode_decode_position(index):
+    game = POSITIONS[index]
+    fen, moves = encode_position(game)
+    assert len(moves) == min(game.capture_clock, len(game.move_history))
+    decoded = decode_position(fen, moves)
+    assert decoded.get_fen(counters=True) == game.get_fen(counters=True)
+    assert decoded.zobrist_key == game.zobrist_key
+    assert decoded.get_repetition_count() == game.get_repetition_count()
+    assert decoded.repetition_verdict(min_count=2) == game.repetition_verdict(min_count=2)
+
+
+def test_decode_position_rejects_bad_moves():
+    fen, _ = encode_position(ChineseChess())
+    with pytest.raises(ValueError):
+        decode_position(fen, [0])
+
+
+def test_encode_position_keeps_repetition_history():
+    game = ChineseChess()
+    game.load_from_fen('4k4/9/9/9/9/3R5/9/9/9/5K3 w - - 0 1')
+    for move in [(5, 3, 5, 4), (0, 4, 0, 3), (5, 4, 5, 3), (0, 3, 0, 4)]:
+        game.make_move(*move)
+    decoded = decode_position(*encode_position(game))
+    assert decoded.get_repetition_count() == 2
+    assert decoded.repetition_verdict(min_count=2) == game.repetition_verdict(min_count=2) is not None
@@ -0,0 +1,56 @@
+"""
+走法生成：按棋子生成的走法与逐格暴力枚举的结果一致
+"""
+
+import pytest
+
+from conftest import random_positions
+from game import ChineseChess, COLOR_FLAGS, decode_move, encode_move
+
+POSITIONS = random_positions(seed=1, count=200)
+
+
+def brute_force_moves(game, color):
+    """
+    逐格调用 is_valid_move 枚举走法，再逐一走子检查己方是否被将军
+    :return: (全部走法, 不送将的走法)，均为 (from_row, from_col, to_row, to_col) 的集合
+    """
+    pseudo, legal = set(), set()
+    has_king = game.king_squares[COLOR_FLAGS[color]] is not None
+    for fr in range(10):
+        for fc in range(9):
+            piece = game.board[fr][fc]
+            if not piece or piece[0] != color:
+                continue
+            for tr in range(10):
+                for tc in range(9):
+                    if not game.is_valid_move(fr, fc, tr, tc):
+                        continue
+                    pseudo.add((fr, fc, tr, tc))
+                    if not has_king:
+                        continue
+                    game.push(encode_move(fr, fc, tr, tc))
+                    if not game.is_check(color):
+                        legal.add((fr, fc, tr, tc))
+                    game.pop()
+    return pseudo, legal
+
+
+@pytest.mark.parametrize('index', range(len(POSITIONS)))
+def test_generated_moves_match_brute_force(index):
+    game = POSITIONS[index]
+    before = game.get_fen(counters=True)
+    for color in ('r', 'b'):
+        pseudo, legal = brute_force_moves(game, color)
+        assert set(game.get_all_moves(color)) == pseudo
+        assert set(game.get_legal_moves(color)) == legal
+        assert all(game.is_legal_move(*move) for move in legal)
+        captures = {move for move in legal if game.board[move[2]][move[3]]}
+        assert {decode_move(move) for move in game.generate_legal_moves(color, captures_only=True)} == captures
+    assert game.get_fen(counters=True) == before
+
+
+def test_initial_position_move_count():
+    game = ChineseChess()
+    assert len(game.generate_legal_moves('r')) == 44
+    assert len(game.generate_legal_moves('b')) == 44
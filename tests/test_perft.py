@@ -0,0 +1,31 @@
+"""
+perft：参考局面在深度 ≤3 时的节点数与 PERFT_POSITIONS 中的参考值一致
+"""
+
+import pytest
+
+from perft import PERFT_POSITIONS, divide, load_position, perft, perft_detail
+
+MAX_DEPTH = 3
+
+
+@pytest.mark.parametrize('position', PERFT_POSITIONS, ids=[position['name'] for position in PERFT_POSITIONS])
+@pytest.mark.parametrize('depth', range(1, MAX_DEPTH + 1))
+def test_reference_node_counts(position, depth):
+    game = load_position(position['fen'], position['side'])
+    before = game.get_fen(counters=True)
+    assert perft(game, depth) == position['nodes'][depth]
+    assert game.get_fen(counters=True) == before
+
+
+def test_initial_position_reference_values():
+    # 公开的象棋 perft 结果
+    game = load_position()
+    assert [perft(game, depth) for depth in (1, 2, 3)] == [44, 1920, 79666]
+
+
+def test_detail_and_divide_agree_with_perft():
+    position = PERFT_POSITIONS[2]
+    game = load_position(position['fen'], position['side'])
+    assert perft_detail(game, 2)['nodes'] == position['nodes'][2]
+    assert sum(divide(game, 2).values()) == position['nodes'][2]
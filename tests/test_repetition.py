@@ -0,0 +1,108 @@
+"""
+循环裁决：长将、长捉判负，双方同等程度判和，吃子后重新计数
+"""
+
+from game import (
+    ChineseChess, END_PERPETUAL_CHASE, END_PERPETUAL_CHECK, END_REPETITION, REPETITION_LIMIT,
+)
+
+# 红车左右横移将军，黑将左右躲闪
+PERPETUAL_CHECK_FEN = '4k4/9/9/9/9/3R5/9/9/9/5K3 w'
+PERPETUAL_CHECK_CYCLE = [(5, 3, 5, 4), (0, 4, 0, 3), (5, 4, 5, 3), (0, 3, 0, 4)]
+
+# 红车与黑炮轮流挡将并（闪）将军：双方每步都是将军
+MUTUAL_CHECK_FEN = '9/3k5/9/9/9/4r4/4c4/4R4/9/3CK4 w'
+MUTUAL_CHECK_CYCLE = [(7, 4, 7, 3), (6, 4, 6, 3), (7, 3, 7, 4), (6, 3, 6, 4)]
+
+# 红车追捉无根的黑车，黑车左右躲闪
+ROOK_CHASE_FEN = '4k4/9/r8/9/9/1R7/9/9/9/3K5 w'
+ROOK_CHASE_CYCLE = [(5, 1, 5, 0), (2, 0, 2, 1), (5, 0, 5, 1), (2, 1, 2, 0)]
+
+# 红车追捉黑马，黑马在两处都有黑车保护
+HORSE_CHASE_CYCLE = [(7, 1, 7, 0), (2, 0, 4, 1), (7, 0, 7, 1), (4, 1, 2, 0)]
+PROTECTED_HORSE_FEN = 'rr2k4/9/n8/9/9/9/9/1R7/9/3K5 w'
+UNPROTECTED_HORSE_FEN = '4k4/9/n8/9/9/9/9/1R7/9/3K5 w'
+
+
+def play(fen, moves):
+    """
+    从 fen 开始依次走棋，对局结束即停止
+    :return: (对局, 已走步数)
+    """
+    game = ChineseChess()
+    game.load_from_fen(fen)
+    for count, move in enumerate(moves, 1):
+        success, message = game.make_move(*move)
+        assert success, (move, message)
+        if game.game_over:
+            return game, count
+    return game, len(moves)
+
+
+def repeat(cycle):
+    """重复循环 REPETITION_LIMIT 次（足够让起始局面出现 REPETITION_LIMIT 次）"""
+    return cycle * REPETITION_LIMIT
+
+
+def test_perpetual_check_loses():
+    game, plies = play(PERPETUAL_CHECK_FEN, repeat(PERPETUAL_CHECK_CYCLE))
+    assert plies == len(PERPETUAL_CHECK_CYCLE) * (REPETITION_LIMIT - 1)
+    assert game.game_over
+    assert (game.winner, game.end_reason) == ('b', END_PERPETUAL_CHECK)
+
+
+def test_search_verdict_after_one_cycle():
+    game, _ = play(PERPETUAL_CHECK_FEN, PERPETUAL_CHECK_CYCLE)
+    assert not game.game_over
+    assert game.repetition_verdict() is None
+    assert game.repetition_verdict(min_count=2) == ('b', END_PERPETUAL_CHECK)
+
+
+def test_mutual_check_draws():
+    game, _ = play(MUTUAL_CHECK_FEN, repeat(MUTUAL_CHECK_CYCLE))
+    assert game.game_over
+    assert (game.winner, game.end_reason) == ('draw', END_REPETITION)
+
+
+def test_chasing_unprotected_rook_loses():
+    game, _ = play(ROOK_CHASE_FEN, repeat(ROOK_CHASE_CYCLE))
+    assert game.game_over
+    assert (game.winner, game.end_reason) == ('b', END_PERPETUAL_CHASE)
+
+
+def test_chasing_protected_horse_is_allowed():
+    game, _ = play(PROTECTED_HORSE_FEN, repeat(HORSE_CHASE_CYCLE))
+    assert game.game_over
+    assert (game.winner, game.end_reason) == ('draw', END_REPETITION)
+
+
+def test_chasing_unprotected_horse_loses():
+    game, _ = play(UNPROTECTED_HORSE_FEN, repeat(HORSE_CHASE_CYCLE))
+    assert game.game_over
+    assert (game.winner, game.end_reason) == ('b', END_PERPETUAL_CHASE)
+
+
+def test_capture_resets_repetition_window():
+    # 长将局面之外加一匹红马和一个过河黑卒
+    game, _ = play('4k4/9/9/9/9/3R4p/9/7N1/9/5K3 w', PERPETUAL_CHECK_CYCLE)
+    assert game.get_repetition_count() == 2
+
+    # 马吃卒后回到原位：之前出现过的局面不再计数
+    for move in [(7, 7, 5, 8), (0, 4, 0, 3)]:
+        assert game.make_move(*move)[0]
+    assert game.capture_clock == 1
+    assert game.get_repetition_count() == 1
+    for move in [(5, 8, 7, 7), (0, 3, 0, 4)]:
+        assert game.make_move(*move)[0]
+    assert game.get_repetition_count() == 1
+
+    # 吃子之后重新出现 REPETITION_LIMIT 次才裁决，区间内红方每步都将军
+    for move in PERPETUAL_CHECK_CYCLE:
+        assert game.make_move(*move)[0]
+        assert not game.game_over
+    for move in PERPETUAL_CHECK_CYCLE[:2]:
+        assert game.make_move(*move)[0]
+        assert not game.game_over
+    assert game.make_move(*PERPETUAL_CHECK_CYCLE[2])[0]
+    assert game.game_over
+    assert (game.winner, game.end_reason) == ('b', END_PERPETUAL_CHECK)